@@ -7,6 +7,7 @@ Usage:
 
 API Endpoints:
     POST /api/infer - Standard inference with complete audio
+    POST /api/infer_multi - Inference of complete audio in several styles
     POST /api/infer_stream_init - Initialize streaming session
     POST /api/infer_stream_chunk - Process audio chunk in streaming mode
     GET /api/health - Health check
@@ -14,17 +15,19 @@ API Endpoints:
 
 from contextlib import asynccontextmanager
 import os
+import json
 import uuid
 import time
-import tempfile
+import queue
+import asyncio
 from pathlib import Path
 from typing import Optional, Dict, Any
 
 import numpy as np
 import librosa
 import torch
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
@@ -34,7 +37,13 @@ from engines.defaults import (
     default_setup,
 )
 from engines.infer import INFER
-from models.utils import export_blendshape_animation, ARKitBlendShape
+from engines.batching import StreamingBatchScheduler
+from engines.executor import BoundedExecutor, ExecutorOverloaded
+from models.utils import export_blendshape_animation, ARKitBlendShape, DEFAULT_CONTEXT
+from models.postprocess import PostProcessPipeline
+from utils.audio import load_audio, PCM_FORMATS
+from utils.blendshape_codec import encode_blendshapes, DTYPES as BLENDSHAPE_DTYPES, MEDIA_TYPE as BLENDSHAPE_MEDIA_TYPE
+from utils.result_cache import ResultCache, content_key, module_digest
 
 # ============= Data Models =============
 class InferRequest(BaseModel):
@@ -46,13 +55,20 @@ class InferRequest(BaseModel):
 
 class StreamInitRequest(BaseModel):
     id_idx: Optional[int] = 0
+    names_once: Optional[bool] = False
+    postprocess: Optional[Dict[str, Any]] = None
+    seed: Optional[int] = None
 
 
 class HealthResponse(BaseModel):
     status: str
     model_loaded: bool
     gpu_available: bool
+    device: Optional[str] = None
     sessions: int
+    batching: Optional[Dict[str, Any]] = None
+    executor: Optional[Dict[str, Any]] = None
+    result_cache: Optional[Dict[str, Any]] = None
 
 # ============= Startup & Shutdown =============
 @asynccontextmanager
@@ -64,13 +80,15 @@ async def lifespan(app: FastAPI):
         "configs/lam_audio2exp_config_streaming.py"
     )
     weight_path = os.getenv("WEIGHT_PATH", None)
+    device = os.getenv("DEVICE", None)
+    exported_model = os.getenv("EXPORTED_MODEL", None)
     
     print("=" * 60)
     print("Starting LAM-A2E API Server...")
     print("=" * 60)
     
     try:
-        initialize_model(config_file, weight_path)
+        initialize_model(config_file, weight_path, device, exported_model)
         print("✓ Server ready to accept requests")
     except Exception as e:
         print(f"✗ Failed to initialize model: {e}")
@@ -80,6 +98,10 @@ async def lifespan(app: FastAPI):
     
     # ===== Shutdown =====
     print("Shutting down LAM-A2E API Server...")
+    if batch_scheduler is not None:
+        batch_scheduler.stop()
+    if inference_executor is not None:
+        inference_executor.shutdown()
     streaming_sessions.clear()
 
 # ============= Global State =============
@@ -97,14 +119,25 @@ app.add_middleware(
 model_instance = None
 config = None
 
+# Batches streaming chunks of different sessions into one forward pass
+batch_scheduler: Optional[StreamingBatchScheduler] = None
+
+# Runs decoding, inference and post-processing off the event loop
+inference_executor: Optional[BoundedExecutor] = None
+
+# Raw /api/infer expressions keyed by audio content, before the seeded post-processing
+result_cache: Optional[ResultCache] = None
+model_digest: Optional[str] = None
+
 # Session management for streaming
 streaming_sessions: Dict[str, Dict[str, Any]] = {}
 
 
 # ============= Initialization =============
-def initialize_model(config_file: str, weight_path: Optional[str] = None):
+def initialize_model(config_file: str, weight_path: Optional[str] = None, device: Optional[str] = None,
+                     exported_model: Optional[str] = None):
     """Initialize the inference model at startup"""
-    global model_instance, config
+    global model_instance, config, batch_scheduler, inference_executor, result_cache, model_digest
     
     args = default_argument_parser().parse_args([
         '--config-file', config_file
@@ -114,36 +147,134 @@ def initialize_model(config_file: str, weight_path: Optional[str] = None):
     
     if weight_path:
         config.weight = weight_path
+    if device:
+        config.device = device
+    if exported_model:
+        # graphs written by engines/export.py instead of the Python model
+        config.exported_model = exported_model
+        config.infer.type = "Audio2ExpressionExportedInfer"
     
     config = default_setup(config)
     
     # Build model
     model_instance = INFER.build(dict(type=config.infer.type, cfg=config))
     model_instance.model.eval()
+
+    serving = config.get("serving", {})
+    batch_scheduler = StreamingBatchScheduler(
+        model_instance,
+        max_batch_size=serving.get("max_batch_size", 1),
+        max_queue_delay_ms=serving.get("max_queue_delay_ms", 0),
+        max_pending=serving.get("max_queue_depth", 0),
+    ).start()
+    inference_executor = BoundedExecutor(
+        max_workers=serving.get("max_workers", 4),
+        max_queue_depth=serving.get("max_queue_depth", 32),
+        timeout=serving.get("request_timeout", None),
+    )
+    
+    cache_cfg = serving.get("result_cache", None)
+    if cache_cfg:
+        result_cache = ResultCache(
+            max_bytes=cache_cfg.get("max_bytes", 256 * 2 ** 20),
+            disk_dir=cache_cfg.get("disk_dir", None),
+        )
+        model_digest = module_digest(model_instance.model)
+    
+    # Load the vocal separator once instead of on the first ex_vol request
+    if serving.get("preload_separator", False):
+        try:
+            model_instance.separator.load()
+            print(f"✓ Vocal separator loaded: {type(model_instance.separator).__name__}")
+        except Exception as e:
+            print(f"⚠ Vocal separator unavailable, ex_vol requests keep the original audio: {e}")
     
-    print(f"✓ Model loaded from: {config.weight}")
+    print(f"✓ Model loaded from: {config.get('exported_model') or config.weight}")
+    print(f"✓ Running on device: {model_instance.device}")
     print(f"✓ Model ready for inference")
 
 
 # ============= Helper Functions =============
-def save_uploaded_audio(upload_file: UploadFile) -> str:
-    """Save uploaded audio to temporary file"""
-    suffix = Path(upload_file.filename).suffix
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        content = upload_file.file.read()
-        tmp.write(content)
-        return tmp.name
-
+def load_and_validate_audio(
+    content: bytes,
+    filename: Optional[str] = None,
+    audio_format: Optional[str] = None,
+    sample_rate: Optional[int] = None
+) -> tuple:
+    """Decode uploaded audio in memory and validate format
 
-def load_and_validate_audio(file_path: str) -> tuple:
-    """Load audio and validate format"""
+    audio_format "s16le" / "f32le" marks the payload as raw little-endian PCM
+    recorded at sample_rate; otherwise it is decoded as an audio file.
+    """
     try:
-        audio, sr = librosa.load(file_path, sr=16000)
-        return audio, sr
+        return load_audio(
+            content,
+            target_sr=16000,
+            pcm_format=audio_format,
+            sample_rate=sample_rate,
+            filename=filename
+        )
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid audio file: {str(e)}")
 
 
+def resolve_postprocess(options, pipeline: PostProcessPipeline) -> Optional[PostProcessPipeline]:
+    """Apply per-request post-processing overrides (a dict or JSON object string) to pipeline
+
+    e.g. {"stages": ["savgol", "symmetrize"], "symmetrize": "max", "savgol_window": 7};
+    returns None without overrides so the engine default is used.
+    """
+    if not options:
+        return None
+    try:
+        if isinstance(options, str):
+            options = json.loads(options)
+        if not isinstance(options, dict):
+            raise ValueError("expected a JSON object")
+        return pipeline.configure(**options)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid postprocess options: {str(e)}")
+
+
+def validate_id_idx(id_idx: int) -> int:
+    """Reject identity indices outside the model's style table with 400"""
+    num_identities = model_instance.cfg.model.backbone.num_identity_classes
+    if not 0 <= id_idx < num_identities:
+        raise HTTPException(status_code=400, detail=f"Invalid id_idx {id_idx}, expected 0-{num_identities - 1}")
+    return id_idx
+
+
+def validate_sample_rate(sample_rate) -> int:
+    """Reject raw PCM sample rates that are not positive integers with 400"""
+    try:
+        rate = int(str(sample_rate).strip())
+    except ValueError:
+        rate = 0
+    if rate <= 0:
+        raise HTTPException(status_code=400, detail=f"Invalid sample_rate {sample_rate}, expected a positive integer")
+    return rate
+
+
+def parse_id_indices(value: str) -> list:
+    """Identity indices of /api/infer_multi, a JSON list or comma separated ("0,5,11")"""
+    try:
+        value = value.strip()
+        id_indices = json.loads(value) if value.startswith("[") else [int(v) for v in value.split(",")]
+        # JSON booleans are ints to isinstance
+        if not id_indices or not all(type(i) is int for i in id_indices):
+            raise ValueError("expected a non-empty list of integers")
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid id_indices: {str(e)}")
+    return [validate_id_idx(id_idx) for id_idx in id_indices]
+
+
+def new_session_context(seed: Optional[int] = None) -> dict:
+    """Fresh streaming context; with a seed the random blinks of the session are reproducible"""
+    context = DEFAULT_CONTEXT.copy()
+    context["postprocess_state"] = {"rng": np.random.default_rng(seed)}
+    return context
+
+
 def blendshapes_to_json(blendshapes: np.ndarray, fps: float = 30.0) -> dict:
     """Convert blendshape array to JSON format"""
     return {
@@ -155,15 +286,49 @@ def blendshapes_to_json(blendshapes: np.ndarray, fps: float = 30.0) -> dict:
         },
         "frames": [
             {
-                "weights": blendshapes[i].tolist(),
+                "weights": weights,
                 "time": i / fps,
                 "rotation": []
             }
-            for i in range(len(blendshapes))
+            for i, weights in enumerate(np.asarray(blendshapes).tolist())
         ]
     }
 
 
+def negotiate_response_format(response_format: Optional[str], accept: Optional[str]) -> str:
+    """Pick "json" or a binary blendshape dtype ("f32", "f16", "u8")
+
+    An explicit response_format wins; otherwise an Accept header of
+    "application/x-blendshape" (optionally with "; dtype=f16|u8") selects the binary format.
+    """
+    if response_format:
+        if response_format != "json" and response_format not in BLENDSHAPE_DTYPES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported response_format: {response_format}, expected json, f32, f16 or u8"
+            )
+        return response_format
+    for media_range in (accept or "").split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        if media_type == BLENDSHAPE_MEDIA_TYPE:
+            params = dict(param.split("=", 1) for param in params if "=" in param)
+            return params.get("dtype", "f32") if params.get("dtype", "f32") in BLENDSHAPE_DTYPES else "f32"
+    return "json"
+
+
+def blendshapes_to_binary_response(payload: bytes, response_format: str, metadata: dict) -> Response:
+    """Wrap an encoded blendshape payload, scalar metadata goes into X- headers"""
+    headers = {
+        "X-" + "-".join(word.capitalize() for word in key.split("_")): str(value)
+        for key, value in metadata.items()
+    }
+    return Response(
+        content=payload,
+        media_type=f"{BLENDSHAPE_MEDIA_TYPE}; dtype={response_format}",
+        headers=headers
+    )
+
+
 # ============= API Endpoints =============
 @app.get("/")
 async def root():
@@ -173,6 +338,7 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "infer": "/api/infer",
+            "infer_multi": "/api/infer_multi",
             "stream_init": "/api/infer_stream_init",
             "stream_chunk": "/api/infer_stream_chunk",
             "health": "/api/health"
@@ -187,109 +353,330 @@ async def health_check():
         status="healthy" if model_instance else "not_ready",
         model_loaded=model_instance is not None,
         gpu_available=torch.cuda.is_available(),
-        sessions=len(streaming_sessions)
+        device=str(model_instance.device) if model_instance else None,
+        sessions=len(streaming_sessions),
+        batching=batch_scheduler.stats() if batch_scheduler else None,
+        executor=inference_executor.stats() if inference_executor else None,
+        result_cache=result_cache.stats() if result_cache else None
     )
 
 
+async def run_in_executor(fn, *args):
+    """Run blocking work on the inference executor, mapping overload to 429 and timeouts to 503"""
+    try:
+        return await inference_executor.run(fn, *args)
+    except ExecutorOverloaded as e:
+        raise HTTPException(status_code=429, detail=f"Server overloaded: {str(e)}")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Request timed out")
+
+
 @app.post("/api/infer")
 async def infer(
     audio_file: UploadFile = File(...),
     id_idx: int = Form(0),
     ex_vol: bool = Form(False),
     movement_smooth: bool = Form(False),
-    brow_movement: bool = Form(False)
+    brow_movement: bool = Form(False),
+    audio_format: Optional[str] = Form(None),
+    sample_rate: Optional[int] = Form(None),
+    response_format: Optional[str] = Form(None),
+    postprocess: Optional[str] = Form(None),
+    seed: Optional[int] = Form(None),
+    accept: Optional[str] = Header(None)
 ):
     """
     Standard inference endpoint for complete audio file
     
     Args:
-        audio_file: Audio file (WAV, MP3, etc.)
+        audio_file: Audio file (WAV, MP3, etc.) or raw PCM
         id_idx: Identity index for style control (0-11 for streaming model)
         ex_vol: Extract vocal track (slower but better for music)
         movement_smooth: Apply mouth movement smoothing
         brow_movement: Add random brow movements
+        audio_format: "s16le" / "f32le" when audio_file is raw little-endian PCM
+        sample_rate: Sample rate of raw PCM audio
+        response_format: "json" (default), or binary "f32" / "f16" / "u8";
+            can also be negotiated with "Accept: application/x-blendshape; dtype=..."
+        postprocess: JSON object overriding post-processing options
+            (stages, savgol_window, savgol_polyorder, symmetrize, blink, ...)
+        seed: Seed of the random blinks and brow movements, same seed and input give same output
     
     Returns:
-        JSON with blendshape animation data
+        JSON or binary payload with blendshape animation data
     """
     if model_instance is None:
         raise HTTPException(status_code=503, detail="Model not initialized")
     
-    temp_audio_path = None
-    temp_vocal_path = None
+    validate_id_idx(id_idx)
+    response_format = negotiate_response_format(response_format, accept)
+    pipeline = resolve_postprocess(postprocess, model_instance.offline_postprocess)
     
     try:
-        start_time = time.time()
-        
-        # Save uploaded file
-        temp_audio_path = save_uploaded_audio(audio_file)
-        
-        # Load and validate audio
-        audio, sr = load_and_validate_audio(temp_audio_path)
-        
-        # Extract vocals if requested
-        if ex_vol:
-            vocal_path = model_instance.extract_vocal_track(temp_audio_path)
-            if os.path.exists(vocal_path):
-                temp_vocal_path = vocal_path
-                audio, sr = librosa.load(vocal_path, sr=16000)
-        
-        # Prepare input
-        input_dict = {
-            'id_idx': torch.nn.functional.one_hot(
-                torch.tensor(id_idx),
-                config.model.backbone.num_identity_classes
-            ).cuda(non_blocking=True)[None, ...],
-            'input_audio_array': torch.FloatTensor(audio).cuda(non_blocking=True)[None, ...]
-        }
-        
-        # Run inference
-        with torch.no_grad():
-            output_dict = model_instance.model(input_dict)
-        
-        # Get output expression
-        out_exp = output_dict['pred_exp'].squeeze().cpu().numpy()
-        
-        # Calculate volume for post-processing
-        frame_length = int(len(audio) / sr * 30)
-        volume = librosa.feature.rms(
-            y=audio,
-            frame_length=int(1 / 30 * sr),
-            hop_length=int(1 / 30 * sr)
-        )[0]
-        if len(volume) > frame_length:
-            volume = volume[:frame_length]
-        
-        # Apply post-processing
-        if movement_smooth:
-            from models.utils import smooth_mouth_movements
-            out_exp = smooth_mouth_movements(out_exp, 0, volume)
-        
-        if brow_movement:
-            from models.utils import apply_random_brow_movement
-            out_exp = apply_random_brow_movement(out_exp, volume)
-        
-        # Standard post-processing
-        pred_exp = model_instance.blendshape_postprocess(out_exp)
-        
-        # Convert to JSON
-        result = blendshapes_to_json(pred_exp, fps=30.0)
-        
-        inference_time = time.time() - start_time
-        result["metadata"]["inference_time"] = inference_time
-        
+        content = await audio_file.read()
+        result = await run_in_executor(
+            run_standard_inference,
+            content,
+            audio_file.filename,
+            id_idx,
+            ex_vol,
+            movement_smooth,
+            brow_movement,
+            audio_format,
+            sample_rate,
+            response_format,
+            pipeline,
+            seed
+        )
+        if response_format != "json":
+            payload, metadata = result
+            return blendshapes_to_binary_response(payload, response_format, metadata)
         return JSONResponse(content=result)
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Inference failed: {str(e)}")
+
+
+def predict_expressions(
+    audio: np.ndarray,
+    sr: int,
+    id_indices: list,
+    ex_vol: bool
+) -> tuple:
+    """Vocal separation and inference of decoded audio, the deterministic part of /api/infer
+
+    Returns (one raw expression per identity, volume, separated): separated is False when
+    ex_vol was requested but the separator failed and the original audio was used instead.
+    """
+    # Extract vocals if requested, in memory with the preloaded separator
+    separated = True
+    if ex_vol:
+        try:
+            audio = model_instance.extract_vocals(audio, sr, fallback=False)
+        except Exception:
+            separated = False
     
-    finally:
-        # Cleanup temporary files
-        if temp_audio_path and os.path.exists(temp_audio_path):
-            os.remove(temp_audio_path)
-        if temp_vocal_path and os.path.exists(temp_vocal_path):
-            import shutil
-            shutil.rmtree(os.path.dirname(temp_vocal_path), ignore_errors=True)
+    # Run inference, long clips in overlapping segments, one encoder pass for all identities
+    out_exps = model_instance.predict_expressions(audio, id_indices)
+    
+    # Calculate volume for post-processing
+    frame_length = int(len(audio) / sr * 30)
+    volume = librosa.feature.rms(
+        y=audio,
+        frame_length=int(1 / 30 * sr),
+        hop_length=int(1 / 30 * sr)
+    )[0]
+    if len(volume) > frame_length:
+        volume = volume[:frame_length]
+    return list(out_exps), volume, separated
+
+
+def postprocess_expressions(
+    out_exps: list,
+    volume: np.ndarray,
+    movement_smooth: bool,
+    brow_movement: bool,
+    postprocess: Optional[PostProcessPipeline] = None,
+    seed: Optional[int] = None
+) -> list:
+    """Post-processing of raw expressions, mouth smoothing and brow movement included when requested
+
+    Every identity draws the blinks and brows of a single-identity request with the same seed.
+    """
+    return [
+        model_instance.blendshape_postprocess(
+            # cached expressions are read-only, the pipeline works in place
+            np.array(out_exp, dtype=np.float32),
+            volume=volume,
+            movement_smooth=movement_smooth,
+            brow_movement=brow_movement,
+            postprocess=postprocess,
+            rng=np.random.default_rng(seed)
+        )
+        for out_exp in out_exps
+    ]
+
+
+def cached_blendshapes(
+    audio: np.ndarray,
+    sr: int,
+    id_indices: list,
+    ex_vol: bool,
+    movement_smooth: bool,
+    brow_movement: bool,
+    postprocess: Optional[PostProcessPipeline] = None,
+    seed: Optional[int] = None
+) -> tuple:
+    """Inference through the result cache, then post-processing
+
+    Returns (blendshapes, cached): cached flags per identity, None without a result cache.
+    The cache holds the raw expressions and the volume track, which do not depend on the
+    seed or the post-processing options; a hit only re-runs post-processing, so repeated
+    unseeded requests hit too and still get fresh random blinks and brows. Results computed
+    on the original audio after a failed vocal separation are not stored.
+    """
+    if result_cache is None:
+        out_exps, volume, _ = predict_expressions(audio, sr, id_indices, ex_vol)
+        return postprocess_expressions(out_exps, volume, movement_smooth, brow_movement, postprocess, seed), None
+    
+    cfg = model_instance.cfg
+    params = dict(
+        model=model_digest,
+        ex_vol=ex_vol,
+        # windowing, encoder cache and separator settings change the result too
+        segment=cfg.get("segment", None),
+        feature_cache=cfg.get("feature_cache", None),
+        separator=cfg.get("separator", None) if ex_vol else None
+    )
+    volume_key = content_key(audio, output="volume", **params)
+    keys = [content_key(audio, output="expression", id_idx=id_idx, **params) for id_idx in id_indices]
+    out_exps = [result_cache.get(key) for key in keys]
+    volume = result_cache.get(volume_key)
+    missing = [i for i, out_exp in enumerate(out_exps) if out_exp is None or volume is None]
+    if missing:
+        predicted, volume, separated = predict_expressions(audio, sr, [id_indices[i] for i in missing], ex_vol)
+        if separated:
+            volume = result_cache.put(volume_key, volume)
+        for i, out_exp in zip(missing, predicted):
+            out_exps[i] = result_cache.put(keys[i], out_exp) if separated else out_exp
+    preds = postprocess_expressions(out_exps, volume, movement_smooth, brow_movement, postprocess, seed)
+    return preds, [i not in missing for i in range(len(keys))]
+
+
+def run_standard_inference(
+    content: bytes,
+    filename: str,
+    id_idx: int,
+    ex_vol: bool,
+    movement_smooth: bool,
+    brow_movement: bool,
+    audio_format: Optional[str] = None,
+    sample_rate: Optional[int] = None,
+    response_format: str = "json",
+    postprocess: Optional[PostProcessPipeline] = None,
+    seed: Optional[int] = None
+):
+    """Blocking part of /api/infer, executed on the inference executor
+
+    Returns the JSON dict, or (payload, metadata) for binary response formats.
+    """
+    start_time = time.time()
+    
+    # Decode and validate audio
+    audio, sr = load_and_validate_audio(content, filename, audio_format, sample_rate)
+    
+    (pred_exp,), cached = cached_blendshapes(audio, sr, [id_idx], ex_vol, movement_smooth, brow_movement,
+                                             postprocess, seed)
+    
+    if response_format != "json":
+        payload = encode_blendshapes(pred_exp, dtype=response_format, fps=30.0)
+        metadata = {"frame_count": len(pred_exp), "inference_time": time.time() - start_time}
+        if cached is not None:
+            metadata["cached"] = cached[0]
+        if seed is not None:
+            metadata["seed"] = seed
+        return payload, metadata
+    
+    # Convert to JSON
+    result = blendshapes_to_json(pred_exp, fps=30.0)
+    
+    inference_time = time.time() - start_time
+    result["metadata"]["inference_time"] = inference_time
+    if cached is not None:
+        result["metadata"]["cached"] = cached[0]
+    if seed is not None:
+        result["metadata"]["seed"] = seed
+    
+    return result
+
+
+@app.post("/api/infer_multi")
+async def infer_multi(
+    audio_file: UploadFile = File(...),
+    id_indices: str = Form(...),
+    ex_vol: bool = Form(False),
+    movement_smooth: bool = Form(False),
+    brow_movement: bool = Form(False),
+    audio_format: Optional[str] = Form(None),
+    sample_rate: Optional[int] = Form(None),
+    postprocess: Optional[str] = Form(None),
+    seed: Optional[int] = Form(None)
+):
+    """
+    Inference of one audio file in several styles
+    
+    The audio encoder runs once, only the identity-dependent decoder runs per style.
+    
+    Args:
+        id_indices: Identity indices, JSON list or comma separated, e.g. "0,5,11"
+        (other fields as in /api/infer)
+    
+    Returns:
+        JSON with the shared names and metadata, and the frames of each style under "styles"
+    """
+    if model_instance is None:
+        raise HTTPException(status_code=503, detail="Model not initialized")
+    
+    id_indices = parse_id_indices(id_indices)
+    pipeline = resolve_postprocess(postprocess, model_instance.offline_postprocess)
+    
+    try:
+        content = await audio_file.read()
+        result = await run_in_executor(
+            run_multi_inference,
+            content,
+            audio_file.filename,
+            id_indices,
+            ex_vol,
+            movement_smooth,
+            brow_movement,
+            audio_format,
+            sample_rate,
+            pipeline,
+            seed
+        )
+        return JSONResponse(content=result)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Inference failed: {str(e)}")
+
+
+def run_multi_inference(
+    content: bytes,
+    filename: str,
+    id_indices: list,
+    ex_vol: bool,
+    movement_smooth: bool,
+    brow_movement: bool,
+    audio_format: Optional[str] = None,
+    sample_rate: Optional[int] = None,
+    postprocess: Optional[PostProcessPipeline] = None,
+    seed: Optional[int] = None
+) -> dict:
+    """Blocking part of /api/infer_multi, executed on the inference executor"""
+    start_time = time.time()
+    
+    audio, sr = load_and_validate_audio(content, filename, audio_format, sample_rate)
+    pred_exps, cached = cached_blendshapes(audio, sr, id_indices, ex_vol, movement_smooth, brow_movement,
+                                           postprocess, seed)
+    
+    result = blendshapes_to_json(pred_exps[0], fps=30.0)
+    del result["frames"]
+    result["metadata"]["inference_time"] = time.time() - start_time
+    if seed is not None:
+        result["metadata"]["seed"] = seed
+    result["styles"] = []
+    for i, (id_idx, pred_exp) in enumerate(zip(id_indices, pred_exps)):
+        style = {"id_idx": id_idx, "frames": blendshapes_to_json(pred_exp, fps=30.0)["frames"]}
+        if cached is not None:
+            style["cached"] = cached[i]
+        result["styles"].append(style)
+    
+    return result
 
 
 @app.post("/api/infer_stream_init")
@@ -299,6 +686,9 @@ async def infer_stream_init(request: StreamInitRequest):
     
     Args:
         id_idx: Identity index for style control
+        names_once: Only include blendshape names in the first JSON chunk
+        postprocess: Post-processing overrides for all chunks of the session
+        seed: Seed of the session's random blinks, for reproducible output
     
     Returns:
         session_id for subsequent chunk processing
@@ -306,19 +696,18 @@ async def infer_stream_init(request: StreamInitRequest):
     if model_instance is None:
         raise HTTPException(status_code=503, detail="Model not initialized")
     
+    validate_id_idx(request.id_idx)
+    pipeline = resolve_postprocess(request.postprocess, model_instance.postprocess)
     session_id = str(uuid.uuid4())
     
     streaming_sessions[session_id] = {
         "id_idx": request.id_idx,
-        "context": {
-            'is_initial_input': True,
-            'previous_audio': None,
-            'previous_expression': None,
-            'previous_volume': None,
-            'previous_headpose': None,
-        },
+        "context": new_session_context(request.seed),
         "created_at": time.time(),
-        "chunk_count": 0
+        "chunk_count": 0,
+        "frame_offset": 0,
+        "names_once": bool(request.names_once),
+        "postprocess": pipeline
     }
     
     return {
@@ -331,7 +720,11 @@ async def infer_stream_init(request: StreamInitRequest):
 @app.post("/api/infer_stream_chunk")
 async def infer_stream_chunk(
     session_id: str = Form(...),
-    audio_chunk: UploadFile = File(...)
+    audio_chunk: UploadFile = File(...),
+    audio_format: Optional[str] = Form(None),
+    sample_rate: Optional[int] = Form(None),
+    response_format: Optional[str] = Form(None),
+    accept: Optional[str] = Header(None)
 ):
     """
     Process audio chunk in streaming mode
@@ -339,10 +732,54 @@ async def infer_stream_chunk(
     Args:
         session_id: Session ID from init endpoint
         audio_chunk: Audio chunk (approximately 1 second, 16kHz)
+        audio_format: "s16le" / "f32le" when audio_chunk is raw little-endian PCM
+        sample_rate: Sample rate of raw PCM audio
+        response_format: "json" (default), or binary "f32" / "f16" / "u8"
     
     Returns:
         Blendshape data for this chunk
     """
+    response_format = negotiate_response_format(response_format, accept)
+    content = await audio_chunk.read()
+    return await process_stream_chunk(
+        session_id, content, audio_chunk.filename, audio_format, sample_rate, response_format
+    )
+
+
+@app.post("/api/infer_stream_chunk/{session_id}")
+async def infer_stream_chunk_raw(
+    session_id: str,
+    request: Request,
+    x_audio_format: str = Header("s16le"),
+    x_sample_rate: int = Header(16000),
+    x_response_format: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None)
+):
+    """
+    Process a raw PCM audio chunk sent as the request body
+    
+    Args:
+        session_id: Session ID from init endpoint
+        X-Audio-Format header: "s16le" (default) or "f32le"
+        X-Sample-Rate header: Sample rate of the PCM data (default 16000)
+        X-Response-Format header / Accept: response format, as for /api/infer_stream_chunk
+    
+    Returns:
+        Blendshape data for this chunk
+    """
+    response_format = negotiate_response_format(x_response_format, accept)
+    content = await request.body()
+    return await process_stream_chunk(session_id, content, None, x_audio_format, x_sample_rate, response_format)
+
+
+async def process_stream_chunk(
+    session_id: str,
+    content: bytes,
+    filename: Optional[str],
+    audio_format: Optional[str],
+    sample_rate: Optional[int],
+    response_format: str = "json"
+):
     if model_instance is None:
         raise HTTPException(status_code=503, detail="Model not initialized")
     
@@ -350,66 +787,37 @@ async def infer_stream_chunk(
         raise HTTPException(status_code=404, detail="Session not found")
     
     session = streaming_sessions[session_id]
-    temp_chunk_path = None
     
     try:
         start_time = time.time()
         
-        # Save and load audio chunk
-        temp_chunk_path = save_uploaded_audio(audio_chunk)
-        audio, sr = load_and_validate_audio(temp_chunk_path)
-        
-        # Validate and limit audio chunk length
-        # max_frame_length=64 corresponds to ~2.13 seconds at 16kHz
-        # We limit to 2 seconds (32000 samples at 16kHz) to be safe
-        max_audio_samples = int(sr * 2.0)  # 2 seconds max
-        if len(audio) > max_audio_samples:
-            audio = audio[:max_audio_samples]
-        
-        # Ensure minimum audio length (at least 0.1 seconds)
-        min_audio_samples = int(sr * 0.1)
-        if len(audio) < min_audio_samples:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Audio chunk too short: {len(audio)} samples, minimum {min_audio_samples} samples required"
-            )
-        
-        # Run streaming inference
-        output, context = model_instance.infer_streaming_audio(
-            audio=audio,
-            ssr=float(sr),
-            context=session["context"]
+        expression, audio_length, chunk_start = await run_stream_chunk(
+            session, content, filename, audio_format, sample_rate
         )
         
-        # Check if inference was successful
-        if output is None or output.get("code") != 0:
-            error_code = output.get('code') if output else 'None'
-            raise HTTPException(
-                status_code=500, 
-                detail=f"Inference failed with code: {error_code}"
-            )
-        
-        # Validate output
-        if output.get("expression") is None:
-            raise HTTPException(
-                status_code=500,
-                detail="Inference returned no expression data"
+        if response_format != "json":
+            payload = encode_blendshapes(
+                expression,
+                dtype=response_format,
+                fps=30.0,
+                start_time=chunk_start,
+                chunk_index=session["chunk_count"]
             )
-        
-        # Update session context
-        session["context"] = context
-        session["chunk_count"] += 1
+            return blendshapes_to_binary_response(payload, response_format, {
+                "session_id": session_id,
+                "inference_time": time.time() - start_time,
+                "audio_length": audio_length
+            })
         
         # Convert to JSON
-        result = blendshapes_to_json(output["expression"], fps=30.0)
+        result = blendshapes_to_json(expression, fps=30.0)
+        if session.get("names_once") and session["chunk_count"] > 1:
+            del result["names"]
         result["metadata"]["session_id"] = session_id
         result["metadata"]["chunk_index"] = session["chunk_count"]
+        result["metadata"]["start_time"] = chunk_start
         result["metadata"]["inference_time"] = time.time() - start_time
-        result["metadata"]["audio_length"] = len(audio) / sr
-        
-        return JSONResponse(content=result)
-        result["metadata"]["chunk_index"] = session["chunk_count"]
-        result["metadata"]["inference_time"] = time.time() - start_time
+        result["metadata"]["audio_length"] = audio_length
         
         return JSONResponse(content=result)
     
@@ -419,10 +827,80 @@ async def infer_stream_chunk(
         import traceback
         error_detail = f"Streaming inference failed: {str(e)}\n{traceback.format_exc()}"
         raise HTTPException(status_code=500, detail=error_detail)
+
+
+async def run_stream_chunk(
+    session: dict,
+    content: bytes,
+    filename: Optional[str],
+    audio_format: Optional[str],
+    sample_rate: Optional[int]
+) -> tuple:
+    """Decode one chunk of a streaming session and run it through the batch scheduler
+
+    Returns the (N, 52) expression of the chunk, the chunk length in seconds and
+    the stream time of its first frame.
+    """
+    # Decode the chunk off the event loop
+    audio, sr = await run_in_executor(decode_stream_chunk, content, filename, audio_format, sample_rate)
     
-    finally:
-        if temp_chunk_path and os.path.exists(temp_chunk_path):
-            os.remove(temp_chunk_path)
+    # Run streaming inference, batched with chunks of other sessions;
+    # the scheduler stores the updated context back into the session
+    try:
+        output, context = await asyncio.wait_for(
+            asyncio.wrap_future(batch_scheduler.submit(session, audio, float(sr))),
+            inference_executor.timeout
+        )
+    except queue.Full:
+        raise HTTPException(status_code=429, detail="Server overloaded: too many pending streaming chunks")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Streaming inference timed out")
+    
+    # Check if inference was successful
+    if output is None or output.get("code") != 0:
+        error_code = output.get('code') if output else 'None'
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Inference failed with code: {error_code}"
+        )
+    
+    # Validate output
+    if output.get("expression") is None:
+        raise HTTPException(
+            status_code=500,
+            detail="Inference returned no expression data"
+        )
+    
+    session["chunk_count"] += 1
+    chunk_start = session.get("frame_offset", 0) / 30.0
+    session["frame_offset"] = session.get("frame_offset", 0) + len(output["expression"])
+    return output["expression"], len(audio) / sr, chunk_start
+
+
+def decode_stream_chunk(
+    content: bytes,
+    filename: Optional[str],
+    audio_format: Optional[str] = None,
+    sample_rate: Optional[int] = None
+) -> tuple:
+    """Decode and validate one streaming chunk, executed on the inference executor"""
+    audio, sr = load_and_validate_audio(content, filename, audio_format, sample_rate)
+    
+    # Validate and limit audio chunk length
+    # max_frame_length=64 corresponds to ~2.13 seconds at 16kHz
+    # We limit to 2 seconds (32000 samples at 16kHz) to be safe
+    max_audio_samples = int(sr * 2.0)  # 2 seconds max
+    if len(audio) > max_audio_samples:
+        audio = audio[:max_audio_samples]
+    
+    # Ensure minimum audio length (at least 0.1 seconds)
+    min_audio_samples = int(sr * 0.1)
+    if len(audio) < min_audio_samples:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Audio chunk too short: {len(audio)} samples, minimum {min_audio_samples} samples required"
+        )
+    return audio, sr
 
 
 @app.delete("/api/infer_stream_close/{session_id}")
@@ -434,6 +912,133 @@ async def infer_stream_close(session_id: str):
     else:
         raise HTTPException(status_code=404, detail="Session not found")
 
+
+@app.websocket("/ws/stream")
+async def ws_stream(
+    websocket: WebSocket,
+    id_idx: int = 0,
+    audio_format: str = "s16le",
+    sample_rate: str = "16000",
+    chunk_ms: int = 1000,
+    response_format: str = "f32",
+    postprocess: Optional[str] = None,
+    seed: Optional[int] = None
+):
+    """
+    Streaming inference over a single WebSocket connection
+    
+    Query parameters:
+        id_idx: Identity index for style control
+        audio_format: "s16le" (default) or "f32le" little-endian mono PCM
+        sample_rate: Sample rate of the PCM data
+        chunk_ms: Audio accumulated before each inference step (100-2000 ms)
+        response_format: Blendshape dtype of the binary frames: "f32" (default), "f16" or "u8"
+        postprocess: JSON object of post-processing overrides, as for /api/infer_stream_init
+        seed: Seed of the session's random blinks
+    
+    Protocol:
+        server -> client text: {"type": "session", ...} once after connecting
+        client -> server binary: PCM audio of any length
+        server -> client binary: encoded blendshapes per inferred chunk (utils/blendshape_codec.py)
+        server -> client text: {"type": "error", "status_code": ..., "detail": ...}
+        client -> server text: {"type": "end"} flushes buffered audio and closes the session
+    """
+    await websocket.accept()
+    if model_instance is None:
+        await websocket.close(code=1013, reason="Model not initialized")
+        return
+    if audio_format not in PCM_FORMATS:
+        await websocket.close(code=1003, reason=f"Unsupported audio format: {audio_format}")
+        return
+    if response_format not in BLENDSHAPE_DTYPES:
+        await websocket.close(code=1003, reason=f"Unsupported response format: {response_format}")
+        return
+    try:
+        validate_id_idx(id_idx)
+        # parsed here rather than by FastAPI so a bad rate closes with 1003 like the other parameters
+        sample_rate = validate_sample_rate(sample_rate)
+        chunk_samples = int(sample_rate * min(max(chunk_ms, 100), 2000) / 1000)
+        min_samples = int(sample_rate * 0.1)
+        if min_samples < 1:
+            raise HTTPException(status_code=400, detail=f"sample_rate {sample_rate} gives empty chunks")
+        pipeline = resolve_postprocess(postprocess, model_instance.postprocess)
+    except HTTPException as e:
+        await websocket.close(code=1003, reason=e.detail)
+        return
+    
+    session_id = str(uuid.uuid4())
+    session = {
+        "id_idx": id_idx,
+        "context": new_session_context(seed),
+        "created_at": time.time(),
+        "chunk_count": 0,
+        "frame_offset": 0,
+        "postprocess": pipeline
+    }
+    streaming_sessions[session_id] = session
+    
+    sample_bytes = PCM_FORMATS[audio_format].itemsize
+    buffer = bytearray()
+    
+    try:
+        await websocket.send_json({
+            "type": "session",
+            "session_id": session_id,
+            "names": ARKitBlendShape,
+            "fps": 30.0,
+            "id_idx": id_idx,
+            "audio_format": audio_format,
+            "sample_rate": sample_rate,
+            "response_format": response_format
+        })
+        
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            
+            end = False
+            if message.get("bytes") is not None:
+                buffer += message["bytes"]
+            elif message.get("text") is not None:
+                try:
+                    end = json.loads(message["text"]).get("type") == "end"
+                except (ValueError, AttributeError):
+                    end = False
+                if not end:
+                    await websocket.send_json({"type": "error", "status_code": 400, "detail": "Unknown message"})
+                    continue
+            
+            # Infer every complete chunk; on "end" also the remainder if it is long enough
+            while len(buffer) >= chunk_samples * sample_bytes or (end and len(buffer) >= min_samples * sample_bytes):
+                size = min(len(buffer), chunk_samples * sample_bytes) // sample_bytes * sample_bytes
+                content = bytes(buffer[:size])
+                del buffer[:size]
+                try:
+                    expression, _, chunk_start = await run_stream_chunk(
+                        session, content, None, audio_format, sample_rate
+                    )
+                except HTTPException as e:
+                    await websocket.send_json({"type": "error", "status_code": e.status_code, "detail": e.detail})
+                    break
+                await websocket.send_bytes(encode_blendshapes(
+                    expression,
+                    dtype=response_format,
+                    fps=30.0,
+                    start_time=chunk_start,
+                    chunk_index=session["chunk_count"]
+                ))
+            
+            if end:
+                await websocket.send_json({"type": "end", "session_id": session_id, "chunk_count": session["chunk_count"]})
+                await websocket.close()
+                break
+    
+    except WebSocketDisconnect:
+        pass
+    finally:
+        streaming_sessions.pop(session_id, None)
+
 # ============= Main Entry Point =============
 if __name__ == "__main__":
     import uvicorn
@@ -448,12 +1053,20 @@ if __name__ == "__main__":
                        help="Model config file")
     parser.add_argument("--weight", type=str, default=None,
                        help="Model weight path (override config)")
+    parser.add_argument("--device", type=str, default=None,
+                       help="Inference device: auto, cpu, cuda or cuda:N (override config)")
+    parser.add_argument("--exported", type=str, default=None,
+                       help="Serve a model directory written by engines/export.py (override config)")
     args = parser.parse_args()
     
     # Set environment variables for startup event
     os.environ["CONFIG_FILE"] = args.config_file
     if args.weight:
         os.environ["WEIGHT_PATH"] = args.weight
+    if args.device:
+        os.environ["DEVICE"] = args.device
+    if args.exported:
+        os.environ["EXPORTED_MODEL"] = args.exported
     
     # Run server
     uvicorn.run(
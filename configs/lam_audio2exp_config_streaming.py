@@ -1,4 +1,4 @@
-weight = 'pretrained_models/lam_audio2exp_streaming.tar'  # path to model weight
+weight = 'pretrained_models/lam_audio2exp_streaming.tar'  # path to model weight, or its .safetensors conversion (python -m utils.checkpoint)
 ex_vol = True # extract
 audio_input = './assets/sample_audio/BarackObama.wav'
 save_json_path = 'bsData.json'
@@ -6,6 +6,47 @@ save_json_path = 'bsData.json'
 audio_sr = 16000
 fps = 30.0
 
+device = "auto"  # inference device: "auto", "cpu", "cuda" or "cuda:N"
+num_threads = None  # intra-op threads for cpu inference, None keeps torch default
+# build the model without random init or pretrained encoder download, the checkpoint holds every weight
+fast_init = True
+stream_left_context = 64  # frames of left context seen by Audio2ExpressionStreamingInfer
+
+# offline inference of long clips in overlapping windows, window=None runs the whole clip at once
+segment = dict(
+    window=10.0,  # seconds of audio per window
+    overlap=1.0,  # seconds shared by neighbouring windows, cross-faded in the output
+    batch_size=4,  # windows per forward pass
+)
+
+# encoded audio of recent offline clips, decoding the same clip in other styles skips the encoder;
+# None disables
+feature_cache = dict(max_bytes=128 * 2 ** 20)
+
+# vocal separation for ex_vol, "SpleeterCommandSeparator" runs the spleeter CLI per call instead
+separator = dict(type="SpleeterSeparator", model="spleeter:2stems")
+
+# expression post-processing (models/postprocess.py), any option can be overridden per request
+postprocess = dict(
+    savgol_window=5,  # Savitzky-Golay window in frames (odd, 3-31)
+    savgol_polyorder=2,
+    savgol_lookahead=2,  # streaming: frames ahead a chunk frame may use (0-2), fewer is smoother across chunks
+    symmetrize="average",  # "average", "max", "min", "left_dominant" or "right_dominant"
+)
+# "torch" post-processes batched streaming chunks on the model device (worth it on GPU), "numpy" on the host
+postprocess_backend = "numpy"
+# fused channels-last decoder (Audio2Expression.optimize_for_inference), faster on short streaming windows
+optimize_for_inference = True
+# CPU only: dict(type="dynamic", dtype="qint8") stores nn.Linear weights (the fused decoder convs
+# included) in int8 and quantizes activations per call; scripts/benchmark/quantization.py reports the
+# per-blendshape error and the throughput against float32
+quantization = None
+# "bf16" / "fp16" cast the weights once and run the forward under torch.autocast (half the
+# weight memory, the sigmoid output stays float32); bf16 is the choice on CPU, fp16 pays off on
+# GPU only. scripts/benchmark/precision.py checks the drift against float32, exclusive with
+# quantization
+precision = "fp32"
+
 movement_smooth = False
 brow_movement = False
 id_idx = 0
@@ -88,5 +129,24 @@ hooks = [
 train = dict(type="DefaultTrainer")
 
 # Tester
+# use "Audio2ExpressionStreamingInfer" to cache conv features between streaming chunks; its output
+# drifts slightly from the full-window path, check with scripts/benchmark/streaming_encoder.py
 infer = dict(type="Audio2ExpressionInfer",
              verbose=True)
+# directory written by engines/export.py, served without building the Python model (and without
+# importing transformers) by infer type "Audio2ExpressionExportedInfer"; api_server.py --exported sets both
+exported_model = None
+
+# API server
+serving = dict(
+    max_batch_size=16,  # streaming chunks of different sessions stacked into one forward
+    max_queue_delay_ms=10,  # time budget for collecting a streaming batch
+    max_workers=4,  # threads running decoding, inference and post-processing
+    max_queue_depth=32,  # requests allowed to wait for a worker before answering 429
+    request_timeout=60,  # seconds before a request is answered with 503
+    preload_separator=False,  # True loads spleeter/TensorFlow at startup instead of on the first ex_vol request
+    # raw /api/infer expressions keyed by decoded audio and model weights, a hit only re-runs the
+    # (seeded or random) post-processing; None disables, disk_dir adds a persistent tier of memory-mapped
+    # .npy files
+    result_cache=dict(max_bytes=256 * 2 ** 20, disk_dir=None),
+)
@@ -0,0 +1,131 @@
+"""
+Cross-session dynamic batching for streaming inference.
+
+Streaming windows always have the same length, so chunks of different sessions
+that arrive within a small time budget can share one forward pass.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from utils.logger import get_root_logger
+
+
+class StreamingBatchScheduler:
+    """Collects pending streaming chunks from many sessions into batched forwards.
+
+    A background thread waits for the first pending chunk, keeps collecting chunks
+    for up to ``max_queue_delay_ms`` (or until ``max_batch_size`` is reached) and runs
+    them through ``engine.infer_streaming_batch``. Each session is a mutable dict with
+    ``context`` and ``id_idx`` entries (and an optional ``postprocess`` pipeline); its context is read when the batch is built and
+    replaced with the returned context, so consecutive chunks of one session always
+    see the state left by the previous chunk. A session never appears twice in a batch,
+    later chunks are deferred to the next batch in arrival order. With ``max_pending``
+    set, :meth:`submit` raises ``queue.Full`` once that many chunks are waiting.
+    """
+
+    def __init__(self, engine, max_batch_size=16, max_queue_delay_ms=10, max_pending=0):
+        self.engine = engine
+        self.max_batch_size = max(int(max_batch_size), 1)
+        self.max_queue_delay = max(float(max_queue_delay_ms), 0.0) / 1000
+        self.logger = get_root_logger()
+
+        self._queue = queue.Queue(maxsize=max(int(max_pending), 0))
+        self._deferred = deque()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = dict(batches=0, chunks=0, last_batch_size=0, max_batch_size=0, queue_wait=0.0)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="StreamingBatchScheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, session, audio, ssr) -> Future:
+        """Queues one chunk of ``session`` and returns a future of (output, context)."""
+        future = Future()
+        self._queue.put_nowait((session, audio, ssr, future, time.perf_counter()))
+        return future
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        queue_wait = stats.pop("queue_wait")
+        stats["avg_batch_size"] = stats["chunks"] / stats["batches"] if stats["batches"] else 0.0
+        stats["avg_queue_wait_ms"] = queue_wait / stats["chunks"] * 1000 if stats["chunks"] else 0.0
+        stats["pending"] = self._queue.qsize() + len(self._deferred)
+        stats["max_batch_size_limit"] = self.max_batch_size
+        stats["max_queue_delay_ms"] = self.max_queue_delay * 1000
+        return stats
+
+    def _next_item(self, timeout):
+        if self._deferred:
+            return self._deferred.popleft()
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self):
+        try:
+            first = self._next_item(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        sessions = {id(first[0])}
+        deferred = []
+        deadline = time.perf_counter() + self.max_queue_delay
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._next_item(timeout=max(timeout, 0))
+            except queue.Empty:
+                break
+            if id(item[0]) in sessions:
+                deferred.append(item)
+            else:
+                batch.append(item)
+                sessions.add(id(item[0]))
+        # keep deferred chunks ahead of newer arrivals
+        self._deferred.extendleft(reversed(deferred))
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            batch = [item for item in batch if item[3].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                results = self.engine.infer_streaming_batch([
+                    dict(audio=audio, ssr=ssr, context=session["context"], id_idx=session["id_idx"],
+                         postprocess=session.get("postprocess"))
+                    for session, audio, ssr, _, _ in batch
+                ])
+            except Exception as e:
+                self.logger.exception("Streaming batch failed")
+                for item in batch:
+                    item[3].set_exception(e)
+                continue
+
+            for (session, _, _, future, _), (output, context) in zip(batch, results):
+                session["context"] = context
+                future.set_result((output, context))
+
+            with self._lock:
+                self._stats["batches"] += 1
+                self._stats["chunks"] += len(batch)
+                self._stats["last_batch_size"] = len(batch)
+                self._stats["max_batch_size"] = max(self._stats["max_batch_size"], len(batch))
+                self._stats["queue_wait"] += sum(start - item[4] for item in batch)
@@ -0,0 +1,66 @@
+"""
+Bounded thread pool used by the API server to keep blocking work
+(audio decoding, model forward, NumPy post-processing) off the asyncio event loop.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ExecutorOverloaded(RuntimeError):
+    """Raised when running and queued jobs already fill the executor."""
+
+
+class BoundedExecutor:
+    """Thread pool with a limit on running + waiting jobs and a per-job timeout.
+
+    At most ``max_workers`` jobs run concurrently and at most ``max_queue_depth`` more
+    wait for a worker; further submissions fail fast with :class:`ExecutorOverloaded`
+    instead of piling up latency. Jobs that exceed ``timeout`` seconds raise
+    ``asyncio.TimeoutError`` to the caller; a job that has not started yet is dropped,
+    a running one finishes in the background and then frees its slot.
+    """
+
+    def __init__(self, max_workers=4, max_queue_depth=32, timeout=None):
+        self.max_workers = max(int(max_workers), 1)
+        self.max_queue_depth = max(int(max_queue_depth), 0)
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="infer")
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue_depth)
+        self._lock = threading.Lock()
+        self._stats = dict(in_flight=0, completed=0, rejected=0, timeouts=0)
+
+    async def run(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise ExecutorOverloaded(
+                f"{self.max_workers} running and {self.max_queue_depth} queued requests already"
+            )
+        with self._lock:
+            self._stats["in_flight"] += 1
+        future = self._pool.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise
+
+    def _release(self, future):
+        with self._lock:
+            self._stats["in_flight"] -= 1
+            self._stats["completed"] += 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["max_workers"] = self.max_workers
+        stats["max_queue_depth"] = self.max_queue_depth
+        return stats
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
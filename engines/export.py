@@ -0,0 +1,182 @@
+"""
+Exports the Audio2Expression inference graph for Audio2ExpressionExportedInfer.
+
+The model is built and prepared like Audio2ExpressionInfer does it (identity table,
+``optimize_for_inference``, ``precision``), then the audio encoder and the identity decoder are
+exported with tensor signatures and dynamic batch / sample / frame axes (see models/exported.py):
+"torch_export" writes torch.export programs (.pt2, any precision), "onnx" ONNX graphs for
+ONNX Runtime (float32, needs onnx and onnxscript). Serving the directory skips building the
+Python model and importing transformers.
+
+    python -m engines.export --config-file configs/lam_audio2exp_config_streaming.py \
+        --weight pretrained_models/lam_audio2exp_streaming.tar --output exported/streaming --format onnx
+"""
+
+import os
+import copy
+import json
+
+import torch
+import torch.nn as nn
+from torch.export import Dim
+
+from engines.defaults import default_argument_parser, default_config_parser
+from engines.infer import INFER
+from models.exported import META_FILE, EXPORT_FORMATS, ExportedAudio2Expression
+from utils.result_cache import module_digest
+
+# longest clip a graph accepts, 10 minutes at 30 fps; offline clips beyond segment.window are windowed
+MAX_FRAMES = 30 * 600
+MAX_BATCH = 1024
+
+
+def backbone_view(backbone, modules):
+    """Shallow copy of ``backbone`` with only the child ``modules``, an export saves their weights only."""
+    view = copy.copy(backbone)
+    view._modules = {name: backbone._modules[name] for name in modules}
+    return view
+
+
+class AudioEncoderGraph(nn.Module):
+    """encode_audio with a tensor signature: (audio, time_steps) -> float32 features."""
+
+    def __init__(self, backbone, device_type, dtype):
+        super().__init__()
+        self.backbone = backbone_view(backbone, ("audio_encoder", "feature_projection"))
+        self.device_type = device_type
+        self.dtype = dtype
+
+    def forward(self, audio, time_steps):
+        time_steps = time_steps.item()
+        # bounds of the data-dependent frame count, the resampling to it only exports for sizes > 1
+        torch._check(time_steps > 1)
+        torch._check(time_steps <= MAX_FRAMES)
+        with torch.autocast(self.device_type, dtype=self.dtype, enabled=self.dtype != torch.float32):
+            features = self.backbone.encode_audio({'input_audio_array': audio, 'time_steps': time_steps})
+        return features.float()
+
+
+class ExpressionDecoderGraph(nn.Module):
+    """decode_expression with a tensor signature: (features, id_idx) -> float32 expression."""
+
+    def __init__(self, backbone, device_type, dtype):
+        super().__init__()
+        self.backbone = backbone_view(backbone, ("identity_encoder", "decoder", "output_proj"))
+        self.device_type = device_type
+        self.dtype = dtype
+
+    def forward(self, audio_features, id_idx):
+        with torch.autocast(self.device_type, dtype=self.dtype, enabled=self.dtype != torch.float32):
+            return self.backbone.decode_expression(audio_features, id_idx)
+
+
+def export_graph(graph, args, dynamic_shapes, input_names, output_name, path, format):
+    graph.eval()
+    if format == "onnx":
+        torch.onnx.export(graph, args, path, dynamo=True, dynamic_shapes=dynamic_shapes,
+                          input_names=input_names, output_names=[output_name], verbose=False)
+    else:
+        torch.export.save(torch.export.export(graph, args, dynamic_shapes=dynamic_shapes), path)
+
+
+@torch.inference_mode()
+def export_model(engine, output: str, format: str = "torch_export") -> dict:
+    """Writes the encode / decode graphs of ``engine``'s prepared backbone and export.json to ``output``.
+
+    Raises:
+        ValueError: For unknown formats, quantized models and reduced-precision ONNX exports
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {format}, expected one of {list(EXPORT_FORMATS)}")
+    if engine.cfg.get("quantization", None):
+        raise ValueError("Dynamically quantized layers do not export, export the float model")
+    if format == "onnx" and engine.dtype != torch.float32:
+        raise ValueError(f"ONNX export is float32 only, got precision {engine.precision}")
+    os.makedirs(output, exist_ok=True)
+    backbone = engine.backbone.eval()
+    device, files = engine.device, {}
+
+    # batch 2 and 64 frames (a streaming window) as examples, sizes 0 / 1 would be specialized
+    batch = Dim("batch", min=1, max=MAX_BATCH)
+    samples = Dim("samples", min=1600, max=MAX_FRAMES * 16000 // 30)
+    frames = Dim("frames", min=2, max=MAX_FRAMES)
+    audio = torch.randn(2, 64 * 16000 // 30, device=device)
+    time_steps = torch.tensor(64, device=device)
+    id_idx = torch.zeros(2, dtype=torch.long, device=device)
+    features = AudioEncoderGraph(backbone, device.type, engine.dtype)(audio, time_steps)
+
+    for name, graph, args, dynamic_shapes, input_names, output_name in (
+            ("encode", AudioEncoderGraph(backbone, device.type, engine.dtype), (audio, time_steps),
+             ({0: batch, 1: samples}, None), ["audio", "time_steps"], "features"),
+            ("decode", ExpressionDecoderGraph(backbone, device.type, engine.dtype), (features, id_idx),
+             ({0: batch, 2: frames}, {0: batch}), ["features", "id_idx"], "expression"),
+    ):
+        files[name] = EXPORT_FORMATS[format].format(name)
+        engine.logger.info(f"=> Exporting {name} graph to {os.path.join(output, files[name])}")
+        export_graph(graph, args, dynamic_shapes, input_names, output_name, os.path.join(output, files[name]), format)
+
+    backbone_cfg = engine.cfg.model.backbone
+    meta = dict(
+        format=format,
+        files=files,
+        precision=engine.precision,
+        device=device.type,
+        optimize_for_inference=bool(engine.cfg.get("optimize_for_inference", False)),
+        num_identity_classes=backbone_cfg.num_identity_classes,
+        hidden_dim=backbone_cfg.get("hidden_dim", 512),
+        expression_dim=backbone_cfg.get("expression_dim", 52),
+        max_frames=MAX_FRAMES,
+        weight=engine.cfg.weight,
+        digest=module_digest(engine.model),
+        torch=torch.__version__,
+    )
+    with open(os.path.join(output, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+@torch.inference_mode()
+def check_export(engine, output: str, seconds=(2.0, 5.5), id_indices=(0, 1)) -> float:
+    """Max abs difference between the exported graphs and the Python model on random audio."""
+    exported = ExportedAudio2Expression(output, engine.device)
+    id_idx = engine.identity_indices(list(id_indices))
+    worst = 0.0
+    for duration in seconds:
+        audio = 0.1 * torch.randn(len(id_indices), int(duration * 16000), device=engine.device)
+        input_dict = {'input_audio_array': audio, 'id_idx': id_idx}
+        with engine.autocast():
+            expected = engine.backbone(input_dict).float()
+        actual = exported(input_dict)['pred_exp']
+        assert expected.shape == actual.shape, f"shape {tuple(actual.shape)} != {tuple(expected.shape)}"
+        worst = max(worst, (expected - actual).abs().max().item())
+    return worst
+
+
+def main():
+    parser = default_argument_parser()
+    parser.add_argument("--weight", default=None, help="checkpoint (override config)")
+    parser.add_argument("--output", required=True, help="export directory")
+    parser.add_argument("--format", default="torch_export", choices=list(EXPORT_FORMATS))
+    parser.add_argument("--device", default=None, help="device to export on (override config), "
+                                                       "torch_export graphs run on this device type only")
+    args = parser.parse_args()
+
+    cfg = default_config_parser(args.config_file, args.options)
+    if args.weight:
+        cfg.weight = args.weight
+    if args.device:
+        cfg.device = args.device
+    # the transforms of the Python engine, not the incremental streaming encoder
+    engine = INFER.build(dict(type="Audio2ExpressionInfer", cfg=cfg))
+    engine.model.eval()
+    meta = export_model(engine, args.output, args.format)
+    engine.logger.info(f"=> Exported {meta['format']} ({meta['precision']}, {meta['device']}) to {args.output}")
+    worst = check_export(engine, args.output)
+    # reduced precisions differ by their rounding between the eager and the exported kernels
+    tolerance = 1e-4 if engine.dtype == torch.float32 else 5e-2
+    assert worst < tolerance, f"exported model differs by {worst}"
+    engine.logger.info(f"=> Max abs difference to the Python model: {worst:.2e}")
+
+
+if __name__ == "__main__":
+    main()
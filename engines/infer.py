@@ -16,31 +16,49 @@ limitations under the License.
 """
 
 import os
+import copy
 import math
+import contextlib
 import time
 import librosa
 import numpy as np
-from collections import OrderedDict
 
 import torch
 import torch.utils.data
-import torch.nn.functional as F
 
 from .defaults import create_ddp_model
 import utils.comm as comm
 from models import build_model
+from models.separator import build_separator
+from models.quantization import quantize_model
+from models.exported import ExportedAudio2Expression
+from models.postprocess import PostProcessPipeline, OFFLINE_STAGES, rms_volume
+from utils.checkpoint import load_weights
+from utils.env import get_device
 from utils.logger import get_root_logger
 from utils.registry import Registry
+from utils.result_cache import ResultCache, content_key
 from utils.misc import (
     AverageMeter,
 )
 
-from models.utils import smooth_mouth_movements, apply_frame_blending, apply_savitzky_golay_smoothing, apply_random_brow_movement, \
-    symmetrize_blendshapes, apply_random_eye_blinks, apply_random_eye_blinks_context, export_blendshape_animation, \
-    RETURN_CODE, DEFAULT_CONTEXT, ARKitBlendShape
+from models.utils import export_blendshape_animation, RETURN_CODE, DEFAULT_CONTEXT, ARKitBlendShape
 
 INFER = Registry("infer")
 
+# inference precisions: weights are cast once at load, the forward runs under autocast
+PRECISIONS = {
+    "fp32": torch.float32,
+    "bf16": torch.bfloat16,
+    "fp16": torch.float16,
+}
+# (mean, max) absolute drift of the [0, 1] blendshape weights accepted against fp32, checked by
+# tests/test_precision.py and scripts/benchmark/precision.py
+PRECISION_TOLERANCES = {
+    "bf16": (5e-3, 5e-2),
+    "fp16": (1e-3, 1e-2),
+}
+
 class InferBase:
     def __init__(self, cfg, model=None, verbose=False) -> None:
         torch.multiprocessing.set_sharing_strategy("file_system")
@@ -54,6 +72,15 @@ class InferBase:
         if self.verbose:
             self.logger.info(f"Save path: {cfg.save_path}")
             self.logger.info(f"Config:\n{cfg.pretty_text}")
+        self.device = get_device(cfg.get("device", "auto"))
+        if self.device.type == "cpu" and cfg.get("num_threads", None) is not None:
+            torch.set_num_threads(cfg.num_threads)
+        self.logger.info(f"Inference device: {self.device} "
+                         f"(threads: {torch.get_num_threads()})")
+        self.precision = cfg.get("precision", "fp32")
+        if self.precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision: {self.precision}, expected one of {list(PRECISIONS)}")
+        self.dtype = PRECISIONS[self.precision]
         if model is None:
             self.logger.info("=> Building model ...")
             self.model = self.build_model()
@@ -61,36 +88,67 @@ class InferBase:
             self.model = model
 
     def build_model(self):
-        model = build_model(self.cfg.model)
+        if not os.path.isfile(self.cfg.weight):
+            raise RuntimeError("=> No checkpoint found at '{}'".format(self.cfg.weight))
+        # every weight comes from the checkpoint: skip the random init and the pretrained encoder
+        fast_init = self.cfg.get("fast_init", False)
+        if fast_init:
+            from transformers.modeling_utils import no_init_weights
+
+            model_cfg = copy.deepcopy(self.cfg.model)
+            model_cfg.backbone.load_pretrained_encoder = False
+            with no_init_weights():
+                model = build_model(model_cfg)
+        else:
+            model = build_model(self.cfg.model)
         n_parameters = sum(p.numel() for p in model.parameters() if p.requires_grad)
         self.logger.info(f"Num params: {n_parameters}")
-        model = create_ddp_model(
-            model.cuda(),
-            broadcast_buffers=False,
-            find_unused_parameters=self.cfg.find_unused_parameters,
+
+        self.logger.info(f"Loading weight at: {self.cfg.weight}")
+        weight = load_weights(self.cfg.weight)
+        # assign keeps the loaded tensors instead of copying them into the uninitialized ones,
+        # for a .safetensors checkpoint on a cpu fp32 model these are the shared file pages
+        model.load_state_dict(weight, strict=True, assign=fast_init)
+        self.logger.info(
+            "=> Loaded weight '{}'".format(
+                self.cfg.weight
+            )
         )
-        if os.path.isfile(self.cfg.weight):
-            self.logger.info(f"Loading weight at: {self.cfg.weight}")
-            checkpoint = torch.load(self.cfg.weight)
-            weight = OrderedDict()
-            for key, value in checkpoint["state_dict"].items():
-                if key.startswith("module."):
-                    if comm.get_world_size() == 1:
-                        key = key[7:]  # module.xxx.xxx -> xxx.xxx
-                else:
-                    if comm.get_world_size() > 1:
-                        key = "module." + key  # xxx.xxx -> module.xxx.xxx
-                weight[key] = value
-            model.load_state_dict(weight, strict=True)
-            self.logger.info(
-                "=> Loaded weight '{}'".format(
-                    self.cfg.weight
-                )
+        model = model.to(self.device)
+        # DDP is only meaningful for multi-gpu runs, cpu workers scale out by process instead
+        if self.device.type == "cuda" and comm.get_world_size() > 1:
+            model = create_ddp_model(
+                model,
+                broadcast_buffers=False,
+                find_unused_parameters=self.cfg.find_unused_parameters,
             )
-        else:
-            raise RuntimeError("=> No checkpoint found at '{}'".format(self.cfg.weight))
+        return self.prepare_model(model)
+
+    def prepare_model(self, model):
+        """Inference-only transforms of the loaded model: ``quantization`` on CPU or ``precision``."""
+        quantization = self.cfg.get("quantization", None)
+        if quantization and self.dtype != torch.float32:
+            raise ValueError(f"quantization and precision {self.precision} are exclusive")
+        if self.dtype != torch.float32:
+            # half the weight bytes; norms and softmax are promoted back to fp32 by autocast
+            model = model.to(self.dtype)
+            self.logger.info(f"=> Weights cast to {self.precision}")
+        if quantization:
+            if self.device.type != "cpu" or isinstance(model, torch.nn.parallel.DistributedDataParallel):
+                self.logger.warning(f"Quantization is CPU only, keeping the float model on {self.device}")
+            else:
+                model = quantize_model(model, **quantization)
+                self.logger.info(f"=> Quantized model: {dict(quantization)}")
         return model
 
+    def autocast(self):
+        """Autocast context of the configured precision around forward passes, off for fp32."""
+        return torch.autocast(self.device.type, dtype=self.dtype, enabled=self.dtype != torch.float32)
+
+    @property
+    def backbone(self):
+        """The Audio2Expression network, unwrapped from DDP if needed."""
+        return getattr(self.model, "module", self.model).backbone
 
     def infer(self):
         raise NotImplementedError
@@ -99,6 +157,34 @@ class InferBase:
 
 @INFER.register_module()
 class Audio2ExpressionInfer(InferBase):
+    # streaming windows cover 64 frames (~2.13 s) of audio
+    max_frame_length = 64
+
+    def __init__(self, cfg, model=None, verbose=False) -> None:
+        super().__init__(cfg, model=model, verbose=verbose)
+        # built here, the separation model itself is only loaded on first use / preload
+        self.separator = build_separator(cfg.get("separator", dict(type="SpleeterSeparator")))
+        # planned once, requests derive their own variants with configure()
+        self.postprocess = PostProcessPipeline(**cfg.get("postprocess", {}))
+        self.offline_postprocess = self.postprocess.configure(stages=OFFLINE_STAGES, blink="interval")
+        # "torch" post-processes streaming batches on the model device before copying them back
+        self.postprocess_backend = cfg.get("postprocess_backend", "numpy")
+        if self.postprocess_backend not in ("numpy", "torch"):
+            raise ValueError(f"Unknown postprocess_backend: {self.postprocess_backend}, expected numpy or torch")
+        # encoded audio by content, re-decoding a clip in other styles skips the encoder
+        feature_cache = cfg.get("feature_cache", None)
+        self.feature_cache = ResultCache(max_bytes=feature_cache.get("max_bytes", 128 * 2 ** 20)) \
+            if feature_cache else None
+
+    def prepare_model(self, model):
+        backbone = getattr(model, "module", model).backbone
+        # style embeddings computed once instead of a conv over repeated one-hot codes per request
+        backbone.precompute_identity_table()
+        # before quantization, the fused conv windows are linear layers it then covers
+        if self.cfg.get("optimize_for_inference", False):
+            backbone.optimize_for_inference()
+        return super().prepare_model(model)
+
     def infer(self):
         logger = get_root_logger()
         logger.info(">>>>>>>>>>>>>>>> Start Inference >>>>>>>>>>>>>>>>")
@@ -109,44 +195,35 @@ class Audio2ExpressionInfer(InferBase):
         assert os.path.exists(self.cfg.audio_input)
         if(self.cfg.ex_vol):
             logger.info("Extract vocals ...")
-            vocal_path = self.extract_vocal_track(self.cfg.audio_input)
-            logger.info("=> Extract vocals at: {}".format(vocal_path if os.path.exists(vocal_path) else '... Failed'))
-            if(os.path.exists(vocal_path)):
-                self.cfg.audio_input = vocal_path
-
-        with torch.no_grad():
-            input_dict = {}
-            input_dict['id_idx'] = F.one_hot(torch.tensor(self.cfg.id_idx),
-                                             self.cfg.model.backbone.num_identity_classes).cuda(non_blocking=True)[None,...]
+            # separate at the native sample rate, then resample for the model
+            speech_array, ssr = librosa.load(self.cfg.audio_input, sr=None)
+            speech_array = self.extract_vocals(speech_array, ssr)
+            speech_array, ssr = librosa.resample(speech_array, orig_sr=ssr, target_sr=16000), 16000
+        else:
             speech_array, ssr = librosa.load(self.cfg.audio_input, sr=16000)
-            input_dict['input_audio_array'] = torch.FloatTensor(speech_array).cuda(non_blocking=True)[None,...]
-
-            end = time.time()
-            output_dict = self.model(input_dict)
-            batch_time.update(time.time() - end)
-
-            logger.info(
-                "Infer: [{}] "
-                "Running Time: {batch_time.avg:.3f} ".format(
-                    self.cfg.audio_input,
-                    batch_time=batch_time,
-                )
-            )
 
-        out_exp = output_dict['pred_exp'].squeeze().cpu().numpy()
+        end = time.time()
+        out_exp = self.predict_expression(speech_array, self.cfg.id_idx)
+        batch_time.update(time.time() - end)
+
+        logger.info(
+            "Infer: [{}] "
+            "Running Time: {batch_time.avg:.3f} ".format(
+                self.cfg.audio_input,
+                batch_time=batch_time,
+            )
+        )
 
         frame_length = math.ceil(speech_array.shape[0] / ssr * 30)
         volume = librosa.feature.rms(y=speech_array, frame_length=int(1 / 30 * ssr), hop_length=int(1 / 30 * ssr))[0]
         if (volume.shape[0] > frame_length):
             volume = volume[:frame_length]
 
-        if(self.cfg.movement_smooth):
-            out_exp = smooth_mouth_movements(out_exp, 0, volume)
-
-        if (self.cfg.brow_movement):
-            out_exp = apply_random_brow_movement(out_exp, volume)
-
-        pred_exp = self.blendshape_postprocess(out_exp)
+        pred_exp = self.blendshape_postprocess(out_exp,
+                                               volume=volume,
+                                               movement_smooth=self.cfg.movement_smooth,
+                                               brow_movement=self.cfg.brow_movement,
+                                               rng=np.random.default_rng(self.cfg.seed))
 
         if(self.cfg.save_json_path is not None):
             export_blendshape_animation(pred_exp,
@@ -156,21 +233,165 @@ class Audio2ExpressionInfer(InferBase):
 
         logger.info("<<<<<<<<<<<<<<<<< End Evaluation <<<<<<<<<<<<<<<<<")
 
+    @torch.inference_mode()
+    def predict_expression(self, audio: np.ndarray, id_idx: int) -> np.ndarray:
+        """Runs the network over a complete clip and returns the raw (T, 52) expression.
+
+        Clips longer than ``segment.window`` seconds are split into windows overlapping by
+        ``segment.overlap`` seconds, which run ``segment.batch_size`` at a time; the frames
+        of overlapping windows are cross-faded. Time and peak memory thus grow linearly
+        with the clip length instead of quadratically in the encoder attention.
+        """
+        return self.predict_expressions(audio, [id_idx])[0]
+
+    @torch.inference_mode()
+    def predict_expressions(self, audio: np.ndarray, id_indices: list) -> np.ndarray:
+        """Raw (K, T, 52) expressions of one clip in each of the K styles of ``id_indices``.
+
+        The audio encoder runs once (see :meth:`encode_clip`), only the identity encoder and
+        decoder run per style, batched over the identities.
+        """
+        features, starts, total_frames = self.encode_clip(audio)
+        num_ids = len(id_indices)
+        window_frames = features.shape[-1]
+        batch_size = max(int((self.cfg.get("segment", None) or {}).get("batch_size", 1)), 1)
+
+        preds = []
+        for i in range(0, len(starts), batch_size):
+            batch = features[i:i + batch_size].to(self.device, non_blocking=True)
+            # rows ordered identity-major: all windows of the first style, then the next ...
+            id_idx = self.identity_indices(np.repeat(id_indices, len(batch)).tolist())
+            with self.autocast():
+                pred = self.backbone.decode_expression(batch.repeat(num_ids, 1, 1), id_idx)
+            preds.append(pred.float().cpu().numpy().reshape(num_ids, len(batch), window_frames, -1))
+        pred = np.concatenate(preds, axis=1)
+        if len(starts) == 1:
+            return pred[:, 0]
+
+        segment = self.cfg.segment
+        overlap_frames = min(int(round(segment.get("overlap", 0) * 30)), window_frames - 1)
+        # trapezoid cross-fade weights, flat at the clip boundaries
+        fade = np.ones(window_frames, dtype=np.float32)
+        if overlap_frames > 0:
+            ramp = np.arange(1, overlap_frames + 1, dtype=np.float32) / (overlap_frames + 1)
+            fade[:overlap_frames] = ramp
+            fade[-overlap_frames:] = np.minimum(fade[-overlap_frames:], ramp[::-1])
+
+        output = np.zeros((num_ids, total_frames, pred.shape[-1]), dtype=np.float32)
+        weight = np.zeros(total_frames, dtype=np.float32)
+        for start, window_pred in zip(starts, pred.transpose(1, 0, 2, 3)):
+            window_fade = fade.copy()
+            if start == 0:
+                window_fade[:overlap_frames] = 1
+            if start == starts[-1]:
+                window_fade[window_frames - overlap_frames:] = 1
+            output[:, start:start + window_frames] += window_pred * window_fade[:, None]
+            weight[start:start + window_frames] += window_fade
+        return output / weight[:, None]
+
+    @torch.inference_mode()
+    def encode_clip(self, audio: np.ndarray) -> tuple:
+        """Identity-independent features of a complete clip.
+
+        Returns (features, starts, total_frames): features are (N, hidden_dim, window_frames)
+        for the N windows starting at frames ``starts``, a single window covering the clip
+        when it is no longer than ``segment.window``. With ``feature_cache`` configured the
+        features are kept by audio content, so decoding a clip again in other styles skips
+        the encoder.
+        """
+        segment = self.cfg.get("segment", None) or {}
+        total_frames = math.ceil(len(audio) / 16000 * 30)
+        window_frames = int(round(segment.get("window", 0) * 30)) if segment.get("window") else 0
+        if not window_frames or total_frames <= window_frames:
+            window_frames, starts = total_frames, [0]
+        else:
+            hop_frames = window_frames - min(int(round(segment.get("overlap", 0) * 30)), window_frames - 1)
+            # the last window is aligned to the end of the clip instead of being padded
+            starts = list(range(0, total_frames - window_frames, hop_frames)) + [total_frames - window_frames]
+
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        cache_key = None
+        if self.feature_cache is not None:
+            cache_key = content_key(audio, window_frames=window_frames, starts=starts)
+            features = self.feature_cache.get(cache_key)
+            if features is not None:
+                return torch.tensor(features), starts, total_frames
+
+        audio = torch.from_numpy(audio).to(self.device, non_blocking=True)
+        if len(starts) == 1:
+            with self.autocast():
+                features = self.backbone.encode_audio({'input_audio_array': audio[None]})
+        else:
+            window_samples = int(round(window_frames * 16000 / 30))
+            batch_size = max(int(segment.get("batch_size", 1)), 1)
+            sample_starts = [min(int(round(f * 16000 / 30)), max(len(audio) - window_samples, 0)) for f in starts]
+            with self.autocast():
+                features = torch.cat([
+                    self.backbone.encode_audio({
+                        'input_audio_array': torch.stack([audio[s:s + window_samples]
+                                                          for s in sample_starts[i:i + batch_size]]),
+                        'time_steps': window_frames,
+                    })
+                    for i in range(0, len(sample_starts), batch_size)
+                ])
+
+        if cache_key is not None:
+            self.feature_cache.put(cache_key, features.float().cpu().numpy())
+        return features, starts, total_frames
+
     def infer_streaming_audio(self,
                            audio: np.ndarray,
                            ssr: float,
-                           context: dict):
+                           context: dict,
+                           id_idx: int = None,
+                           postprocess: PostProcessPipeline = None):
+
+        return self.infer_streaming_batch([dict(audio=audio, ssr=ssr, context=context, id_idx=id_idx,
+                                                postprocess=postprocess)])[0]
 
+    def infer_streaming_batch(self, chunks: list) -> list:
+        """Runs chunks of several streaming sessions through one batched forward pass.
+
+        Args:
+            chunks: list of dicts with keys 'audio', 'ssr', 'context', 'id_idx' and optionally
+                    'postprocess' (a configured pipeline), at most one chunk per session
+
+        Returns:
+            List of (output, context) tuples in the order of ``chunks``
+        """
+        requests = [self.prepare_streaming_input(**chunk) for chunk in chunks]
+
+        with torch.inference_mode():
+            try:
+                with self.autocast():
+                    out_exps = self.predict_streaming_batch(requests)
+                # post-processing stays in fp32
+                if self.postprocess_backend == "torch":
+                    out_exps = self.postprocess_streaming_batch(requests, out_exps)
+            except Exception:
+                self.logger.exception('Error: failed to predict expression.')
+                return [({"code": RETURN_CODE['MODEL_INFERENCE_ERROR'],
+                          "expression": None,
+                          "headpose": None}, request['context']) for request in requests]
+
+        return [self.finalize_streaming_output(request, out_exp)
+                for request, out_exp in zip(requests, out_exps)]
+
+    def prepare_streaming_input(self,
+                                audio: np.ndarray,
+                                ssr: float,
+                                context: dict,
+                                id_idx: int = None,
+                                postprocess: PostProcessPipeline = None) -> dict:
+        """Builds the fixed-length model input window for one streaming chunk."""
         if (context is None):
             context = DEFAULT_CONTEXT.copy()
-        max_frame_length = 64
+        max_frame_length = self.max_frame_length
 
-        frame_length = math.ceil(audio.shape[0] / ssr * 30)
         output_context = DEFAULT_CONTEXT.copy()
 
-        volume = librosa.feature.rms(y=audio, frame_length=min(int(1 / 30 * ssr), len(audio)), hop_length=int(1 / 30 * ssr))[0]
-        if (volume.shape[0] > frame_length):
-            volume = volume[:frame_length]
+        # the torch backend computes the volumes of the whole batch on the device instead
+        volume = self.chunk_volume(audio, ssr) if self.postprocess_backend == "numpy" else None
 
         # resample audio
         if (ssr != self.cfg.audio_sr):
@@ -194,29 +415,136 @@ class Audio2ExpressionInfer(InferBase):
             input_audio = np.concatenate([clip_pre_audio, in_audio])
             output_context['previous_audio'] = input_audio
 
-        with torch.no_grad():
-            try:
-                input_dict = {}
-                input_dict['id_idx'] = F.one_hot(torch.tensor(self.cfg.id_idx),
-                                                 self.cfg.model.backbone.num_identity_classes).cuda(non_blocking=True)[
-                    None, ...]
-                input_dict['input_audio_array'] = torch.FloatTensor(input_audio).cuda(non_blocking=True)[None, ...]
-                output_dict = self.model(input_dict)
-                out_exp = output_dict['pred_exp'].squeeze().cpu().numpy()[start_frame:, :]
-            except:
-                self.logger.error('Error: faided to predict expression.')
-                output_dict['pred_exp'] = torch.zeros((max_frame_length, 52)).float()
-                return
-
-
-        # post-process
-        if (context['previous_expression'] is None):
-            out_exp = self.apply_expression_postprocessing(out_exp, audio_volume=volume)
+        return {'context': context,
+                'output_context': output_context,
+                'input_audio': input_audio,
+                'volume': volume,
+                'start_frame': start_frame,
+                'id_idx': self.cfg.id_idx if id_idx is None else id_idx,
+                'postprocess': postprocess,
+                'chunk_audio': audio,
+                'ssr': ssr}
+
+    def chunk_volume(self, audio: np.ndarray, ssr: float) -> np.ndarray:
+        """Per-frame (30 fps) RMS volume of a streaming chunk."""
+        frame_length = math.ceil(audio.shape[0] / ssr * 30)
+        volume = librosa.feature.rms(y=audio, frame_length=min(int(1 / 30 * ssr), len(audio)), hop_length=int(1 / 30 * ssr))[0]
+        if (volume.shape[0] > frame_length):
+            volume = volume[:frame_length]
+        return volume
+
+    def chunk_volumes_batch(self, requests: list) -> list:
+        """:meth:`chunk_volume` of all chunks of a batch, computed on the inference device."""
+        groups = {}
+        for index, request in enumerate(requests):
+            hop_length = int(1 / 30 * request['ssr'])
+            groups.setdefault((request['ssr'], min(hop_length, len(request['chunk_audio']))), []).append(index)
+
+        volumes = [None] * len(requests)
+        for (ssr, frame_length), indices in groups.items():
+            hop_length = int(1 / 30 * ssr)
+            audios = [requests[index]['chunk_audio'] for index in indices]
+            padded = np.zeros((len(audios), max(len(audio) for audio in audios)), dtype=np.float32)
+            for row, audio in enumerate(audios):
+                padded[row, :len(audio)] = audio
+            rms = rms_volume(torch.from_numpy(padded).to(self.device, non_blocking=True), frame_length, hop_length)
+            for row, (index, audio) in enumerate(zip(indices, audios)):
+                # librosa's frame count, cut to the chunk's duration like chunk_volume
+                frames = 1 + (len(audio) + 2 * (frame_length // 2) - frame_length) // hop_length
+                volumes[index] = rms[row, :min(frames, math.ceil(len(audio) / ssr * 30))]
+        return volumes
+
+    def postprocess_streaming_batch(self, requests: list, out_exps: list) -> list:
+        """Post-processes the new frames of all chunks on the model device (postprocess_backend="torch").
+
+        Chunks of sessions sharing a pipeline go through :meth:`PostProcessPipeline.run_batch`
+        together; only the results are copied to the host.
+
+        Returns:
+            The post-processed new frames of every chunk as NumPy arrays
+        """
+        volumes = self.chunk_volumes_batch(requests)
+        groups = {}
+        for index, request in enumerate(requests):
+            groups.setdefault(id(request['postprocess'] or self.postprocess), []).append(index)
+
+        outputs = [None] * len(requests)
+        for indices in groups.values():
+            pipeline = requests[indices[0]]['postprocess'] or self.postprocess
+            expressions, processed_frames, group_volumes, states = [], [], [], []
+            for index in indices:
+                request = requests[index]
+                context = request['context']
+                expression, volume = out_exps[index].float(), volumes[index]
+                if context['previous_expression'] is not None:
+                    expression = torch.cat([torch.from_numpy(context['previous_expression']).to(expression), expression])
+                    volume = torch.cat([torch.from_numpy(context['previous_volume']).to(volume), volume])
+                expressions.append(expression)
+                processed_frames.append(expression.shape[0] - out_exps[index].shape[0])
+                group_volumes.append(volume)
+                states.append(self.streaming_postprocess_state(request))
+
+            results = pipeline.run_batch(expressions, processed_frames, group_volumes, states)
+            for index, result, processed in zip(indices, results, processed_frames):
+                outputs[index] = result[processed:]
+                requests[index]['volume'] = volumes[index].cpu().numpy()
+                requests[index]['postprocessed'] = True
+        return outputs
+
+    @staticmethod
+    def streaming_postprocess_state(request: dict) -> dict:
+        """State of the stateful post-processing stages for this chunk, saved into the new context."""
+        if 'postprocess_state' not in request:
+            request['postprocess_state'] = dict(request['context'].get('postprocess_state') or {})
+        return request['postprocess_state']
+
+    def identity_indices(self, id_indices: list) -> torch.Tensor:
+        """(B,) style indices on the inference device, looked up in the backbone's identity table."""
+        num_identities = self.cfg.model.backbone.num_identity_classes
+        for id_idx in id_indices:
+            # checked on the host, an out-of-range lookup on CUDA would be a device-side assert
+            if not 0 <= id_idx < num_identities:
+                raise ValueError(f"id_idx {id_idx} out of range [0, {num_identities})")
+        return torch.tensor(id_indices, dtype=torch.long).to(self.device, non_blocking=True)
+
+    def build_streaming_batch(self, requests: list) -> dict:
+        """Stacks prepared windows (all ``max_frame_length`` frames long) into one model input."""
+        input_audio = np.stack([request['input_audio'] for request in requests])
+        return {'id_idx': self.identity_indices([request['id_idx'] for request in requests]),
+                'input_audio_array': torch.from_numpy(input_audio).float().to(self.device, non_blocking=True)}
+
+    def predict_streaming_batch(self, requests: list) -> list:
+        """Runs the model on prepared windows and keeps the frames of each new chunk."""
+        output_dict = self.model(self.build_streaming_batch(requests))
+        pred_exp = output_dict['pred_exp']
+        if self.postprocess_backend == "numpy":
+            pred_exp = pred_exp.cpu().numpy()
+        return [pred_exp[i, request['start_frame']:, :] for i, request in enumerate(requests)]
+
+    def finalize_streaming_output(self, request: dict, out_exp: np.ndarray):
+        """Post-processes the new frames and updates the streaming context."""
+        context = request['context']
+        output_context = request['output_context']
+        volume = request['volume']
+        postprocess = request.get('postprocess')
+        # stateful stages (the causal smoother) carry their state from chunk to chunk
+        postprocess_state = self.streaming_postprocess_state(request)
+        max_frame_length = self.max_frame_length
+
+        # post-process, unless already done on the device for the whole batch
+        if request.get('postprocessed'):
+            pass
+        elif (context['previous_expression'] is None):
+            out_exp = self.apply_expression_postprocessing(out_exp, audio_volume=volume, postprocess=postprocess,
+                                                           postprocess_state=postprocess_state)
         else:
             previous_length = context['previous_expression'].shape[0]
             out_exp = self.apply_expression_postprocessing(expression_params = np.concatenate([context['previous_expression'], out_exp], axis=0),
                                                            audio_volume=np.concatenate([context['previous_volume'], volume], axis=0),
-                                                           processed_frames=previous_length)[previous_length:, :]
+                                                           processed_frames=previous_length,
+                                                           postprocess=postprocess,
+                                                           postprocess_state=postprocess_state)[previous_length:, :]
+        output_context['postprocess_state'] = postprocess_state
 
         if (context['previous_expression'] is not None):
             output_context['previous_expression'] = np.concatenate([context['previous_expression'], out_exp], axis=0)[
@@ -226,16 +554,19 @@ class Audio2ExpressionInfer(InferBase):
             output_context['previous_expression'] = out_exp.copy()
             output_context['previous_volume'] = volume.copy()
 
-        output_context['first_input_flag'] = False
+        output_context['is_initial_input'] = False
 
         return {"code": RETURN_CODE['SUCCESS'],
                 "expression": out_exp,
                 "headpose": None}, output_context
+
     def apply_expression_postprocessing(
             self,
             expression_params: np.ndarray,
             processed_frames: int = 0,
-            audio_volume: np.ndarray = None
+            audio_volume: np.ndarray = None,
+            postprocess: PostProcessPipeline = None,
+            postprocess_state: dict = None
     ) -> np.ndarray:
         """Applies full post-processing pipeline to facial expression parameters.
 
@@ -243,43 +574,173 @@ class Audio2ExpressionInfer(InferBase):
             expression_params: Raw output from animation model [num_frames, num_parameters]
             processed_frames: Number of frames already processed in previous batches
             audio_volume: Optional volume array for audio-visual synchronization
+            postprocess: Per-request pipeline from ``self.postprocess.configure(...)``
+            postprocess_state: Streaming session state of the stateful stages, updated in place
 
         Returns:
-            Processed expression parameters ready for animation synthesis
+            Processed expression parameters ready for animation synthesis (float32, in place)
         """
-        # Pipeline execution order matters - maintain sequence
-        expression_params = smooth_mouth_movements(expression_params, processed_frames, audio_volume)
-        expression_params = apply_frame_blending(expression_params, processed_frames)
-        expression_params, _ = apply_savitzky_golay_smoothing(expression_params, window_length=5)
-        expression_params = symmetrize_blendshapes(expression_params)
-        expression_params = apply_random_eye_blinks_context(expression_params, processed_frames=processed_frames)
-
-        return expression_params
+        pipeline = postprocess or self.postprocess
+        return pipeline(expression_params, processed_frames, audio_volume, state=postprocess_state)
 
-    def extract_vocal_track(
+    def extract_vocals(
             self,
-            input_audio_path: str
-    ) -> str:
-        """Isolates vocal track from audio file using source separation.
+            audio: np.ndarray,
+            sr: int,
+            fallback: bool = True
+    ) -> np.ndarray:
+        """Isolates the vocal track of a waveform in memory.
+
+        Falls back to the original audio if separation fails, like the file based path did.
 
         Args:
-            input_audio_path: Path to input audio file containing vocals+accompaniment
+            audio: Mono waveform containing vocals+accompaniment
+            sr: Sample rate of ``audio``
+            fallback: Return ``audio`` on failure instead of raising
 
         Returns:
-            Path to isolated vocal track in WAV format
+            Vocal waveform with the same sample rate and length
         """
-        separation_command = f'spleeter separate -p spleeter:2stems -o {self.cfg.save_path} {input_audio_path}'
-        os.system(separation_command)
-
-        base_name = os.path.splitext(os.path.basename(input_audio_path))[0]
-        return os.path.join(self.cfg.save_path, base_name, 'vocals.wav')
+        try:
+            return self.separator.separate(audio, sr)
+        except Exception as e:
+            self.logger.warning(f"=> Extract vocals ... Failed: {e}")
+            if not fallback:
+                raise
+            return audio
 
     def blendshape_postprocess(self,
-                               bs_array: np.ndarray
+                               bs_array: np.ndarray,
+                               volume: np.ndarray = None,
+                               movement_smooth: bool = False,
+                               brow_movement: bool = False,
+                               postprocess: PostProcessPipeline = None,
+                               rng: np.random.Generator = None
                                )->np.array:
+        """Post-processes a complete clip; mouth smoothing and brow movement run first when enabled.
+
+        Args:
+            bs_array: Raw (T, 52) expression of the clip
+            volume: Per-frame volume, needed for movement_smooth / brow_movement
+            postprocess: Per-request pipeline from ``self.offline_postprocess.configure(...)``
+            rng: Generator of the random blinks and brows, seeded for reproducible output
+        """
+        pipeline = postprocess or self.offline_postprocess
+        extra_stages = tuple(stage for stage, enabled in (("mouth_smooth", movement_smooth), ("brow", brow_movement))
+                             if enabled and stage not in pipeline.stages)
+        if extra_stages:
+            pipeline = pipeline.configure(stages=extra_stages + pipeline.stages)
+        return pipeline(bs_array, volume=volume, rng=rng)
+
+
+@INFER.register_module()
+class Audio2ExpressionStreamingInfer(Audio2ExpressionInfer):
+    """Streaming engine that only runs the conv feature extractor on new audio.
+
+    The wav2vec2 conv features of already-seen audio are cached in the session context
+    (``encoder_state``); each chunk only computes the features its samples complete and
+    the transformer/decoder run on a bounded left context of ``stream_left_context``
+    frames. Offline inference is unchanged.
+
+    The first window matches Audio2ExpressionInfer up to float rounding. Afterwards the
+    first conv layer's group norm uses statistics of the previous chunks rather than of
+    the current window, and the outputs drift: max abs 0.03 / 0.04 / 0.05 at 1 / 0.5 /
+    0.2 s chunks on random weights, see scripts/benchmark/streaming_encoder.py.
+    """
+
+    def __init__(self, cfg, model=None, verbose=False) -> None:
+        super().__init__(cfg, model=model, verbose=verbose)
+        # imports transformers, like the model itself
+        from models.encoder.wav2vec import StreamingFeatureEncoder
+
+        self.max_frame_length = cfg.get("stream_left_context", self.max_frame_length)
+        self.stream_encoder = StreamingFeatureEncoder(
+            self.backbone.audio_encoder.feature_extractor,
+            window_samples=self.cfg.audio_sr * self.max_frame_length // 30,
+        )
+
+    def prepare_streaming_input(self,
+                                audio: np.ndarray,
+                                ssr: float,
+                                context: dict,
+                                id_idx: int = None,
+                                postprocess: PostProcessPipeline = None) -> dict:
+        if (context is None):
+            context = DEFAULT_CONTEXT.copy()
+
+        output_context = DEFAULT_CONTEXT.copy()
+
+        # the torch backend computes the volumes of the whole batch on the device instead
+        volume = self.chunk_volume(audio, ssr) if self.postprocess_backend == "numpy" else None
+
+        if (ssr != self.cfg.audio_sr):
+            in_audio = librosa.resample(audio.astype(np.float32), orig_sr=ssr, target_sr=self.cfg.audio_sr)
+        else:
+            in_audio = audio.astype(np.float32)
+
+        start_frame = int(self.max_frame_length - in_audio.shape[0] / self.cfg.audio_sr * 30)
+
+        encoder_state = context.get('encoder_state')
+        if (context['is_initial_input'] or (encoder_state is None)):
+            # prime the conv caches with silence so the first window is full length
+            encoder_state = self.stream_encoder.init_state()
+            blank_audio_length = max(self.stream_encoder.window_samples - in_audio.shape[0], 0)
+            in_audio = np.concatenate([np.zeros(blank_audio_length, dtype=np.float32), in_audio])
+        else:
+            # the session keeps its state until the chunk succeeds and the new context is stored
+            encoder_state = self.stream_encoder.copy_state(encoder_state)
+        output_context['encoder_state'] = encoder_state
+
+        return {'context': context,
+                'output_context': output_context,
+                'input_audio': in_audio,
+                'volume': volume,
+                'start_frame': start_frame,
+                'id_idx': self.cfg.id_idx if id_idx is None else id_idx,
+                'postprocess': postprocess,
+                'chunk_audio': audio,
+                'ssr': ssr}
+
+    def build_streaming_batch(self, requests: list) -> dict:
+        # the conv caches are per session, only the bounded feature windows are batched
+        extract_features = []
+        for request in requests:
+            audio = torch.from_numpy(request['input_audio']).to(self.device, non_blocking=True)[None, ...]
+            extract_features.append(self.stream_encoder(audio, request['output_context']['encoder_state']))
+
+        return {'id_idx': self.identity_indices([request['id_idx'] for request in requests]),
+                'extract_features': torch.cat(extract_features, dim=0),
+                'time_steps': self.max_frame_length}
+
+
+@INFER.register_module()
+class Audio2ExpressionExportedInfer(Audio2ExpressionInfer):
+    """Runs a model exported by engines/export.py instead of the Python model.
+
+    ``exported_model`` is the export directory; weights, ``precision`` and
+    ``optimize_for_inference`` are those of the export. Streaming windows are encoded in full
+    like Audio2ExpressionInfer does, the exported graphs have no incremental conv encoder.
+    """
+
+    def build_model(self):
+        path = self.cfg.get("exported_model", None)
+        if not path:
+            raise RuntimeError("=> Audio2ExpressionExportedInfer needs exported_model, see engines/export.py")
+        self.logger.info(f"Loading exported model at: {path}")
+        model = ExportedAudio2Expression(path, self.device)
+        meta = model.meta
+        if meta["num_identity_classes"] != self.cfg.model.backbone.num_identity_classes:
+            raise ValueError(f"Exported model has {meta['num_identity_classes']} identities, "
+                             f"config {self.cfg.model.backbone.num_identity_classes}")
+        # the precision was traced into the graphs
+        self.precision, self.dtype = meta["precision"], PRECISIONS[meta["precision"]]
+        self.logger.info(f"=> Loaded exported model '{path}' ({meta['format']}, {meta['precision']}, "
+                         f"exported from '{meta['weight']}')")
+        return model
+
+    def prepare_model(self, model):
+        return model
 
-        bs_array, _ = apply_savitzky_golay_smoothing(bs_array, window_length=5)
-        bs_array = symmetrize_blendshapes(bs_array)
-        bs_array = apply_random_eye_blinks(bs_array)
+    def autocast(self):
+        return contextlib.nullcontext()
 
-        return bs_array
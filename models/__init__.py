@@ -1,7 +1,18 @@
+from importlib import import_module
+
 from .builder import build_model
 
-from .default import DefaultEstimator
+# Estimators and backbones register themselves when imported, which build_model does on first
+# use: importing the light modules of this package (postprocess, utils, exported) does not
+# load transformers.
+_LAZY_ATTRIBUTES = {
+    "DefaultEstimator": ".default",
+    # Backbones
+    "Audio2Expression": ".network",
+}
 
-# Backbones
-from .network import Audio2Expression
 
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return getattr(import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
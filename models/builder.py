@@ -2,12 +2,19 @@
 Modified by https://github.com/Pointcept/Pointcept
 """
 
+from importlib import import_module
+
 from utils.registry import Registry
 
 MODELS = Registry("models")
 MODULES = Registry("modules")
 
+# modules registering into MODELS, imported on the first build
+MODEL_MODULES = ("models.default", "models.network")
+
 
 def build_model(cfg):
     """Build models."""
+    for module in MODEL_MODULES:
+        import_module(module)
     return MODELS.build(cfg)
@@ -8,6 +8,7 @@ from torch.nn import BCEWithLogitsLoss, CrossEntropyLoss, MSELoss
 
 from dataclasses import dataclass
 from transformers import Wav2Vec2Model, Wav2Vec2PreTrainedModel
+from transformers.models.wav2vec2.modeling_wav2vec2 import Wav2Vec2Attention
 from transformers.modeling_outputs import BaseModelOutput
 from transformers.file_utils import ModelOutput
 
@@ -78,10 +79,53 @@ def linear_interpolation(features, input_fps, output_fps, output_len=None):
     return output_features.transpose(1, 2)
 
 
+class Wav2Vec2SdpaAttention(Wav2Vec2Attention):
+    """Wav2Vec2Attention running on the fused ``F.scaled_dot_product_attention`` kernels.
+
+    Same parameters as the eager module, so checkpoints load unchanged. Falls back to the
+    eager implementation when attention weights, head masks or decoder/cross-attention
+    features are requested.
+    """
+
+    def forward(
+            self,
+            hidden_states,
+            key_value_states=None,
+            past_key_value=None,
+            attention_mask=None,
+            layer_head_mask=None,
+            output_attentions=False,
+    ):
+        if output_attentions or layer_head_mask is not None or key_value_states is not None \
+                or past_key_value is not None or self.is_decoder:
+            return super().forward(hidden_states, key_value_states, past_key_value,
+                                   attention_mask, layer_head_mask, output_attentions)
+
+        bsz, tgt_len, _ = hidden_states.size()
+        # (B, T, C) -> (B, H, T, D); the kernel applies the 1/sqrt(D) scaling itself
+        query_states = self._shape(self.q_proj(hidden_states), tgt_len, bsz)
+        key_states = self._shape(self.k_proj(hidden_states), tgt_len, bsz)
+        value_states = self._shape(self.v_proj(hidden_states), tgt_len, bsz)
+
+        attn_output = F.scaled_dot_product_attention(
+            query_states,
+            key_states,
+            value_states,
+            attn_mask=attention_mask,
+            dropout_p=self.dropout if self.training else 0.0,
+        )
+        attn_output = attn_output.transpose(1, 2).reshape(bsz, tgt_len, self.embed_dim)
+        return self.out_proj(attn_output), None, None
+
+
 class Wav2Vec2Model(Wav2Vec2Model):
     def __init__(self, config):
         super().__init__(config)
         self.lm_head = nn.Linear(1024, 32)
+        # swap the eager attention for the fused kernels, parameters are shared as-is
+        for module in self.modules():
+            if type(module) is Wav2Vec2Attention:
+                module.__class__ = Wav2Vec2SdpaAttention
 
     def forward(
             self,
@@ -92,15 +136,37 @@ class Wav2Vec2Model(Wav2Vec2Model):
             return_dict=None,
             frame_num=None
     ):
-        self.config.output_attentions = True
+        extract_features = self.feature_extractor(input_values)
+        return self.forward_features(
+            extract_features,
+            attention_mask=attention_mask,
+            output_attentions=output_attentions,
+            output_hidden_states=output_hidden_states,
+            return_dict=return_dict,
+            frame_num=frame_num,
+        )
+
+    def forward_features(
+            self,
+            extract_features,
+            attention_mask=None,
+            output_attentions=None,
+            output_hidden_states=None,
+            return_dict=None,
+            frame_num=None
+    ):
+        """Runs everything after the conv feature extractor on (B, C, T) conv features.
+
+        Attention maps and per-layer hidden states are only computed when explicitly
+        requested; otherwise only ``last_hidden_state`` is produced.
+        """
         output_attentions = output_attentions if output_attentions is not None else self.config.output_attentions
         output_hidden_states = (
             output_hidden_states if output_hidden_states is not None else self.config.output_hidden_states
         )
         return_dict = return_dict if return_dict is not None else self.config.use_return_dict
 
-        hidden_states = self.feature_extractor(input_values)
-        hidden_states = hidden_states.transpose(1, 2)
+        hidden_states = extract_features.transpose(1, 2)
 
         hidden_states = linear_interpolation(hidden_states, 50, 30, output_len=frame_num)
 
@@ -134,6 +200,94 @@ class Wav2Vec2Model(Wav2Vec2Model):
         )
 
 
+class StreamingFeatureEncoder:
+    """Incrementally runs the wav2vec2 conv feature extractor over an audio stream.
+
+    Every conv layer keeps the part of its input it has not consumed yet, so a call only
+    computes the conv outputs completed by the newly arrived audio. The group norm of the
+    first layer normalizes over time; it uses statistics accumulated over a bounded
+    history (``window_samples`` of audio) instead of the whole stream. Per-stream state
+    lives in a plain dict created by :meth:`init_state`.
+    """
+
+    def __init__(self, feature_extractor, window_samples):
+        self.conv_layers = feature_extractor.conv_layers
+        self.window_samples = window_samples
+        self.window_features = self.output_length(window_samples)
+        first_conv = self.conv_layers[0].conv
+        self.norm_window = (window_samples - first_conv.kernel_size[0]) // first_conv.stride[0] + 1
+
+    def output_length(self, num_samples):
+        """Number of conv feature frames produced for ``num_samples`` audio samples."""
+        for layer in self.conv_layers:
+            num_samples = (num_samples - layer.conv.kernel_size[0]) // layer.conv.stride[0] + 1
+        return max(num_samples, 0)
+
+    def init_state(self):
+        return {
+            'tails': [None] * len(self.conv_layers),
+            'norm_stats': [],
+            'features': None,
+        }
+
+    @staticmethod
+    def copy_state(state):
+        """Copy of ``state`` that a call can advance while ``state`` stays unchanged.
+
+        Calls only replace the cached tensors, never write into them, so copying the
+        containers is enough.
+        """
+        return {
+            'tails': list(state['tails']),
+            'norm_stats': list(state['norm_stats']),
+            'features': state['features'],
+        }
+
+    def _group_norm_conv(self, layer, x, state):
+        hidden_states = layer.conv(x)
+        stats = state['norm_stats']
+        stats.append((hidden_states.double().sum(-1),
+                      hidden_states.double().pow(2).sum(-1),
+                      hidden_states.shape[-1]))
+        # drop the oldest statistics once the remaining ones still cover the window
+        while len(stats) > 1 and sum(s[2] for s in stats[1:]) >= self.norm_window:
+            stats.pop(0)
+        count = sum(s[2] for s in stats)
+        mean = sum(s[0] for s in stats) / count
+        var = (sum(s[1] for s in stats) / count - mean.pow(2)).clamp(min=0)
+
+        norm = layer.layer_norm
+        scale = (var + norm.eps).rsqrt().to(hidden_states.dtype)
+        hidden_states = (hidden_states - mean.to(hidden_states.dtype)[..., None]) * scale[..., None]
+        hidden_states = hidden_states * norm.weight[:, None] + norm.bias[:, None]
+        return layer.activation(hidden_states)
+
+    def __call__(self, input_values, state):
+        """Consumes (B, S) audio samples and returns the cached (B, C, T) conv feature window."""
+        hidden_states = input_values[:, None]
+        for i, layer in enumerate(self.conv_layers):
+            kernel_size, stride = layer.conv.kernel_size[0], layer.conv.stride[0]
+            if state['tails'][i] is not None:
+                hidden_states = torch.cat([state['tails'][i], hidden_states], dim=-1)
+            num_frames = (hidden_states.shape[-1] - kernel_size) // stride + 1
+            num_frames = max(num_frames, 0)
+            state['tails'][i] = hidden_states[..., num_frames * stride:]
+            if num_frames == 0:
+                hidden_states = None
+                break
+            hidden_states = hidden_states[..., :(num_frames - 1) * stride + kernel_size]
+            if isinstance(getattr(layer, 'layer_norm', None), nn.GroupNorm):
+                hidden_states = self._group_norm_conv(layer, hidden_states, state)
+            else:
+                hidden_states = layer(hidden_states)
+
+        if hidden_states is not None:
+            if state['features'] is not None:
+                hidden_states = torch.cat([state['features'], hidden_states], dim=-1)
+            state['features'] = hidden_states[..., -self.window_features:]
+        return state['features']
+
+
 @dataclass
 class SpeechClassifierOutput(ModelOutput):
     loss: Optional[torch.FloatTensor] = None
@@ -0,0 +1,115 @@
+"""
+Runtime of Audio2Expression graphs exported by engines/export.py.
+
+An export directory holds the identity-independent audio encoder and the identity-conditioned
+decoder as two graphs with tensor signatures, plus ``export.json`` describing them:
+
+    encode: audio (B, samples) float32, time_steps () int64 -> features (B, hidden_dim, time_steps) float32
+    decode: features (B, hidden_dim, T) float32, id_idx (B,) int64 -> expression (B, T, expression_dim) float32
+
+Batch, sample and frame axes are dynamic. :class:`ExportedAudio2Expression` puts them behind the
+interface of DefaultEstimator / Audio2Expression that the inference engines call, without
+importing the Python model or transformers.
+"""
+
+import os
+import json
+import math
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+META_FILE = "export.json"
+
+# graph file name pattern per format
+EXPORT_FORMATS = {
+    "torch_export": "{}.pt2",
+    "onnx": "{}.onnx",
+}
+
+
+def load_export_meta(path: str) -> dict:
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.isfile(meta_path):
+        raise FileNotFoundError(f"No exported model at '{path}' (missing {META_FILE})")
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get("format") not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {meta.get('format')}, expected one of {list(EXPORT_FORMATS)}")
+    return meta
+
+
+class OnnxGraph(nn.Module):
+    """An ONNX Runtime session called with and returning torch tensors."""
+
+    def __init__(self, path: str, device: torch.device):
+        super().__init__()
+        import onnxruntime
+
+        providers = ["CPUExecutionProvider"]
+        if device.type == "cuda":
+            providers.insert(0, ("CUDAExecutionProvider", {"device_id": device.index or 0}))
+        self.session = onnxruntime.InferenceSession(path, providers=providers)
+        self.input_names = [node.name for node in self.session.get_inputs()]
+        self.device = device
+
+    def forward(self, *inputs):
+        feed = {name: value.detach().cpu().numpy() for name, value in zip(self.input_names, inputs)}
+        output = self.session.run(None, feed)[0]
+        return torch.from_numpy(np.ascontiguousarray(output)).to(self.device, non_blocking=True)
+
+
+class ExportedBackbone(nn.Module):
+    """Audio2Expression.encode_audio / decode_expression / forward on the exported graphs."""
+
+    def __init__(self, path: str, meta: dict, device: torch.device):
+        super().__init__()
+        self.meta = meta
+        self.device = device
+        files = {name: os.path.join(path, EXPORT_FORMATS[meta["format"]].format(name)) for name in ("encode", "decode")}
+        if meta["format"] == "onnx":
+            self.encode_graph = OnnxGraph(files["encode"], device)
+            self.decode_graph = OnnxGraph(files["decode"], device)
+        else:
+            # the graphs keep the device they were traced on, tensors created inside included
+            if meta["device"] != device.type:
+                raise ValueError(f"Model exported on {meta['device']} cannot run on {device}, export it there")
+            self.encode_graph = torch.export.load(files["encode"]).module()
+            self.decode_graph = torch.export.load(files["decode"]).module()
+        # identifies the exported weights in module_digest, whatever the graphs keep in their state_dict
+        self.register_buffer("source_digest", torch.tensor(list(bytes.fromhex(meta["digest"])), dtype=torch.uint8))
+
+    def forward(self, input_dict):
+        return self.decode_expression(self.encode_audio(input_dict), input_dict['id_idx'])
+
+    def encode_audio(self, input_dict):
+        if 'extract_features' in input_dict:
+            raise NotImplementedError("Exported models encode raw audio only, not streaming conv features")
+        audio = input_dict['input_audio_array'].flatten(start_dim=1).float()
+        time_steps = input_dict.get('time_steps', math.ceil(audio.shape[1] / 16000 * 30))
+        return self.encode_graph(audio, torch.tensor(time_steps, dtype=torch.long, device=audio.device))
+
+    def decode_expression(self, audio_features, id_idx):
+        if id_idx.is_floating_point() or id_idx.dim() != 1:
+            raise ValueError("Exported models take (B,) integer identity indices")
+        return self.decode_graph(audio_features.float(), id_idx.long())
+
+
+class ExportedAudio2Expression(nn.Module):
+    """Inference-only stand-in for DefaultEstimator(Audio2Expression) loaded from an export directory."""
+
+    def __init__(self, path: str, device: torch.device = torch.device("cpu")):
+        super().__init__()
+        self.meta = load_export_meta(path)
+        self.backbone = ExportedBackbone(path, self.meta, device)
+        self.training = False
+
+    def train(self, mode: bool = True):
+        # exported graphs are frozen in eval mode and refuse train() / eval()
+        if mode:
+            raise RuntimeError("Exported models are inference-only")
+        return self
+
+    def forward(self, input_dict):
+        return dict(pred_exp=self.backbone(input_dict))
@@ -5,10 +5,8 @@ import torch
 
 import torch.nn as nn
 import torch.nn.functional as F
-import torchaudio as ta
 
 from models.encoder.wav2vec import Wav2Vec2Model
-from models.encoder.wavlm import WavLMModel
 
 from models.builder import MODELS
 
@@ -30,21 +28,32 @@ class Audio2Expression(nn.Module):
                  use_transformer: bool = False,
                  num_attention_heads: int = 8,
                  num_transformer_layers: int = 6,
+                 load_pretrained_encoder: bool = True,
                  ):
+        """
+        load_pretrained_encoder=False builds the encoder from its config only (config.json of
+        pretrained_encoder_path, or wav2vec2_config_path), for checkpoints holding every weight.
+        """
         super().__init__()
 
         self.device = device
 
         # Initialize audio feature encoder
         if pretrained_encoder_type == 'wav2vec':
-            if os.path.exists(pretrained_encoder_path):
+            if load_pretrained_encoder and os.path.exists(pretrained_encoder_path):
                 self.audio_encoder = Wav2Vec2Model.from_pretrained(pretrained_encoder_path)
             else:
-                config = Wav2Vec2Config.from_pretrained(wav2vec2_config_path)
+                config_path = pretrained_encoder_path if os.path.isdir(pretrained_encoder_path) else wav2vec2_config_path
+                config = Wav2Vec2Config.from_pretrained(config_path)
                 self.audio_encoder = Wav2Vec2Model(config)
             encoder_output_dim = 768
         elif pretrained_encoder_type == 'wavlm':
-            self.audio_encoder = WavLMModel.from_pretrained(pretrained_encoder_path)
+            from models.encoder.wavlm import WavLMModel
+
+            if load_pretrained_encoder:
+                self.audio_encoder = WavLMModel.from_pretrained(pretrained_encoder_path)
+            else:
+                self.audio_encoder = WavLMModel(WavLMModel.config_class.from_pretrained(pretrained_encoder_path))
             encoder_output_dim = 768
         else:
             raise NotImplementedError(f"Encoder type {pretrained_encoder_type} not supported")
@@ -70,6 +79,24 @@ class Audio2Expression(nn.Module):
 
         self.output_proj = nn.Linear(hidden_dim, expression_dim)
 
+        # set by optimize_for_inference, decode_expression then runs the fused channels-last path
+        self.fused_inference = False
+
+    def optimize_for_inference(self):
+        """Switches decode_expression to a fused (B, T, C) path for eval-mode inference.
+
+        Conv, bias and residual conv of every ConvNormRelu become one linear layer over time
+        windows, activations stay channels-last from the identity concat to the output
+        projection so the LayerNorm transposes disappear, and dropout is skipped. The
+        fused weights are copies: call again after loading or changing weights.
+        """
+        self.eval()
+        for module in self.modules():
+            if isinstance(module, ConvNormRelu):
+                module.fuse_for_inference()
+        self.fused_inference = True
+        return self
+
     def freeze_encoder_parameters(self, do_freeze=False):
 
         for name, param in self.audio_encoder.named_parameters():
@@ -79,7 +106,15 @@ class Audio2Expression(nn.Module):
                 param.requires_grad = (not do_freeze)
 
     def forward(self, input_dict):
+        audio_features = self.encode_audio(input_dict)
+        return self.decode_expression(audio_features, input_dict['id_idx'])
 
+    def encode_audio(self, input_dict):
+        """Identity-independent part of the forward: (B, hidden_dim, time_steps) audio features.
+
+        The features can be decoded for any number of identities with :meth:`decode_expression`
+        without running the audio encoder again.
+        """
         if 'time_steps' not in input_dict:
             audio_length = input_dict['input_audio_array'].shape[1]
             time_steps = math.ceil(audio_length / 16000 * 30)
@@ -87,14 +122,36 @@ class Audio2Expression(nn.Module):
             time_steps = input_dict['time_steps']
 
         # Process audio through encoder
-        audio_input = input_dict['input_audio_array'].flatten(start_dim=1)
-        hidden_states = self.audio_encoder(audio_input, frame_num=time_steps).last_hidden_state
+        if 'extract_features' in input_dict:
+            # conv features already computed, e.g. incrementally by a streaming engine
+            hidden_states = self.audio_encoder.forward_features(input_dict['extract_features'],
+                                                                frame_num=time_steps).last_hidden_state
+        else:
+            audio_input = input_dict['input_audio_array'].flatten(start_dim=1)
+            hidden_states = self.audio_encoder(audio_input, frame_num=time_steps).last_hidden_state
 
         # Project features to hidden dimension
-        audio_features = self.feature_projection(hidden_states).transpose(1, 2)
+        return self.feature_projection(hidden_states).transpose(1, 2)
+
+    def precompute_identity_table(self):
+        """Inference mode: looks style embeddings up in a table instead of convolving one-hot codes."""
+        self.identity_encoder.precompute_identity_table()
+
+    def decode_expression(self, audio_features, id_idx):
+        """Identity-conditioned part of the forward: (B, time_steps, expression_dim) in [0, 1].
+
+        ``id_idx`` holds one style per row of ``audio_features``, as (B, num_identity_classes)
+        one-hot codes or (B,) integer indices; features of a single clip are decoded in several
+        styles at once by repeating them along the batch.
+        """
+        if self.fused_inference:
+            audio_features = self.identity_encoder.forward_channels_last(audio_features.transpose(1, 2), id_idx)
+            for block in self.decoder[0]:
+                audio_features = block.forward_channels_last(audio_features)
+            return torch.sigmoid(self.output_proj(audio_features).float())
 
         # Process identity-conditioned features
-        audio_features = self.identity_encoder(audio_features, identity=input_dict['id_idx'])
+        audio_features = self.identity_encoder(audio_features, identity=id_idx)
 
         # Refine features through decoder
         audio_features = self.decoder[0](audio_features)
@@ -103,7 +160,8 @@ class Audio2Expression(nn.Module):
         audio_features = audio_features.permute(0, 2, 1)
         expression_params = self.output_proj(audio_features)
 
-        return torch.sigmoid(expression_params)
+        # fp32 output whatever precision the network runs in
+        return torch.sigmoid(expression_params.float())
 
 
 class AudioIdentityEncoder(nn.Module):
@@ -128,6 +186,9 @@ class AudioIdentityEncoder(nn.Module):
         self.grus = nn.GRU(hidden_dim, hidden_dim, 1, batch_first=True)
         self.dropout = nn.Dropout(dropout_ratio)
 
+        # (num_identity_classes, identity_feat_dim) id_mlp outputs, see precompute_identity_table
+        self.register_buffer('identity_table', None, persistent=False)
+
         self.use_transformer = use_transformer
         if(self.use_transformer):
             encoder_layer = nn.TransformerEncoderLayer(d_model=hidden_dim, nhead=num_attention_heads, dim_feedforward= 2 * hidden_dim, batch_first=True)
@@ -139,8 +200,13 @@ class AudioIdentityEncoder(nn.Module):
                 time_steps: int = None) -> tuple:
 
         audio_features = self.dropout(audio_features)
-        identity = identity.reshape(identity.shape[0], -1, 1).repeat(1, 1, audio_features.shape[2]).to(torch.float32)
-        identity = self.id_mlp(identity)
+        if not identity.is_floating_point() and identity.dim() == 1:
+            # integer indices: the 1x1 conv of a one-hot code is a column of its weight plus bias
+            identity = self.lookup_identity(identity).to(audio_features.dtype)
+            identity = identity[:, :, None].expand(-1, -1, audio_features.shape[2])
+        else:
+            identity = identity.reshape(identity.shape[0], -1, 1).repeat(1, 1, audio_features.shape[2]).to(torch.float32)
+            identity = self.id_mlp(identity)
         audio_features = torch.cat([audio_features, identity], dim=1)
 
         x = self.first_net(audio_features)
@@ -155,6 +221,44 @@ class AudioIdentityEncoder(nn.Module):
 
         return x
 
+    def forward_channels_last(self,
+                              audio_features: torch.Tensor,
+                              identity: torch.Tensor = None,
+                              time_steps: int = None) -> torch.Tensor:
+        """Inference forward on (B, T, C) features, see Audio2Expression.optimize_for_inference."""
+        if identity.is_floating_point() or identity.dim() != 1:
+            identity = F.linear(identity.reshape(identity.shape[0], -1).to(self.id_mlp.weight.dtype),
+                                self.id_mlp.weight[:, :, 0], self.id_mlp.bias)
+        else:
+            identity = self.lookup_identity(identity)
+        identity = identity.to(audio_features.dtype)[:, None, :].expand(-1, audio_features.shape[1], -1)
+        x = self.first_net.forward_channels_last(torch.cat([audio_features, identity], dim=2))
+
+        if time_steps is not None:
+            x = F.interpolate(x.transpose(1, 2), size=time_steps, align_corners=False, mode='linear').transpose(1, 2)
+
+        if(self.use_transformer):
+            x = self.transformer_encoder(x)
+
+        return x
+
+    def lookup_identity(self, identity: torch.Tensor) -> torch.Tensor:
+        """(B, identity_feat_dim) style embeddings of (B,) integer indices."""
+        table = self.identity_table if self.identity_table is not None else self.identity_embeddings()
+        return table[identity]
+
+    def identity_embeddings(self) -> torch.Tensor:
+        """(num_identity_classes, identity_feat_dim) output of id_mlp for every one-hot code."""
+        embeddings = self.id_mlp.weight[:, :, 0].t()
+        if self.id_mlp.bias is not None:
+            embeddings = embeddings + self.id_mlp.bias
+        return embeddings
+
+    @torch.no_grad()
+    def precompute_identity_table(self):
+        """Stores identity_embeddings() so inference skips id_mlp; call again after changing its weights."""
+        self.identity_table = self.identity_embeddings().detach().clone()
+
 class ConvNormRelu(nn.Module):
     '''
     (B,C_in,H,W) -> (B, C_out, H, W)
@@ -271,6 +375,9 @@ class ConvNormRelu(nn.Module):
         else:
             self.relu = nn.ReLU()
 
+        # linear layer over time windows replacing conv (+ residual conv), see fuse_for_inference
+        self.fused = None
+
     def forward(self, x, **kwargs):
         if self.norm_type == 'ln':
             out = self.dropout(self.conv(x))
@@ -282,6 +389,61 @@ class ConvNormRelu(nn.Module):
             out += residual
         return self.relu(out)
 
+    @torch.no_grad()
+    def fuse_for_inference(self) -> bool:
+        """Builds ``fused`` for forward_channels_last, False for layouts it does not cover.
+
+        A stride-1 Conv1d over (B, T, C) activations is a linear layer over the unfolded
+        windows of ``kernel_size`` frames; a residual conv with the same window shares that
+        GEMM as extra output channels, and an eval-mode BatchNorm is folded into the weights.
+        """
+        conv = self.conv
+        self.fused = None
+        if (not isinstance(conv, nn.Conv1d) or conv.stride != (1,) or conv.dilation != (1,)
+                or conv.groups != 1 or self.norm_type not in ('ln', 'bn')):
+            return False
+        convs = [conv]
+        if self.residual and not isinstance(self.residual_layer, nn.Identity):
+            residual_conv = self.residual_layer[0]
+            if (residual_conv.kernel_size, residual_conv.stride, residual_conv.padding, residual_conv.dilation) != \
+                    (conv.kernel_size, conv.stride, conv.padding, conv.dilation):
+                return False
+            convs.append(residual_conv)
+
+        weights, biases = [], []
+        for layer in convs:
+            weights.append(layer.weight)
+            biases.append(layer.bias if layer.bias is not None else torch.zeros_like(layer.weight[:, 0, 0]))
+        if self.norm_type == 'bn':
+            scale = self.norm.weight / torch.sqrt(self.norm.running_var + self.norm.eps)
+            weights[0] = weights[0] * scale[:, None, None]
+            biases[0] = (biases[0] - self.norm.running_mean) * scale + self.norm.bias
+        # (C_out, C_in, k) flattened C_in-major, the element order of Tensor.unfold windows
+        weight = torch.cat(weights).flatten(1)
+        self.fused = nn.Linear(weight.shape[1], weight.shape[0]).to(weight)
+        self.fused.weight.copy_(weight)
+        self.fused.bias.copy_(torch.cat(biases))
+        return True
+
+    def forward_channels_last(self, x):
+        """(B, T, C_in) -> (B, T, C_out) with the fused layer, dropout skipped (inference only)."""
+        if self.fused is None:
+            return self(x.transpose(1, 2)).transpose(1, 2)
+        kernel_size, padding = self.conv.kernel_size[0], self.conv.padding[0]
+        windows = F.pad(x, (0, 0, padding, padding)).unfold(1, kernel_size, 1)
+        out = self.fused(windows.flatten(2))
+        out_channels = self.conv.out_channels
+        residual = x if self.residual else None
+        if out.shape[-1] != out_channels:
+            out, residual = out.split(out_channels, dim=-1)
+        if self.norm_type == 'ln':
+            out = self.norm(out)
+        if residual is not None:
+            out = out + residual
+        if isinstance(self.relu, nn.ReLU):
+            return out.relu_()
+        return self.relu(out)
+
 """ from https://github.com/ai4r/Gesture-Generation-from-Trimodal-Context.git """
 class SeqTranslator1D(nn.Module):
     '''
@@ -326,6 +488,11 @@ class SeqTranslator1D(nn.Module):
     def forward(self, x):
         return self.conv_layers(x)
 
+    def forward_channels_last(self, x):
+        for layer in self.conv_layers:
+            x = layer.forward_channels_last(x)
+        return x
+
 
 def audio_chunking(audio: torch.Tensor, frame_rate: int = 30, chunk_size: int = 16000):
     """
@@ -349,6 +516,7 @@ class MeshtalkEncoder(nn.Module):
         :param model_name: name of the model, used to load and save the model
         """
         super().__init__()
+        import torchaudio as ta
 
         self.melspec = ta.transforms.MelSpectrogram(
             sample_rate=16000, n_fft=2048, win_length=800, hop_length=160, n_mels=80
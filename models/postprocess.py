@@ -0,0 +1,457 @@
+"""
+Expression post-processing as one pipeline object, planned once and run in place.
+"""
+
+import functools
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.ndimage import correlate1d
+from scipy.signal import savgol_coeffs
+
+from models.utils import (
+    ARKitBlendShape,
+    ARKitLeftRightPair,
+    MOUTH_BLENDSHAPE_INDICES,
+    smooth_mouth_movements,
+    apply_random_brow_movement,
+    apply_random_eye_blinks,
+    apply_random_eye_blinks_context,
+)
+
+# stage order of the offline (/api/infer, infer()) and streaming paths
+OFFLINE_STAGES = ("savgol", "symmetrize", "blink")
+STREAMING_STAGES = ("mouth_smooth", "frame_blending", "savgol", "symmetrize", "blink")
+
+# stages with a batched torch implementation (PostProcessPipeline.run_batch)
+TORCH_STAGES = ("mouth_smooth", "frame_blending", "savgol", "symmetrize")
+
+SYMMETRIZE_MODES = ("average", "max", "min", "left_dominant", "right_dominant")
+BLINK_MODES = ("context", "interval")
+
+# longest Savitzky-Golay window accepted, about 1 s at 30 fps
+MAX_SAVGOL_WINDOW = 31
+# following frames a streaming frame may use, each adds a frame of latency at chunk boundaries
+MAX_SAVGOL_LOOKAHEAD = 2
+
+
+@functools.lru_cache(maxsize=64)
+def _savgol_filter_coeffs(window: int, polyorder: int) -> np.ndarray:
+    coeffs = savgol_coeffs(window, polyorder, use="dot")
+    coeffs.setflags(write=False)
+    return coeffs
+
+
+@functools.lru_cache(maxsize=64)
+def _causal_savgol_coeffs(window: int, polyorder: int, lookahead: int) -> np.ndarray:
+    """Row k fits the window ending k frames after the smoothed frame."""
+    coeffs = np.stack([savgol_coeffs(window, polyorder, pos=window - 1 - k, use="dot") for k in range(lookahead + 1)])
+    coeffs.setflags(write=False)
+    return coeffs
+
+
+def rms_volume(audio: torch.Tensor, frame_length: int, hop_length: int) -> torch.Tensor:
+    """``librosa.feature.rms`` (centered, zero padded) of a (B, N) batch, returns (B, frames).
+
+    Clips of different lengths can share a batch when zero padded on the right; frames
+    past a clip's own frame count are then meaningless and must be dropped by the caller.
+    """
+    padded = F.pad(audio, (frame_length // 2, frame_length // 2))
+    frames = padded.unfold(-1, frame_length, hop_length)
+    return frames.square().mean(dim=-1).sqrt()
+
+
+class PostProcessPipeline:
+    """Runs the expression post-processing stages in place on one float32 (N, 52) buffer.
+
+    Index tables are computed when the pipeline is built and Savitzky-Golay coefficients
+    come from a bounded process-wide cache; :meth:`configure` derives a pipeline with
+    per-request options that shares them, so switching stages, modes or windows does not
+    re-plan anything recently seen.
+
+    Stages run in the order given:
+        mouth_smooth    damp the mouth in silent regions (needs the volume track)
+        brow            random brow raises on loud regions (needs the volume track)
+        frame_blending  blend new frames from the last processed frame (or neutral)
+        savgol          Savitzky-Golay smoothing over time, clipped to [0, 1]; with a session
+                        ``state`` only the new frames are smoothed (see _savgol_streaming)
+        symmetrize      left/right blendshape symmetrization
+        blink           random eye blinks, "context" keeps processed frames untouched,
+                        "interval" fills the whole clip
+    """
+
+    STAGES = ("mouth_smooth", "brow", "frame_blending", "savgol", "symmetrize", "blink")
+
+    def __init__(self,
+                 stages=STREAMING_STAGES,
+                 savgol_window=5,
+                 savgol_polyorder=2,
+                 savgol_lookahead=2,
+                 symmetrize="average",
+                 blink="context",
+                 silence_threshold=0.001,
+                 min_silence_duration=7,
+                 silence_blend_window=3,
+                 initial_blend_window=3,
+                 subsequent_blend_window=5):
+        name_to_idx = {name: i for i, name in enumerate(ARKitBlendShape)}
+        pairs = [(name_to_idx[left], name_to_idx[right]) for left, right in ARKitLeftRightPair
+                 if left in name_to_idx and right in name_to_idx]
+        self._left_indices = np.array([left for left, _ in pairs])
+        self._right_indices = np.array([right for _, right in pairs])
+        self._blend_weights = {}
+        self.options = {}
+        self._apply(dict(
+            stages=stages,
+            savgol_window=savgol_window,
+            savgol_polyorder=savgol_polyorder,
+            savgol_lookahead=savgol_lookahead,
+            symmetrize=symmetrize,
+            blink=blink,
+            silence_threshold=silence_threshold,
+            min_silence_duration=min_silence_duration,
+            silence_blend_window=silence_blend_window,
+            initial_blend_window=initial_blend_window,
+            subsequent_blend_window=subsequent_blend_window,
+        ))
+
+    def configure(self, **options) -> "PostProcessPipeline":
+        """Returns a pipeline with ``options`` overridden, sharing the precomputed tables.
+
+        Raises:
+            ValueError: For unknown options, stages or modes and invalid windows
+        """
+        if not options:
+            return self
+        unknown = set(options) - set(self.options)
+        if unknown:
+            raise ValueError(f"Unknown post-processing options: {sorted(unknown)}")
+        pipeline = object.__new__(PostProcessPipeline)
+        pipeline.__dict__.update(self.__dict__)
+        pipeline._apply(dict(self.options, **options))
+        return pipeline
+
+    def _apply(self, options: dict) -> None:
+        # a string would be split into its characters
+        if not isinstance(options["stages"], (list, tuple)):
+            raise ValueError(f"stages must be a list of stage names, got {options['stages']!r}")
+        stages = tuple(options["stages"])
+        unknown = [stage for stage in stages if stage not in self.STAGES]
+        if unknown:
+            raise ValueError(f"Unknown post-processing stages {unknown}, expected any of {list(self.STAGES)}")
+        if options["symmetrize"] not in SYMMETRIZE_MODES:
+            raise ValueError(f"Invalid symmetrize mode: {options['symmetrize']}, expected one of {list(SYMMETRIZE_MODES)}")
+        if options["blink"] not in BLINK_MODES:
+            raise ValueError(f"Invalid blink mode: {options['blink']}, expected one of {list(BLINK_MODES)}")
+        window, polyorder = int(options["savgol_window"]), int(options["savgol_polyorder"])
+        if window % 2 == 0 or not 3 <= window <= MAX_SAVGOL_WINDOW:
+            raise ValueError(f"Window length must be odd integer between 3 and {MAX_SAVGOL_WINDOW}")
+        if not 0 <= polyorder < window:
+            raise ValueError("Polynomial order must be >= 0 and < window length")
+        lookahead = int(options["savgol_lookahead"])
+        max_lookahead = min(MAX_SAVGOL_LOOKAHEAD, window // 2)
+        if not 0 <= lookahead <= max_lookahead:
+            raise ValueError(f"savgol_lookahead must be between 0 and {max_lookahead} for window {window}")
+        for key in ("min_silence_duration", "silence_blend_window", "initial_blend_window", "subsequent_blend_window"):
+            if int(options[key]) < 0:
+                raise ValueError(f"{key} must be >= 0")
+
+        self.options = dict(options, stages=stages, savgol_window=window, savgol_polyorder=polyorder,
+                            savgol_lookahead=lookahead)
+        self.stages = stages
+        self._coeffs = _savgol_filter_coeffs(window, polyorder)
+        self._causal_coeffs = _causal_savgol_coeffs(window, polyorder, lookahead)
+        # torch copies of _causal_coeffs by (device, dtype), built on first use by run_batch
+        self._torch_causal_coeffs = {}
+
+    def __call__(self,
+                 expression: np.ndarray,
+                 processed_frames: int = 0,
+                 volume: np.ndarray = None,
+                 state: dict = None,
+                 rng: np.random.Generator = None) -> np.ndarray:
+        """Post-processes an expression array.
+
+        Args:
+            expression: (N, 52) blendshape weights, modified in place if already float32
+            processed_frames: Leading frames already post-processed in a previous chunk
+            volume: Per-frame RMS volume, required by mouth_smooth and brow
+            state: Per-session dict of a streaming session, updated in place; stateful
+                   stages keep what they need of earlier chunks here
+            rng: Random generator of the blink/brow stages; defaults to ``state["rng"]``
+                 (created on first use) for sessions, and to a fresh unseeded one otherwise
+
+        Returns:
+            The processed float32 (N, 52) array
+        """
+        expression = np.ascontiguousarray(expression, dtype=np.float32)
+        if expression.ndim != 2 or expression.shape[1] != 52:
+            raise ValueError("Input must be of shape (N, 52)")
+        if rng is None and state is not None:
+            rng = state.setdefault("rng", np.random.default_rng())
+        for stage in self.stages:
+            getattr(self, f"_{stage}")(expression, processed_frames, volume, state, rng)
+        return expression
+
+    def run_batch(self,
+                  expressions: list,
+                  processed_frames: list,
+                  volumes: list,
+                  states: list) -> list:
+        """Post-processes the buffers of several streaming chunks together on their device.
+
+        The leading stages with a torch implementation (:data:`TORCH_STAGES`) run on one
+        right-aligned (B, T, 52) batch; the result is copied to the host once and the
+        remaining stages (the random blinks, brows) run per chunk in NumPy. Results match
+        ``__call__`` with the same states up to float32 rounding of the smoothing.
+
+        Args:
+            expressions: (N_i, 52) float tensors on one device, already processed frames first
+            processed_frames: Number of already processed leading frames of each buffer
+            volumes: (N_i,) volume tensors, or None to skip the volume based stages
+            states: Per-session state dicts, updated in place (including their ``rng``)
+
+        Returns:
+            List of processed float32 (N_i, 52) NumPy arrays
+        """
+        torch_stages = []
+        for stage in self.stages:
+            # short silent regions blend across each other and need the sequential NumPy path
+            if stage not in TORCH_STAGES or (
+                    stage == "mouth_smooth"
+                    and self.options["min_silence_duration"] < self.options["silence_blend_window"]):
+                break
+            torch_stages.append(stage)
+
+        lengths = [expression.shape[0] for expression in expressions]
+        total = max(lengths)
+        batch = torch.stack([F.pad(expression.float(), (0, 0, total - length, 0))
+                             for expression, length in zip(expressions, lengths)])
+        offsets = torch.tensor([total - length for length in lengths], device=batch.device)
+        processed = offsets + torch.tensor(processed_frames, device=batch.device)
+        volume = None
+        if all(v is not None for v in volumes):
+            # padding is never silent
+            volume = torch.stack([F.pad(v.float(), (total - v.shape[0], 0), value=float("inf")) for v in volumes])
+
+        for stage in torch_stages:
+            getattr(self, f"_torch_{stage}")(batch, offsets, processed, volume, states)
+
+        outputs = batch.cpu().numpy()
+        rest = self.configure(stages=self.stages[len(torch_stages):])
+        numpy_volumes = [v.cpu().numpy() if v is not None else None for v in volumes]
+        return [rest(output[total - length:], frames, clip_volume, state)
+                for output, length, frames, clip_volume, state
+                in zip(outputs, lengths, processed_frames, numpy_volumes, states)]
+
+    # ---------------- torch stages, on a right-aligned (B, T, 52) batch ----------------
+    def _torch_mouth_smooth(self, batch, offsets, processed, volume, states):
+        if volume is None:
+            return
+        total = batch.shape[1]
+        positions = torch.arange(total, device=batch.device).expand_as(volume)
+        low = volume < self.options["silence_threshold"]
+        previous_low = F.pad(low[:, :-1], (1, 0), value=False)
+        next_low = F.pad(low[:, 1:], (0, 1), value=False)
+        # first and last position of the silent run each position belongs to
+        starts = torch.cummax(torch.where(low & ~previous_low, positions, -1), dim=1).values
+        ends = torch.where(low & ~next_low, positions, total).flip(1).cummin(dim=1).values.flip(1)
+        silent = low & (ends - starts + 1 >= self.options["min_silence_duration"])
+        if not silent.any():
+            return
+
+        scale = torch.where(silent, 0.1, 1.0).to(batch.dtype)
+        mouth = torch.as_tensor(MOUTH_BLENDSHAPE_INDICES, device=batch.device)
+        batch[:, :, mouth] *= scale[:, :, None]
+
+        blend_window = self.options["silence_blend_window"]
+        # transition into the region from the frame before it, never into processed frames
+        start_lengths = torch.clamp(starts - processed[:, None], max=blend_window)
+        self._torch_blend(batch, silent, positions - starts, start_lengths, starts - 1)
+        # transition out of the region towards the frame after it
+        end_lengths = torch.clamp(total - 1 - ends, max=blend_window)
+        self._torch_blend(batch, silent, ends - positions, end_lengths, ends + 1)
+
+    @staticmethod
+    def _torch_blend(batch, mask, offsets, blend_lengths, anchors):
+        """Blends ``batch[b, t]`` towards ``batch[b, anchors[b, t]]`` where ``offsets < blend_lengths``."""
+        mask = mask & (offsets < blend_lengths)
+        if not mask.any():
+            return
+        weight = ((offsets + 1).double() / (blend_lengths + 1).double())
+        anchor_rows = torch.gather(batch, 1, anchors.clamp(0, batch.shape[1] - 1)[:, :, None].expand_as(batch))
+        blended = anchor_rows * (1 - weight).to(batch.dtype)[:, :, None] + batch * weight.to(batch.dtype)[:, :, None]
+        batch.copy_(torch.where(mask[:, :, None], blended, batch))
+
+    def _torch_frame_blending(self, batch, offsets, processed, volume, states):
+        total = batch.shape[1]
+        positions = torch.arange(total, device=batch.device)[None, :]
+        continued = processed > offsets
+        windows = torch.where(continued, self.options["subsequent_blend_window"], self.options["initial_blend_window"])
+        blend_lengths = torch.clamp(total - processed, max=windows)[:, None]
+        relative = positions - processed[:, None]
+        mask = (relative >= 0) & (relative < blend_lengths)
+        # fresh sessions blend from the neutral (all zero) expression
+        reference = batch[torch.arange(batch.shape[0], device=batch.device), (processed - 1).clamp(min=0)]
+        reference = reference * continued[:, None].to(batch.dtype)
+        weight = (relative + 1).double() / (blend_lengths + 1).double()
+        blended = batch * weight.to(batch.dtype)[:, :, None] + reference[:, None, :] * (1 - weight).to(batch.dtype)[:, :, None]
+        batch.copy_(torch.where(mask[:, :, None], blended, batch))
+
+    def _torch_savgol(self, batch, offsets, processed, volume, states):
+        """Batched :meth:`_savgol_streaming`, the causal filter as a conv1d."""
+        window, lookahead = self.options["savgol_window"], self.options["savgol_lookahead"]
+        total = batch.shape[1]
+        counts = [total - int(p) for p in processed.tolist()]
+        longest = max(counts)
+        rows = []
+        for index, (count, state) in enumerate(zip(counts, states)):
+            new_frames = batch[index, total - count:]
+            history = state.get("savgol_history")
+            if history is None or history.shape[0] != window - 1:
+                history = new_frames[self._reflect_indices(window - 1, count)]
+            else:
+                history = torch.from_numpy(history).to(batch.device, batch.dtype)
+            rows.append(F.pad(torch.cat([history, new_frames]), (0, 0, longest - count, 0)))
+        frames = torch.stack(rows)  # (B, window - 1 + longest, 52), right-aligned
+        for state, history in zip(states, frames[:, -(window - 1):].cpu().numpy()):
+            state["savgol_history"] = history.copy()
+
+        coeffs = self._torch_coeffs(batch.device, batch.dtype)
+        channels = frames.shape[-1]
+        # conv position i covers frames[i:i + window], the fit of new frame t = i + lookahead
+        smoothed = F.conv1d(frames.transpose(1, 2).reshape(-1, 1, frames.shape[1]), coeffs[lookahead].view(1, 1, -1))
+        smoothed = smoothed.view(len(rows), channels, -1).transpose(1, 2)[:, lookahead:longest]
+        # the last frames lack lookahead, they use fits over the newest window
+        tail = [frames[:, -window:].transpose(1, 2) @ coeffs[k] for k in range(min(lookahead, longest) - 1, -1, -1)]
+        if tail:
+            smoothed = torch.cat([smoothed, torch.stack(tail, dim=1)], dim=1)
+        for index, count in enumerate(counts):
+            batch[index, total - count:] = smoothed[index, longest - count:].clamp(0.0, 1.0)
+
+    def _torch_coeffs(self, device, dtype):
+        """``_causal_coeffs`` as a tensor, copied once per device and dtype (the array is read-only)."""
+        coeffs = self._torch_causal_coeffs.get((device, dtype))
+        if coeffs is None:
+            coeffs = torch.tensor(self._causal_coeffs, dtype=dtype, device=device)
+            self._torch_causal_coeffs[(device, dtype)] = coeffs
+        return coeffs
+
+    @staticmethod
+    def _reflect_indices(pad, count):
+        """Indices of ``np.pad(frames[:count], (pad, 0), mode="reflect")[:pad]``, "edge" for one frame."""
+        if count == 1:
+            return [0] * pad
+        period = 2 * (count - 1)
+        indices = [(j % period) if j % period < count else period - j % period for j in range(pad, 0, -1)]
+        return indices
+
+    def _torch_symmetrize(self, batch, offsets, processed, volume, states):
+        left = batch[:, :, self._left_indices]
+        right = batch[:, :, self._right_indices]
+        mode = self.options["symmetrize"]
+        if mode == "average":
+            values = (left + right) / 2
+        elif mode == "max":
+            values = torch.maximum(left, right)
+        elif mode == "min":
+            values = torch.minimum(left, right)
+        elif mode == "left_dominant":
+            values = left
+        else:
+            values = right
+        batch[:, :, self._left_indices] = values
+        batch[:, :, self._right_indices] = values
+
+    # ---------------- stages ----------------
+    def _mouth_smooth(self, expression, processed_frames, volume, state, rng):
+        if volume is None:
+            return
+        smooth_mouth_movements(expression, processed_frames, volume,
+                               silence_threshold=self.options["silence_threshold"],
+                               min_silence_duration=self.options["min_silence_duration"],
+                               blend_window=self.options["silence_blend_window"])
+
+    def _brow(self, expression, processed_frames, volume, state, rng):
+        if volume is None:
+            return
+        expression[:] = apply_random_brow_movement(expression, volume, rng=rng)
+
+    def _frame_blending(self, expression, processed_frames, volume, state, rng):
+        if processed_frames > 0:
+            start, window = processed_frames, self.options["subsequent_blend_window"]
+            reference = expression[processed_frames - 1]
+        else:
+            start, window, reference = 0, self.options["initial_blend_window"], None
+        length = min(window, expression.shape[0] - start)
+        if length <= 0:
+            return
+        if length not in self._blend_weights:
+            weight = np.arange(1, length + 1) / (length + 1)
+            self._blend_weights[length] = (weight.astype(np.float32)[:, None], (1 - weight).astype(np.float32)[:, None])
+        weight, reference_weight = self._blend_weights[length]
+        segment = expression[start:start + length]
+        segment *= weight
+        if reference is not None:
+            segment += reference * reference_weight
+
+    def _savgol(self, expression, processed_frames, volume, state, rng):
+        if state is not None:
+            self._savgol_streaming(expression[processed_frames:], state)
+            return
+        # accumulates in float64 like savgol_filter, but writes straight back into the buffer
+        correlate1d(expression, self._coeffs, axis=0, output=expression, mode="mirror")
+        np.clip(expression, 0.0, 1.0, out=expression)
+
+    def _savgol_streaming(self, new_frames, state):
+        """Smooths only the frames of a new chunk, each exactly once.
+
+        The unsmoothed last ``window - 1`` frames of the previous chunks are kept in
+        ``state["savgol_history"]``. A frame uses up to ``savgol_lookahead`` following
+        frames of its chunk; the last frames of a chunk have fewer and fall back to
+        fits over a window ending at the newest frame, so no output is delayed.
+        """
+        count = new_frames.shape[0]
+        if count == 0:
+            return
+        window, lookahead = self.options["savgol_window"], self.options["savgol_lookahead"]
+        history = state.get("savgol_history")
+        if history is None or history.shape[0] != window - 1:
+            # session start, mirrored like the offline filter
+            padded = np.pad(new_frames, ((window - 1, 0), (0, 0)), mode="reflect" if count > 1 else "edge")
+            history = padded[:window - 1]
+        frames = np.concatenate([history, new_frames], axis=0)
+        state["savgol_history"] = frames[-(window - 1):].copy()
+
+        # windows[i] covers frames[i:i + window]; new frame t with k frames ahead uses windows[t + k]
+        windows = sliding_window_view(frames, window, axis=0)
+        full = max(count - lookahead, 0)
+        new_frames[:full] = windows[lookahead:lookahead + full] @ self._causal_coeffs[lookahead]
+        for t in range(full, count):
+            new_frames[t] = windows[-1] @ self._causal_coeffs[count - 1 - t]
+        np.clip(new_frames, 0.0, 1.0, out=new_frames)
+
+    def _symmetrize(self, expression, processed_frames, volume, state, rng):
+        left = expression[:, self._left_indices]
+        right = expression[:, self._right_indices]
+        mode = self.options["symmetrize"]
+        if mode == "average":
+            values = (left + right) / 2
+        elif mode == "max":
+            values = np.maximum(left, right)
+        elif mode == "min":
+            values = np.minimum(left, right)
+        elif mode == "left_dominant":
+            values = left
+        else:
+            values = right
+        expression[:, self._left_indices] = values
+        expression[:, self._right_indices] = values
+
+    def _blink(self, expression, processed_frames, volume, state, rng):
+        if self.options["blink"] == "interval":
+            apply_random_eye_blinks(expression, rng=rng)
+        else:
+            apply_random_eye_blinks_context(expression, processed_frames=processed_frames, rng=rng)
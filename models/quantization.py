@@ -0,0 +1,52 @@
+"""
+Post-training quantization of a loaded model for CPU inference.
+"""
+
+import torch.nn as nn
+from torch.ao.quantization import quantize_dynamic, default_dynamic_qconfig, float16_dynamic_qconfig
+
+
+QUANTIZABLE_MODULES = {
+    "linear": nn.Linear,
+    "gru": nn.GRU,
+    "lstm": nn.LSTM,
+}
+
+DYNAMIC_QCONFIGS = {
+    "qint8": default_dynamic_qconfig,
+    "float16": float16_dynamic_qconfig,
+}
+
+# read linear1.weight & co. for their fast-path checks, a method on quantized layers
+UNQUANTIZABLE_PARENTS = (nn.TransformerEncoderLayer, nn.TransformerDecoderLayer)
+
+
+def quantize_model(model: nn.Module, type: str = "dynamic", dtype: str = "qint8",
+                   modules: tuple = ("linear",)) -> nn.Module:
+    """Replaces the ``modules`` layer types of ``model`` in place by dynamically quantized ones.
+
+    Dynamic quantization stores the weights as ``dtype`` and quantizes activations per call
+    from their observed range, so it needs no calibration data. It covers the wav2vec2
+    attention and feed-forward layers, feature_projection and output_proj, and after
+    Audio2Expression.optimize_for_inference also the ConvNormRelu stacks, whose convolutions
+    then run as linear layers. Layers inside nn.Transformer*Layer stay in float.
+    Quantized kernels only exist for CPU.
+
+    Raises:
+        ValueError: For unknown types, dtypes or module names
+    """
+    if type != "dynamic":
+        raise ValueError(f"Unsupported quantization type: {type}, expected 'dynamic'")
+    if dtype not in DYNAMIC_QCONFIGS:
+        raise ValueError(f"Unsupported quantization dtype: {dtype}, expected one of {list(DYNAMIC_QCONFIGS)}")
+    unknown = set(modules) - set(QUANTIZABLE_MODULES)
+    if unknown:
+        raise ValueError(f"Unknown quantizable modules: {sorted(unknown)}, expected {list(QUANTIZABLE_MODULES)}")
+    layer_types = tuple(QUANTIZABLE_MODULES[name] for name in modules)
+    qconfig_spec = {layer_type: DYNAMIC_QCONFIGS[dtype] for layer_type in layer_types}
+    for name, module in model.named_modules():
+        if isinstance(module, UNQUANTIZABLE_PARENTS):
+            for child_name, child in module.named_modules(prefix=name):
+                if isinstance(child, layer_types):
+                    qconfig_spec[child_name] = None
+    return quantize_dynamic(model, qconfig_spec, inplace=True)
@@ -0,0 +1,117 @@
+"""
+Vocal separation backends used to isolate speech from music before inference.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import librosa
+import soundfile as sf
+
+from utils.registry import Registry
+
+SEPARATORS = Registry("separators")
+
+
+def build_separator(cfg):
+    """Build a vocal separator."""
+    return SEPARATORS.build(cfg)
+
+
+class SeparatorBase:
+    """Separates the vocal track from mono float32 waveforms.
+
+    Backends load their model lazily in :meth:`load` and keep it for the lifetime of
+    the process; :meth:`separate` may be called from several threads.
+    """
+
+    def load(self):
+        return self
+
+    def separate(self, audio: np.ndarray, sr: int) -> np.ndarray:
+        """Returns the vocal track of ``audio`` at the same sample rate and length."""
+        raise NotImplementedError
+
+    def separate_batch(self, audios: list, sr: int) -> list:
+        return [self.separate(audio, sr) for audio in audios]
+
+
+@SEPARATORS.register_module()
+class SpleeterSeparator(SeparatorBase):
+    """Spleeter model kept in memory, separating NumPy arrays without temp files.
+
+    Spleeter works on stereo 44.1 kHz audio; inputs are upmixed/resampled on the way in
+    and the vocals are downmixed/resampled back to the caller's rate. Batches are
+    concatenated into a single waveform so they share one model run.
+    """
+
+    def __init__(self, model="spleeter:2stems", sample_rate=44100, batch_gap=0.5):
+        self.model = model
+        self.sample_rate = sample_rate
+        self.batch_gap = batch_gap
+        self._separator = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._separator is None:
+                from spleeter.separator import Separator
+                self._separator = Separator(self.model, multiprocess=False)
+        return self
+
+    def _run(self, audio: np.ndarray) -> np.ndarray:
+        self.load()
+        waveform = np.repeat(audio[:, None], 2, axis=1)
+        with self._lock:
+            prediction = self._separator.separate(waveform)
+        return prediction['vocals'].mean(axis=1).astype(np.float32)
+
+    def separate(self, audio: np.ndarray, sr: int) -> np.ndarray:
+        return self.separate_batch([audio], sr)[0]
+
+    def separate_batch(self, audios: list, sr: int) -> list:
+        resampled = [librosa.resample(np.asarray(audio, dtype=np.float32), orig_sr=sr, target_sr=self.sample_rate)
+                     if sr != self.sample_rate else np.asarray(audio, dtype=np.float32)
+                     for audio in audios]
+        # silence between clips keeps the separation of neighbouring clips apart
+        gap = np.zeros(int(self.batch_gap * self.sample_rate), dtype=np.float32)
+        bounds = np.cumsum([0] + [len(audio) + len(gap) for audio in resampled])
+        vocals = self._run(np.concatenate([part for audio in resampled for part in (audio, gap)]))
+
+        outputs = []
+        for audio, start, clip in zip(audios, bounds[:-1], resampled):
+            clip_vocals = vocals[start:start + len(clip)]
+            if sr != self.sample_rate:
+                clip_vocals = librosa.resample(clip_vocals, orig_sr=self.sample_rate, target_sr=sr)
+            outputs.append(librosa.util.fix_length(clip_vocals, size=len(audio)))
+        return outputs
+
+
+@SEPARATORS.register_module()
+class SpleeterCommandSeparator(SeparatorBase):
+    """Runs the spleeter CLI per call (the original behaviour) in a private temp dir.
+
+    Slow, since every call starts a new process and reloads the model, but it needs no
+    spleeter/TensorFlow in the serving environment besides the command itself.
+    """
+
+    def __init__(self, model="spleeter:2stems", command="spleeter"):
+        self.model = model
+        self.command = command
+
+    def separate(self, audio: np.ndarray, sr: int) -> np.ndarray:
+        work_dir = tempfile.mkdtemp(prefix="separator_")
+        try:
+            input_path = os.path.join(work_dir, "input.wav")
+            sf.write(input_path, audio, sr)
+            os.system(f'{self.command} separate -p {self.model} -o {work_dir} {input_path}')
+            vocals_path = os.path.join(work_dir, "input", "vocals.wav")
+            if not os.path.exists(vocals_path):
+                raise RuntimeError(f"Vocal separation failed for {self.model}")
+            vocals, _ = librosa.load(vocals_path, sr=sr)
+            return librosa.util.fix_length(vocals, size=len(audio))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
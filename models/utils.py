@@ -1,6 +1,7 @@
+import io
+import os
 import json
 import time
-import warnings
 import numpy as np
 from typing import List, Optional,Tuple
 from scipy.signal import savgol_filter
@@ -115,12 +116,16 @@ MOUTH_BLENDSHAPES = [ "mouthDimpleLeft",
                     "cheekPuff",
                 ]
 
+MOUTH_BLENDSHAPE_INDICES = np.array([ARKitBlendShape.index(name) for name in MOUTH_BLENDSHAPES])
+
 DEFAULT_CONTEXT ={
     'is_initial_input': True,
     'previous_audio': None,
     'previous_expression': None,
     'previous_volume': None,
     'previous_headpose': None,
+    'encoder_state': None,
+    'postprocess_state': None,
 }
 
 RETURN_CODE = {
@@ -142,6 +147,7 @@ BLINK_PATTERNS = [
     np.array([0.870, 0.950, 0.949, 0.696, 0.191, 0.073, 0.007]),
     np.array([0.000, 0.557, 0.953, 0.942, 0.426, 0.148, 0.018])
 ]
+BLINK_PATTERN_TABLE = np.stack(BLINK_PATTERNS)
 
 # Postprocess
 def symmetrize_blendshapes(
@@ -206,40 +212,49 @@ def apply_random_eye_blinks(
         input: np.ndarray,
         blink_scale: tuple = (0.8, 1.0),
         blink_interval: tuple = (60, 120),
-        blink_duration: int = 7
+        blink_duration: int = 7,
+        rng: np.random.Generator = None
 ) -> np.ndarray:
     """
     Apply randomized eye blinks to blendshape parameters
 
+    All blinks of the clip are planned in one pass: start frames from the cumulative
+    random spacing, then intensities and patterns for every start at once.
+
     Args:
         output: Input array of shape (N, 52) containing blendshape parameters
         blink_scale: Tuple (min, max) for random blink intensity scaling
         blink_interval: Tuple (min, max) for random blink spacing in frames
         blink_duration: Number of frames for blink animation (fixed)
+        rng: Random generator, a fresh unseeded one if None; pass a seeded one for
+             reproducible output
 
     Returns:
         None (modifies output array in-place)
     """
-    # Define eye blink patterns (normalized 0-1)
+    rng = rng if rng is not None else np.random.default_rng()
 
     # Initialize parameters
     n_frames = input.shape[0]
-    input[:,8:10] = np.zeros((n_frames,2))
-    current_frame = 0
-
-    # Main blink application loop
-    while current_frame < n_frames - blink_duration:
-        # Randomize blink parameters
-        scale = np.random.uniform(*blink_scale)
-        pattern = BLINK_PATTERNS[np.random.randint(0, 4)]
-
-        # Apply blink animation
-        blink_values = pattern * scale
-        input[current_frame:current_frame + blink_duration, 8] = blink_values
-        input[current_frame:current_frame + blink_duration, 9] = blink_values
-
-        # Advance to next blink position
-        current_frame += blink_duration + np.random.randint(*blink_interval)
+    input[:, 8:10] = 0
+    if n_frames <= blink_duration:
+        return input
+
+    # Enough blinks to fill the clip at the shortest spacing, the ones past the end are dropped
+    max_blinks = (n_frames - blink_duration) // (blink_duration + blink_interval[0]) + 1
+    spacing = blink_duration + rng.integers(*blink_interval, size=max_blinks - 1)
+    blink_starts = np.concatenate([[0], np.cumsum(spacing)])
+    blink_starts = blink_starts[blink_starts < n_frames - blink_duration]
+
+    # Randomize blink parameters
+    scales = rng.uniform(*blink_scale, size=len(blink_starts))
+    patterns = BLINK_PATTERN_TABLE[rng.integers(0, len(BLINK_PATTERNS), size=len(blink_starts))]
+
+    # Apply blink animations to both eyes
+    rows = blink_starts[:, None] + np.arange(blink_duration)
+    blink_values = patterns * scales[:, None]
+    input[rows, 8] = blink_values
+    input[rows, 9] = blink_values
 
     return input
 
@@ -247,7 +262,8 @@ def apply_random_eye_blinks(
 def apply_random_eye_blinks_context(
         animation_params: np.ndarray,
         processed_frames: int = 0,
-        intensity_range: tuple = (0.8, 1.0)
+        intensity_range: tuple = (0.8, 1.0),
+        rng: np.random.Generator = None
 ) -> np.ndarray:
     """Applies random eye blink patterns to facial animation parameters.
 
@@ -256,10 +272,13 @@ def apply_random_eye_blinks_context(
                           Columns 8 and 9 typically represent left/right eye blink parameters.
         processed_frames: Number of already processed frames that shouldn't be modified
         intensity_range: Tuple defining (min, max) scaling for blink intensity
+        rng: Random generator, a fresh unseeded one if None; streaming sessions keep
+             theirs across chunks
 
     Returns:
         Modified animation parameters array with random eye blinks added to unprocessed frames
     """
+    rng = rng if rng is not None else np.random.default_rng()
     remaining_frames = animation_params.shape[0] - processed_frames
 
     # Only apply blinks if there's enough remaining frames (blink pattern requires 7 frames)
@@ -275,14 +294,14 @@ def apply_random_eye_blinks_context(
     last_processed_blink = previous_blink_indices[-1] - 7 if previous_blink_indices.size > 0 else processed_frames
 
     # Calculate first new blink position
-    blink_interval = np.random.randint(min_blink_interval, max_blink_interval)
+    blink_interval = rng.integers(min_blink_interval, max_blink_interval)
     first_blink_start = max(0, blink_interval - last_processed_blink)
 
     # Apply first blink if there's enough space
     if first_blink_start <= (remaining_frames - 7):
         # Randomly select blink pattern and intensity
-        blink_pattern = BLINK_PATTERNS[np.random.randint(0, 4)]
-        intensity = np.random.uniform(*intensity_range)
+        blink_pattern = BLINK_PATTERNS[rng.integers(0, 4)]
+        intensity = rng.uniform(*intensity_range)
 
         # Calculate blink frame range
         blink_start = processed_frames + first_blink_start
@@ -296,11 +315,11 @@ def apply_random_eye_blinks_context(
         remaining_after_blink = animation_params.shape[0] - blink_end
         if remaining_after_blink > min_blink_interval:
             # Calculate second blink position
-            second_intensity = np.random.uniform(*intensity_range)
-            second_interval = np.random.randint(min_blink_interval, max_blink_interval)
+            second_intensity = rng.uniform(*intensity_range)
+            second_interval = rng.integers(min_blink_interval, max_blink_interval)
 
             if (remaining_after_blink - 7) > second_interval:
-                second_pattern = BLINK_PATTERNS[np.random.randint(0, 4)]
+                second_pattern = BLINK_PATTERNS[rng.integers(0, 4)]
                 second_blink_start = blink_end + second_interval
                 second_blink_end = second_blink_start + 7
 
@@ -311,12 +330,122 @@ def apply_random_eye_blinks_context(
     return animation_params
 
 
+class BlendshapeAnimationWriter:
+    """
+    Incrementally writes blendshape frames as a compact JSON document or as NDJSON.
+
+    Frames are serialized block by block straight from NumPy arrays, so memory stays
+    constant in the clip length and a writer can be fed while later segments are still
+    being inferred. The JSON layout matches export_blendshape_animation ("names",
+    "frames", then "metadata" once the frame count is known); NDJSON writes one header
+    line with names/metadata followed by one line per frame.
+
+    Args:
+        output: File path, or an open text/binary file-like object (file, socket.makefile(), ...)
+        blendshape_names: Ordered list of 52 ARKit-standard blendshape names
+        fps: Frame rate for timing calculations (frames per second)
+        fmt: "json" or "ndjson"
+        block_size: Frames serialized per write call
+        flush: Flush the output after every write (for sockets / live consumers)
+    """
+
+    def __init__(
+            self,
+            output,
+            blendshape_names: List[str],
+            fps: float,
+            fmt: str = "json",
+            block_size: int = 1024,
+            flush: bool = False
+    ):
+        if fmt not in ("json", "ndjson"):
+            raise ValueError(f"Unsupported animation format '{fmt}', expected 'json' or 'ndjson'")
+        if len(blendshape_names) != 52:
+            raise ValueError(f"Requires 52 blendshape names, got {len(blendshape_names)}")
+        self.blendshape_names = list(blendshape_names)
+        self.fps = fps
+        self.fmt = fmt
+        self.block_size = max(int(block_size), 1)
+        self.flush = flush
+        self.frame_count = 0
+
+        self._owns_file = isinstance(output, (str, os.PathLike))
+        self._file = open(output, 'w', encoding='utf-8') if self._owns_file else output
+        self._binary = 'b' in getattr(self._file, 'mode', '') or isinstance(
+            self._file, (io.RawIOBase, io.BufferedIOBase))
+        self._closed = False
+
+        names = json.dumps(self.blendshape_names, ensure_ascii=False)
+        if fmt == "json":
+            self._write('{"names":' + names + ',"frames":[')
+        else:
+            self._write(json.dumps({
+                "names": self.blendshape_names,
+                "metadata": {"fps": fps, "blendshape_names": self.blendshape_names}
+            }, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    def _write(self, text: str):
+        self._file.write(text.encode('utf-8') if self._binary else text)
+
+    def write(self, blendshape_weights: np.ndarray, rotation_data: Optional[np.ndarray] = None):
+        """Append (N, 52) frames, optionally with (N, 3) rotations."""
+        if self._closed:
+            raise ValueError("Writer is closed")
+        if blendshape_weights.ndim != 2 or blendshape_weights.shape[1] != 52:
+            raise ValueError(f"Expected 52 blendshapes, got shape {blendshape_weights.shape}")
+        if rotation_data is not None and len(rotation_data) != len(blendshape_weights):
+            raise ValueError("Rotation data length must match animation frames")
+
+        for start in range(0, len(blendshape_weights), self.block_size):
+            weights = blendshape_weights[start:start + self.block_size].tolist()
+            rotations = rotation_data[start:start + self.block_size].tolist() \
+                if rotation_data is not None else [[]] * len(weights)
+            first = self.frame_count
+            frames = [
+                {"weights": w, "time": (first + i) / self.fps, "rotation": r}
+                for i, (w, r) in enumerate(zip(weights, rotations))
+            ]
+            if self.fmt == "json":
+                # C encoder for the whole block; strip the enclosing brackets
+                text = json.dumps(frames, separators=(',', ':'))[1:-1]
+                self._write(text if first == 0 else ',' + text)
+            else:
+                self._write(''.join(json.dumps(frame, separators=(',', ':')) + '\n' for frame in frames))
+            self.frame_count += len(frames)
+
+        if self.flush:
+            self._file.flush()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self.fmt == "json":
+                self._write('],"metadata":' + json.dumps({
+                    "fps": self.fps,
+                    "frame_count": self.frame_count,
+                    "blendshape_names": self.blendshape_names
+                }, ensure_ascii=False, separators=(',', ':')) + '}')
+            self._file.flush()
+        finally:
+            if self._owns_file:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 def export_blendshape_animation(
         blendshape_weights: np.ndarray,
         output_path: str,
         blendshape_names: List[str],
         fps: float,
-        rotation_data: Optional[np.ndarray] = None
+        rotation_data: Optional[np.ndarray] = None,
+        fmt: Optional[str] = None
 ) -> None:
     """
     Export blendshape animation data to JSON format compatible with ARKit.
@@ -327,6 +456,7 @@ def export_blendshape_animation(
         blendshape_names: Ordered list of 52 ARKit-standard blendshape names
         fps: Frame rate for timing calculations (frames per second)
         rotation_data: Optional 3D rotation data array of shape (N, 3)
+        fmt: "json" or "ndjson", inferred from the extension (.ndjson / .jsonl) if omitted
 
     Raises:
         ValueError: If input dimensions are incompatible
@@ -340,34 +470,17 @@ def export_blendshape_animation(
     if rotation_data is not None and len(rotation_data) != len(blendshape_weights):
         raise ValueError("Rotation data length must match animation frames")
 
-    # Build animation data structure
-    animation_data = {
-        "names":blendshape_names,
-        "metadata": {
-            "fps": fps,
-            "frame_count": len(blendshape_weights),
-            "blendshape_names": blendshape_names
-        },
-        "frames": []
-    }
-
-    # Convert numpy array to serializable format
-    for frame_idx in range(blendshape_weights.shape[0]):
-        frame_data = {
-            "weights": blendshape_weights[frame_idx].tolist(),
-            "time": frame_idx / fps,
-            "rotation": rotation_data[frame_idx].tolist() if rotation_data else []
-        }
-        animation_data["frames"].append(frame_data)
+    if fmt is None:
+        fmt = "ndjson" if output_path.endswith(('.ndjson', '.jsonl')) else "json"
 
     # Safeguard against data loss
-    if not output_path.endswith('.json'):
+    if fmt == "json" and not output_path.endswith('.json'):
         output_path += '.json'
 
     # Write to file with error handling
     try:
-        with open(output_path, 'w', encoding='utf-8') as json_file:
-            json.dump(animation_data, json_file, indent=2, ensure_ascii=False)
+        with BlendshapeAnimationWriter(output_path, blendshape_names, fps, fmt=fmt) as writer:
+            writer.write(blendshape_weights, rotation_data)
     except Exception as e:
         raise IOError(f"Failed to write animation data: {str(e)}") from e
 
@@ -441,36 +554,45 @@ def apply_savitzky_golay_smoothing(
     )
 
 
-def _blend_region_start(
-    array: np.ndarray,
-    region: np.ndarray,
-    processed_boundary: int,
-    blend_frames: int
-) -> None:
-    """Applies linear blend between last active frame and silent region start."""
-    blend_length = min(blend_frames, region[0] - processed_boundary)
-    if blend_length <= 0:
-        return
+def _low_value_runs(
+        signal: np.ndarray,
+        threshold: float,
+        min_region_length: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Run-length encodes ``signal < threshold``; returns inclusive (starts, ends) of qualifying runs."""
+    low = np.asarray(signal) < threshold
+    changes = np.flatnonzero(np.diff(np.concatenate(([False], low, [False])).astype(np.int8)))
+    starts, ends = changes[::2], changes[1::2] - 1
+    keep = ends - starts + 1 >= min_region_length
+    return starts[keep], ends[keep]
+
+
+def _run_indices(starts: np.ndarray, lengths: np.ndarray, step: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenated ``start + step * i`` for ``i < length`` of every run, plus the offsets ``i``."""
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + step * offsets, offsets
 
-    pre_frame = array[region[0] - 1]
-    for i in range(blend_length):
-        weight = (i + 1) / (blend_length + 1)
-        array[region[0] + i] = pre_frame * (1 - weight) + array[region[0] + i] * weight
 
-def _blend_region_end(
+def _blend_region_edges(
     array: np.ndarray,
-    region: np.ndarray,
-    blend_frames: int
+    anchor_rows: np.ndarray,
+    edge_rows: np.ndarray,
+    blend_lengths: np.ndarray,
+    step: int
 ) -> None:
-    """Applies linear blend between silent region end and next active frame."""
-    blend_length = min(blend_frames, array.shape[0] - region[-1] - 1)
-    if blend_length <= 0:
+    """Linearly blends rows ``edge + step * i`` (i < blend_length) towards the anchor row of each region.
+
+    Rows and anchors must lie inside ``array``, the caller clips ``blend_lengths`` accordingly.
+    """
+    keep = blend_lengths > 0
+    if not keep.any():
         return
+    anchor_rows, edge_rows, blend_lengths = anchor_rows[keep], edge_rows[keep], blend_lengths[keep]
+    rows, offsets = _run_indices(edge_rows, blend_lengths, step)
+    weight = (offsets + 1) / np.repeat(blend_lengths + 1, blend_lengths)
+    anchors = array[np.repeat(anchor_rows, blend_lengths)]
+    array[rows] = anchors * (1 - weight).astype(array.dtype)[:, None] + array[rows] * weight.astype(array.dtype)[:, None]
 
-    post_frame = array[region[-1] + 1]
-    for i in range(blend_length):
-        weight = (i + 1) / (blend_length + 1)
-        array[region[-1] - i] = post_frame * (1 - weight) + array[region[-1] - i] * weight
 
 def find_low_value_regions(
         signal: np.ndarray,
@@ -487,27 +609,8 @@ def find_low_value_regions(
     Returns:
         List of numpy arrays, each containing indices for a qualifying low-value region
     """
-    low_value_indices = np.where(signal < threshold)[0]
-    contiguous_regions = []
-    current_region_length = 0
-    region_start_idx = 0
-
-    for i in range(1, len(low_value_indices)):
-        # Check if current index continues a consecutive sequence
-        if low_value_indices[i] != low_value_indices[i - 1] + 1:
-            # Finalize previous region if it meets length requirement
-            if current_region_length >= min_region_length:
-                contiguous_regions.append(low_value_indices[region_start_idx:i])
-            # Reset tracking for new potential region
-            region_start_idx = i
-            current_region_length = 0
-        current_region_length += 1
-
-    # Add the final region if it qualifies
-    if current_region_length >= min_region_length:
-        contiguous_regions.append(low_value_indices[region_start_idx:])
-
-    return contiguous_regions
+    starts, ends = _low_value_runs(signal, threshold, min_region_length)
+    return [np.arange(start, end + 1) for start, end in zip(starts.tolist(), ends.tolist())]
 
 
 def smooth_mouth_movements(
@@ -535,35 +638,31 @@ def smooth_mouth_movements(
         return blend_shapes
 
     # Detect silence periods using volume data
-    silent_regions = find_low_value_regions(
+    starts, ends = _low_value_runs(
         volume,
         threshold=silence_threshold,
         min_region_length=min_silence_duration
     )
+    if len(starts) == 0:
+        return blend_shapes
+    lengths = ends - starts + 1
 
-    for region_indices in silent_regions:
-        # Reduce mouth blend shapes in silent region
-        mouth_blend_indices = [ARKitBlendShape.index(name) for name in MOUTH_BLENDSHAPES]
-        for region_indice in region_indices.tolist():
-            blend_shapes[region_indice, mouth_blend_indices] *= 0.1
+    # blends run forward from a region's start and backward from its end, clipped to the clip
+    num_frames = blend_shapes.shape[0]
+    start_lengths = np.minimum(np.minimum(blend_window, starts - processed_frames), num_frames - starts)
+    end_lengths = np.minimum(np.minimum(blend_window, num_frames - ends - 1), ends + 1)
 
-        try:
-            # Smooth transition into silent region
-            _blend_region_start(
-                blend_shapes,
-                region_indices,
-                processed_frames,
-                blend_window
-            )
-
-            # Smooth transition out of silent region
-            _blend_region_end(
-                blend_shapes,
-                region_indices,
-                blend_window
-            )
-        except IndexError as e:
-            warnings.warn(f"Edge blending skipped at region {region_indices}: {str(e)}")
+    # Regions at least blend_window long only touch their own frames and can all be
+    # processed at once; shorter ones blend past their edges and go one by one, in order.
+    groups = [slice(None)] if (lengths >= blend_window).all() else [slice(i, i + 1) for i in range(len(starts))]
+    for group in groups:
+        # Reduce mouth blend shapes in silent regions
+        silent_rows, _ = _run_indices(starts[group], lengths[group])
+        blend_shapes[silent_rows[:, None], MOUTH_BLENDSHAPE_INDICES] *= 0.1
+
+        # Smooth transitions into and out of silent regions
+        _blend_region_edges(blend_shapes, starts[group] - 1, starts[group], start_lengths[group], 1)
+        _blend_region_edges(blend_shapes, ends[group] + 1, ends[group], end_lengths[group], -1)
 
     return blend_shapes
 
@@ -685,7 +784,12 @@ import numpy as np
 from scipy.ndimage import label
 
 
-def apply_random_brow_movement(input_exp, volume):
+def apply_random_brow_movement(input_exp, volume, rng: np.random.Generator = None):
+    """Adds random brow raises on loud regions, at most one per 5 s segment.
+
+    ``rng`` is the random generator, a fresh unseeded one if None.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
     FRAME_SEGMENT = 150
     HOLD_THRESHOLD = 10
     VOLUME_THRESHOLD = 0.08
@@ -713,12 +817,12 @@ def apply_random_brow_movement(input_exp, volume):
                 candidate_regions.append(region_indices)
 
         if candidate_regions:
-            selected_region = candidate_regions[np.random.choice(len(candidate_regions))]
+            selected_region = candidate_regions[rng.choice(len(candidate_regions))]
             region_start = selected_region[0]
             region_end = selected_region[-1]
             region_length = region_end - region_start + 1
 
-            brow_idx = np.random.randint(0, 2)
+            brow_idx = rng.integers(0, 2)
             base_brow = BROW1 if brow_idx == 0 else BROW2
             peak_idx = BROW_PEAKS[brow_idx]
 
@@ -732,7 +836,7 @@ def apply_random_brow_movement(input_exp, volume):
                 insert_start = max(global_peak_frame - peak_idx, seg_start)
                 insert_end = min(global_peak_frame + (region_length - local_max_pos), seg_end)
 
-                strength = np.random.uniform(*STRENGTH_RANGE)
+                strength = rng.uniform(*STRENGTH_RANGE)
 
                 if insert_start + len(rise_anim) <= seg_end:
                     input_exp[insert_start:insert_start + len(rise_anim), :5] += rise_anim * strength
@@ -746,7 +850,7 @@ def apply_random_brow_movement(input_exp, volume):
                 insert_pos = max(seg_start, min(insert_pos, seg_end - anim_length))
 
                 if insert_pos + anim_length <= seg_end:
-                    strength = np.random.uniform(*STRENGTH_RANGE)
+                    strength = rng.uniform(*STRENGTH_RANGE)
                     input_exp[insert_pos:insert_pos + anim_length, :5] += base_brow * strength
 
     return np.clip(input_exp, 0, 1)
\ No newline at end of file
@@ -0,0 +1,90 @@
+"""
+Peak memory of the wav2vec2 encoder across clip lengths, comparing the old forward
+(eager attention with all attention maps returned) against the inference fast path
+(fused scaled-dot-product attention, only the last hidden state).
+
+Each measurement runs in a fresh subprocess so peaks do not leak between runs; on CUDA
+the peak is torch.cuda.max_memory_allocated, on CPU the growth of the max RSS.
+
+    python scripts/benchmark/attention_memory.py --seconds 10 30 60 --device cpu
+"""
+
+import os
+import sys
+import json
+import argparse
+import resource
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+def measure(mode, seconds, device):
+    import torch
+    from transformers.models.wav2vec2.configuration_wav2vec2 import Wav2Vec2Config
+    from transformers.models.wav2vec2.modeling_wav2vec2 import Wav2Vec2Attention
+    from models.encoder.wav2vec import Wav2Vec2Model, Wav2Vec2SdpaAttention
+
+    model = Wav2Vec2Model(Wav2Vec2Config.from_pretrained("configs/wav2vec2_config.json")).eval().to(device)
+    if mode == "eager":
+        for module in model.modules():
+            if type(module) is Wav2Vec2SdpaAttention:
+                module.__class__ = Wav2Vec2Attention
+    audio = torch.randn(1, int(seconds * 16000), device=device)
+    frame_num = int(seconds * 30)
+
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        baseline = torch.cuda.memory_allocated()
+    else:
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    with torch.inference_mode():
+        model(audio, frame_num=frame_num, output_attentions=(mode == "eager"))
+
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+        peak = torch.cuda.max_memory_allocated() - baseline
+    else:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - baseline
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="wav2vec2 attention peak memory benchmark")
+    parser.add_argument("--seconds", type=float, nargs="+", default=[10, 30, 60, 120])
+    parser.add_argument("--device", type=str, default="auto", help="auto, cpu, cuda or cuda:N")
+    parser.add_argument("--worker", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps({"peak": measure(args.worker, args.seconds[0], args.device)}))
+        return
+
+    from utils.env import get_device
+    args.device = str(get_device(args.device))
+
+    print(f"device: {args.device}")
+    print(f"{'seconds':>8} {'eager+attn (MB)':>16} {'sdpa (MB)':>10} {'reduction':>10}")
+    for seconds in args.seconds:
+        peaks = {}
+        for mode in ("eager", "sdpa"):
+            result = subprocess.run(
+                [sys.executable, __file__, "--worker", mode, "--seconds", str(seconds), "--device", args.device],
+                capture_output=True, text=True,
+            )
+            if result.returncode != 0:
+                peaks[mode] = None
+                continue
+            peaks[mode] = json.loads(result.stdout.strip().splitlines()[-1])["peak"] / 2 ** 20
+        eager, sdpa = peaks["eager"], peaks["sdpa"]
+        fmt = lambda value: f"{value:.0f}" if value is not None else "failed"
+        reduction = f"{eager / sdpa:.1f}x" if eager and sdpa else "-"
+        print(f"{seconds:>8.0f} {fmt(eager):>16} {fmt(sdpa):>10} {reduction:>10}")
+
+
+if __name__ == "__main__":
+    main()
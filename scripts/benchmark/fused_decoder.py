@@ -0,0 +1,107 @@
+"""
+Equivalence check and CPU latency of Audio2Expression.optimize_for_inference: the
+identity-conditioned decoder (SeqTranslator1D + ConvNormRelu blocks + output projection)
+in its original (B, C, T) form against the fused channels-last path.
+
+The audio features are random, only the decode stage differs between the two paths;
+--full also times the complete forward including the wav2vec2 encoder. The fusion itself is
+tested in tests/test_fused_decoder.py.
+
+    python scripts/benchmark/fused_decoder.py --frames 64 300 900 --batch 1 4 --threads 1
+"""
+
+import os
+import sys
+import copy
+import time
+import argparse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import torch
+
+from models import build_model
+from utils.config import Config
+
+
+def build_backbone(config_file):
+    cfg = Config.fromfile(config_file)
+    return build_model(cfg.model.backbone).eval()
+
+
+def best_time(fn, repeat):
+    fn()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+@torch.inference_mode()
+def check_equivalence(original, fused, frames, batches, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    num_ids = original.identity_encoder.id_mlp.in_channels
+    worst = 0.0
+    for num_frames in frames:
+        for batch in batches:
+            features = torch.randn(batch, original.feature_projection.out_features, num_frames, generator=generator)
+            id_idx = torch.randint(0, num_ids, (batch,), generator=generator)
+            expected = original.decode_expression(features, id_idx)
+            actual = fused.decode_expression(features, id_idx)
+            assert expected.shape == actual.shape, f"shape {tuple(actual.shape)} != {tuple(expected.shape)}"
+            worst = max(worst, (expected - actual).abs().max().item())
+    assert worst < 1e-4, f"fused decoder differs by {worst}"
+    print(f"equivalence: max abs diff {worst:.2e} over frames {frames} x batch {batches}")
+
+
+@torch.inference_mode()
+def benchmark(original, fused, frames, batches, repeat, full):
+    num_ids = original.identity_encoder.id_mlp.in_channels
+    print(f"{'frames':>7} {'batch':>6} {'original (ms)':>14} {'fused (ms)':>11} {'speedup':>8}")
+    for num_frames in frames:
+        for batch in batches:
+            features = torch.randn(batch, original.feature_projection.out_features, num_frames)
+            id_idx = torch.randint(0, num_ids, (batch,))
+            timings = [best_time(lambda: model.decode_expression(features, id_idx), repeat)
+                       for model in (original, fused)]
+            print(f"{num_frames:>7} {batch:>6} {timings[0]:>14.2f} {timings[1]:>11.2f} "
+                  f"{timings[0] / timings[1]:>7.2f}x")
+    if full:
+        print(f"\nfull forward\n{'frames':>7} {'batch':>6} {'original (ms)':>14} {'fused (ms)':>11} {'speedup':>8}")
+        for num_frames in frames:
+            for batch in batches:
+                input_dict = {'input_audio_array': torch.randn(batch, num_frames * 16000 // 30),
+                              'id_idx': torch.randint(0, num_ids, (batch,)), 'time_steps': num_frames}
+                timings = [best_time(lambda: model(input_dict), repeat) for model in (original, fused)]
+                print(f"{num_frames:>7} {batch:>6} {timings[0]:>14.2f} {timings[1]:>11.2f} "
+                      f"{timings[0] / timings[1]:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="fused decoder equivalence and latency benchmark")
+    parser.add_argument("--config-file", default="configs/lam_audio2exp_config_streaming.py")
+    parser.add_argument("--frames", type=int, nargs="+", default=[64, 300, 900])
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--full", action="store_true", help="also time the complete forward")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    original = build_backbone(args.config_file)
+    original.precompute_identity_table()
+    fused = copy.deepcopy(original).optimize_for_inference()
+
+    print(f"threads: {torch.get_num_threads()}")
+    check_equivalence(original, fused, args.frames, args.batch)
+    benchmark(original, fused, args.frames, args.batch, args.repeat, args.full)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Numerical drift, weight memory and latency of reduced-precision inference (config
+``precision``: weights cast once, forward under autocast, fp32 sigmoid output) against fp32.
+
+Fails with an AssertionError when the drift of a precision exceeds its tolerance on the
+clip set, so it doubles as the acceptance check before switching a deployment.
+
+    python scripts/benchmark/precision.py --weight pretrained_models/lam_audio2exp_streaming.tar \
+        --precisions bf16 fp16 --device cuda
+
+Without --audio, synthetic clips are used (see quantization.py); without --weight the model
+is randomly initialized.
+"""
+
+import os
+import sys
+import copy
+import time
+import argparse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import numpy as np
+import torch
+
+from engines.infer import PRECISIONS, PRECISION_TOLERANCES as TOLERANCES
+from utils.env import get_device
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from quantization import build_estimator, load_clips
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+
+
+@torch.inference_mode()
+def run(model, dtype, device, input_dict):
+    with torch.autocast(device.type, dtype=dtype, enabled=dtype != torch.float32):
+        return model(input_dict)['pred_exp']
+
+
+@torch.inference_mode()
+def drift(reference, models, clips, id_indices, device):
+    print(f"{'precision':>9} {'mean abs':>9} {'max abs':>9} {'tolerance':>17}")
+    failures = []
+    for precision, model in models.items():
+        errors = []
+        for audio in clips:
+            batch = torch.from_numpy(np.ascontiguousarray(audio))[None].repeat(len(id_indices), 1).to(device)
+            input_dict = {'input_audio_array': batch, 'id_idx': torch.tensor(id_indices, device=device)}
+            expected = run(reference, torch.float32, device, input_dict)
+            actual = run(model, PRECISIONS[precision], device, input_dict)
+            assert actual.dtype == torch.float32, f"{precision} output is {actual.dtype}"
+            errors.append((expected - actual).abs().flatten())
+        errors = torch.cat(errors)
+        mean_tol, max_tol = TOLERANCES[precision]
+        print(f"{precision:>9} {errors.mean():>9.5f} {errors.max():>9.5f} {mean_tol:>8g} / {max_tol:<6g}")
+        if errors.mean() > mean_tol or errors.max() > max_tol:
+            failures.append(precision)
+    assert not failures, f"drift above tolerance for {failures}"
+
+
+@torch.inference_mode()
+def benchmark(models, batches, repeat, device):
+    frames = 64
+    num_ids = models["fp32"].backbone.identity_encoder.id_mlp.in_channels
+    print(f"\nstreaming windows of {frames} frames")
+    print(f"{'precision':>9} {'weights (MB)':>13} " + " ".join(f"{f'batch {b} (ms)':>15}" for b in batches))
+    for precision, model in models.items():
+        weight_bytes = sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers()))
+        timings = []
+        for batch in batches:
+            input_dict = {'input_audio_array': torch.randn(batch, frames * 16000 // 30, device=device),
+                          'id_idx': torch.randint(0, num_ids, (batch,), device=device), 'time_steps': frames}
+            run(model, PRECISIONS[precision], device, input_dict)
+            best = float("inf")
+            for _ in range(repeat):
+                synchronize(device)
+                start = time.perf_counter()
+                run(model, PRECISIONS[precision], device, input_dict)
+                synchronize(device)
+                best = min(best, time.perf_counter() - start)
+            timings.append(best * 1000)
+        print(f"{precision:>9} {weight_bytes / 2 ** 20:>13.1f} " + " ".join(f"{t:>15.1f}" for t in timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="reduced-precision inference drift and latency")
+    parser.add_argument("--config-file", default="configs/lam_audio2exp_config_streaming.py")
+    parser.add_argument("--weight", default=None, help="checkpoint, random weights without")
+    parser.add_argument("--audio", nargs="*", default=None, help="reference clips, synthetic without")
+    parser.add_argument("--seconds", type=float, default=4.0)
+    parser.add_argument("--clips", type=int, default=4)
+    parser.add_argument("--ids", type=int, nargs="+", default=[0, 5, 11])
+    parser.add_argument("--precisions", nargs="+", default=["bf16", "fp16"], choices=list(TOLERANCES))
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--optimize", action="store_true", help="fuse the decoder first (optimize_for_inference)")
+    parser.add_argument("--device", default="auto")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = get_device(args.device)
+    torch.manual_seed(0)
+    reference = build_estimator(args.config_file, args.weight, args.optimize).to(device)
+    models = {"fp32": reference}
+    models.update({precision: copy.deepcopy(reference).to(PRECISIONS[precision]) for precision in args.precisions})
+
+    print(f"device: {device}, weights: {args.weight or 'random'}, fused decoder: {args.optimize}")
+    drift(reference, {p: models[p] for p in args.precisions}, load_clips(args.audio, args.seconds, args.clips),
+          args.ids, device)
+    benchmark(models, args.batch, args.repeat, device)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Accuracy and CPU throughput of the dynamic int8 quantized model (config ``quantization``)
+against the float32 model.
+
+Accuracy is the per-blendshape mean absolute error of the raw network output over a set of
+reference clips and identities; throughput is measured on streaming windows (64 frames,
+~2.13 s of audio) at several batch sizes, i.e. concurrent streams batched by the server.
+
+    python scripts/benchmark/quantization.py --weight pretrained_models/lam_audio2exp_streaming.tar \
+        --audio clip1.wav clip2.wav --batch 1 4 16 --threads 4
+
+Without --audio, synthetic clips (voiced harmonics with noise bursts) are used; without
+--weight the model is randomly initialized and only the throughput numbers are meaningful.
+"""
+
+import os
+import sys
+import copy
+import time
+import argparse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import numpy as np
+import torch
+
+from models import build_model
+from models.quantization import quantize_model
+from models.utils import ARKitBlendShape
+from utils.checkpoint import load_weights
+from utils.config import Config
+
+
+def build_estimator(config_file, weight=None, optimize=False):
+    cfg = Config.fromfile(config_file)
+    model = build_model(cfg.model).eval()
+    if weight:
+        model.load_state_dict(load_weights(weight))
+    model.backbone.precompute_identity_table()
+    if optimize:
+        model.backbone.optimize_for_inference()
+    return model
+
+
+def load_clips(paths, seconds, count, seed=0):
+    if paths:
+        import librosa
+        return [librosa.load(path, sr=16000)[0] for path in paths]
+    rng = np.random.default_rng(seed)
+    clips = []
+    for _ in range(count):
+        t = np.arange(int(seconds * 16000)) / 16000
+        pitch = 110 + 60 * np.sin(2 * np.pi * rng.uniform(0.2, 1.0) * t)
+        phase = 2 * np.pi * np.cumsum(pitch) / 16000
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+        envelope = (np.sin(2 * np.pi * rng.uniform(1.5, 4.0) * t) > -0.2).astype(np.float32)
+        clips.append((0.1 * voiced * envelope + 0.01 * rng.standard_normal(len(t))).astype(np.float32))
+    return clips
+
+
+@torch.inference_mode()
+def accuracy(reference, quantized, clips, id_indices):
+    errors = []
+    for audio in clips:
+        batch = torch.from_numpy(np.ascontiguousarray(audio))[None].repeat(len(id_indices), 1)
+        input_dict = {'input_audio_array': batch, 'id_idx': torch.tensor(id_indices)}
+        expected = reference(input_dict)['pred_exp']
+        actual = quantized(input_dict)['pred_exp']
+        errors.append((expected - actual).abs().flatten(0, 1))
+    errors = torch.cat(errors)
+    per_blendshape = errors.mean(dim=0)
+    print(f"accuracy over {len(clips)} clips x {len(id_indices)} identities ({errors.shape[0]} frames): "
+          f"MAE {errors.mean():.5f}, max abs {errors.max():.5f}")
+    print(f"{'blendshape':>20} {'MAE':>9}")
+    for index in per_blendshape.argsort(descending=True).tolist():
+        print(f"{ARKitBlendShape[index]:>20} {per_blendshape[index]:>9.5f}")
+
+
+@torch.inference_mode()
+def throughput(models, batches, repeat, chunk_seconds, seed=0):
+    frames = 64
+    generator = torch.Generator().manual_seed(seed)
+    num_ids = models["fp32"].backbone.identity_encoder.id_mlp.in_channels
+    print(f"\nstreaming windows of {frames} frames, {chunk_seconds:g} s chunks per stream")
+    print(f"{'batch':>6} " + " ".join(f"{name + ' (ms)':>12}" for name in models) +
+          f" {'speedup':>8} " + " ".join(f"{name + ' streams':>14}" for name in models))
+    for batch in batches:
+        input_dict = {'input_audio_array': torch.randn(batch, frames * 16000 // 30, generator=generator),
+                      'id_idx': torch.randint(0, num_ids, (batch,), generator=generator), 'time_steps': frames}
+        timings = {}
+        for name, model in models.items():
+            model(input_dict)
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                model(input_dict)
+                best = min(best, time.perf_counter() - start)
+            timings[name] = best
+        # a stream needs one window per chunk, so a forward of `batch` windows serves
+        # batch * chunk_seconds / latency streams in real time
+        streams = {name: batch * chunk_seconds / timing for name, timing in timings.items()}
+        print(f"{batch:>6} " + " ".join(f"{timings[name] * 1000:>12.1f}" for name in models) +
+              f" {timings['fp32'] / timings['int8']:>7.2f}x " +
+              " ".join(f"{streams[name]:>14.1f}" for name in models))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="int8 dynamic quantization accuracy and throughput")
+    parser.add_argument("--config-file", default="configs/lam_audio2exp_config_streaming.py")
+    parser.add_argument("--weight", default=None, help="checkpoint, random weights without")
+    parser.add_argument("--audio", nargs="*", default=None, help="reference clips, synthetic without")
+    parser.add_argument("--seconds", type=float, default=4.0, help="length of synthetic clips")
+    parser.add_argument("--clips", type=int, default=4, help="number of synthetic clips")
+    parser.add_argument("--ids", type=int, nargs="+", default=[0, 5, 11])
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--chunk-seconds", type=float, default=0.5)
+    parser.add_argument("--optimize", action="store_true", help="fuse the decoder first (optimize_for_inference)")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    reference = build_estimator(args.config_file, args.weight, args.optimize)
+    quantized = quantize_model(copy.deepcopy(reference))
+
+    print(f"threads: {torch.get_num_threads()}, weights: {args.weight or 'random'}, "
+          f"fused decoder: {args.optimize}")
+    accuracy(reference, quantized, load_clips(args.audio, args.seconds, args.clips), args.ids)
+    throughput({"fp32": reference, "int8": quantized}, args.batch, args.repeat, args.chunk_seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Micro-benchmark of the vectorized silence handling in models/utils.py
+(smooth_mouth_movements) against the original per-frame loop implementation, which is
+kept here for timing. Its accidental edge cases are fixed the same way (marked "fixed:"
+below): the first silent run is counted in full, no signal gives no region, and edge
+blends are clipped to the clip instead of wrapping around or failing with an IndexError.
+The equivalence of both is tested in tests/test_silence.py.
+
+    python scripts/benchmark/silence_postprocess.py --minutes 1 10 60
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from models.utils import ARKitBlendShape, MOUTH_BLENDSHAPES, smooth_mouth_movements
+
+
+# ---------------- reference implementation (before vectorization) ----------------
+def legacy_blend_region_start(array, region, processed_boundary, blend_frames):
+    # fixed: no rows past the end of the array
+    blend_length = min(blend_frames, region[0] - processed_boundary, array.shape[0] - region[0])
+    if blend_length <= 0:
+        return
+    pre_frame = array[region[0] - 1]
+    for i in range(blend_length):
+        weight = (i + 1) / (blend_length + 1)
+        array[region[0] + i] = pre_frame * (1 - weight) + array[region[0] + i] * weight
+
+
+def legacy_blend_region_end(array, region, blend_frames):
+    # fixed: no negative rows, which wrapped around to the end of the array
+    blend_length = min(blend_frames, array.shape[0] - region[-1] - 1, region[-1] + 1)
+    if blend_length <= 0:
+        return
+    post_frame = array[region[-1] + 1]
+    for i in range(blend_length):
+        weight = (i + 1) / (blend_length + 1)
+        array[region[-1] - i] = post_frame * (1 - weight) + array[region[-1] - i] * weight
+
+
+def legacy_find_low_value_regions(signal, threshold, min_region_length=5):
+    low_value_indices = np.where(signal < threshold)[0]
+    # fixed: no region without low values
+    if len(low_value_indices) == 0:
+        return []
+    contiguous_regions = []
+    # fixed: counts the first index, the original started at 0 and counted the first run one short
+    current_region_length = 1
+    region_start_idx = 0
+    for i in range(1, len(low_value_indices)):
+        if low_value_indices[i] != low_value_indices[i - 1] + 1:
+            if current_region_length >= min_region_length:
+                contiguous_regions.append(low_value_indices[region_start_idx:i])
+            region_start_idx = i
+            current_region_length = 0
+        current_region_length += 1
+    if current_region_length >= min_region_length:
+        contiguous_regions.append(low_value_indices[region_start_idx:])
+    return contiguous_regions
+
+
+def legacy_smooth_mouth_movements(blend_shapes, processed_frames, volume=None, silence_threshold=0.001,
+                                  min_silence_duration=7, blend_window=3):
+    if volume is None:
+        return blend_shapes
+    silent_regions = legacy_find_low_value_regions(volume, threshold=silence_threshold,
+                                                   min_region_length=min_silence_duration)
+    for region_indices in silent_regions:
+        mouth_blend_indices = [ARKitBlendShape.index(name) for name in MOUTH_BLENDSHAPES]
+        for region_indice in region_indices.tolist():
+            blend_shapes[region_indice, mouth_blend_indices] *= 0.1
+        legacy_blend_region_start(blend_shapes, region_indices, processed_frames, blend_window)
+        legacy_blend_region_end(blend_shapes, region_indices, blend_window)
+    return blend_shapes
+
+
+# ---------------- test data ----------------
+def make_inputs(rng, num_frames, silence_ratio=0.3, dtype=np.float32):
+    """Random expressions and a volume track with silent stretches of random length."""
+    blend_shapes = rng.random((num_frames, 52)).astype(dtype)
+    volume = rng.uniform(0.002, 0.1, num_frames).astype(np.float32)
+    frame = 0
+    while frame < num_frames:
+        frame += int(rng.integers(1, 60))
+        if rng.random() < silence_ratio:
+            length = int(rng.integers(1, 40))
+            volume[frame:frame + length] = rng.uniform(0, 0.001, len(volume[frame:frame + length]))
+            frame += length
+    return blend_shapes, volume
+
+
+def benchmark(minutes, repeat=3, seed=0):
+    rng = np.random.default_rng(seed)
+    print(f"{'minutes':>8} {'frames':>8} {'legacy (ms)':>12} {'vectorized (ms)':>16} {'speedup':>8}")
+    for minute in minutes:
+        blend_shapes, volume = make_inputs(rng, int(minute * 60 * 30))
+        timings = []
+        for fn in (legacy_smooth_mouth_movements, smooth_mouth_movements):
+            best = float("inf")
+            for _ in range(repeat):
+                data = blend_shapes.copy()
+                start = time.perf_counter()
+                fn(data, 0, volume)
+                best = min(best, time.perf_counter() - start)
+            timings.append(best * 1000)
+        print(f"{minute:>8g} {len(blend_shapes):>8} {timings[0]:>12.1f} {timings[1]:>16.2f} "
+              f"{timings[0] / timings[1]:>7.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="silence post-processing benchmark")
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 10, 60])
+    args = parser.parse_args()
+
+    benchmark(args.minutes)
+
+
+if __name__ == "__main__":
+    main()
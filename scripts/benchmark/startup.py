@@ -0,0 +1,146 @@
+"""
+Cold start time of the inference engine, split into import and load phases.
+
+Every run is a fresh interpreter so imports are not cached; the median of --repeat runs is
+reported per variant: the model built with random init (``fast_init=False``), the fast-start
+path (``fast_init=True``: no init, no pretrained encoder, weights assigned from the
+checkpoint) and, with --exported, a directory written by engines/export.py. --weight takes the
+``.tar`` checkpoint or its memory-mapped ``.safetensors`` conversion (utils/checkpoint.py).
+
+    python scripts/benchmark/startup.py --weight pretrained_models/lam_audio2exp_streaming.tar \
+        --exported exported/streaming --repeat 5
+
+Phases: import_torch, import_server (api_server and its dependencies), import_model (the
+network code and transformers), construct, checkpoint (load_weights), load_state_dict,
+prepare (prepare_model), separator (spleeter/TensorFlow, only with serving.preload_separator
+like at server boot), digest (module_digest of the result cache) and first_request (a 2 s
+clip, including lazily imported libraries); total is the wall time up to the first result.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+PHASES = ("import_torch", "import_server", "import_model", "construct", "checkpoint", "load_state_dict",
+          "prepare", "separator", "digest", "first_request", "total")
+
+
+def timed(owner, name, phase, timings):
+    """Replaces ``owner.name`` by a wrapper adding its run time to ``timings[phase]``."""
+    original = getattr(owner, name)
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start
+
+    setattr(owner, name, wrapper)
+
+
+def child(args):
+    start = time.perf_counter()
+    timings = {}
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+
+    import torch
+    timings["import_torch"] = time.perf_counter() - start
+
+    mark = time.perf_counter()
+    import api_server  # noqa: F401, the serving imports
+    import engines.infer
+    from engines.infer import INFER
+    from utils.config import Config
+    from utils.result_cache import module_digest
+    timings["import_server"] = time.perf_counter() - mark
+
+    if not args.exported:
+        mark = time.perf_counter()
+        import models.network  # noqa: F401
+        timings["import_model"] = time.perf_counter() - mark
+
+    cfg = Config.fromfile(args.config_file)
+    cfg.weight = args.weight
+    cfg.device = args.device
+    cfg.save_path = tempfile.mkdtemp()
+    cfg.fast_init = args.fast_init
+    engine_type = cfg.infer.type
+    if args.exported:
+        cfg.exported_model = args.exported
+        engine_type = "Audio2ExpressionExportedInfer"
+    engine_class = INFER.get(engine_type)
+    timed(engines.infer, "build_model", "construct", timings)
+    timed(engines.infer, "ExportedAudio2Expression", "construct", timings)
+    timed(engines.infer, "load_weights", "checkpoint", timings)
+    timed(torch.nn.Module, "load_state_dict", "load_state_dict", timings)
+    timed(engine_class, "prepare_model", "prepare", timings)
+
+    engine = INFER.build(dict(type=engine_type, cfg=cfg))
+    engine.model.eval()
+    if cfg.get("serving", {}).get("preload_separator", False):
+        mark = time.perf_counter()
+        try:
+            engine.separator.load()
+        except Exception:
+            pass  # the server only warns, ex_vol requests keep the original audio
+        timings["separator"] = time.perf_counter() - mark
+    mark = time.perf_counter()
+    module_digest(engine.model)
+    timings["digest"] = time.perf_counter() - mark
+
+    import numpy as np
+    audio = (0.1 * np.random.default_rng(0).standard_normal(2 * 16000)).astype(np.float32)
+    mark = time.perf_counter()
+    engine.predict_expression(audio, 0)
+    timings["first_request"] = time.perf_counter() - mark
+    timings["total"] = time.perf_counter() - start
+    print(json.dumps(timings))
+
+
+def run(args, fast_init, exported=None):
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--config-file", args.config_file,
+               "--weight", args.weight, "--device", args.device, "--fast-init", str(int(fast_init))]
+    if exported:
+        command += ["--exported", exported]
+    results = []
+    for _ in range(args.repeat):
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {phase: statistics.median(result.get(phase, 0.0) for result in results) for phase in PHASES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="engine cold start time per phase")
+    parser.add_argument("--config-file", default="configs/lam_audio2exp_config_streaming.py")
+    parser.add_argument("--weight", required=True)
+    parser.add_argument("--exported", default=None, help="also time a directory written by engines/export.py")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--fast-init", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.fast_init = bool(args.fast_init)
+        return child(args)
+
+    variants = {"random init": run(args, fast_init=False), "fast_init": run(args, fast_init=True)}
+    if args.exported:
+        variants["exported"] = run(args, fast_init=True, exported=args.exported)
+    print(f"median of {args.repeat} cold starts (s), device: {args.device}, weights: {args.weight}")
+    print(f"{'phase':>16} " + " ".join(f"{name:>12}" for name in variants))
+    for phase in PHASES:
+        print(f"{phase:>16} " + " ".join(f"{timings[phase]:>12.2f}" for timings in variants.values()))
+
+
+if __name__ == "__main__":
+    main()
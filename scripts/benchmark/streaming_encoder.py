@@ -0,0 +1,101 @@
+"""
+Steady-state drift of the incremental streaming encoder (Audio2ExpressionStreamingInfer)
+against the streaming path that encodes every window in full (Audio2ExpressionInfer).
+
+Both engines share one model and stream the same clips chunk by chunk; post-processing is
+disabled so the raw expressions are compared. The first window matches up to float
+rounding; afterwards the first conv layer's group norm uses statistics accumulated over the
+previous chunks instead of the current window, so the outputs drift by an amount that
+depends on the chunk length. Fails with an AssertionError when the steady-state drift
+exceeds the tolerance of a chunk length.
+
+    python scripts/benchmark/streaming_encoder.py --weight pretrained_models/lam_audio2exp_streaming.tar
+
+Without --audio, synthetic clips are used (see quantization.py); without --weight the model
+is randomly initialized.
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import numpy as np
+import torch
+
+from engines.infer import INFER
+from utils.config import Config
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from quantization import build_estimator, load_clips
+
+# max abs drift of the [0, 1] blendshape weights accepted per chunk length (s), after the first window
+TOLERANCES = {
+    1.0: 0.1,
+    0.5: 0.15,
+    0.2: 0.2,
+}
+
+
+def stream(engine, audio, chunk_seconds, id_idx, postprocess):
+    chunk = int(chunk_seconds * 16000)
+    context, outputs = None, []
+    for start in range(0, len(audio) - chunk + 1, chunk):
+        output, context = engine.infer_streaming_audio(audio[start:start + chunk], 16000, context, id_idx,
+                                                       postprocess=postprocess)
+        assert output["code"] == 0, f"chunk at {start / 16000:.1f}s failed"
+        outputs.append(output["expression"])
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="incremental streaming encoder drift")
+    parser.add_argument("--config-file", default="configs/lam_audio2exp_config_streaming.py")
+    parser.add_argument("--weight", default=None, help="checkpoint, random weights without")
+    parser.add_argument("--audio", nargs="*", default=None, help="reference clips, synthetic without")
+    parser.add_argument("--seconds", type=float, default=12.0)
+    parser.add_argument("--clips", type=int, default=3)
+    parser.add_argument("--ids", type=int, nargs="+", default=[0, 5])
+    parser.add_argument("--chunks", type=float, nargs="+", default=list(TOLERANCES), choices=list(TOLERANCES))
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = build_estimator(args.config_file, args.weight).eval()
+    cfg = Config.fromfile(args.config_file)
+    cfg.device = "cpu"
+    cfg.save_path = tempfile.mkdtemp()
+    engines = {name: INFER.build(dict(type=name, cfg=cfg, model=model))
+               for name in ("Audio2ExpressionInfer", "Audio2ExpressionStreamingInfer")}
+    reference, incremental = engines.values()
+    postprocess = reference.postprocess.configure(stages=())
+    # chunks whose window still holds the silence the first window is padded with
+    warmup_seconds = incremental.max_frame_length / 30
+
+    clips = load_clips(args.audio, args.seconds, args.clips)
+    print(f"weights: {args.weight or 'random'}, {len(args.ids)} identities x {len(clips)} clips")
+    print(f"{'chunk (s)':>9} {'first max':>10} {'steady mean':>12} {'steady max':>11} {'tolerance':>10}")
+    failures = []
+    for chunk_seconds in args.chunks:
+        first, steady = [], []
+        for audio in clips:
+            for id_idx in args.ids:
+                expected = stream(reference, audio, chunk_seconds, id_idx, postprocess)
+                actual = stream(incremental, audio, chunk_seconds, id_idx, postprocess)
+                errors = [np.abs(e - a) for e, a in zip(expected, actual)]
+                first.append(errors[0].max())
+                warmup = int(np.ceil(warmup_seconds / chunk_seconds))
+                steady.extend(error.flatten() for error in errors[warmup:])
+        steady = np.concatenate(steady)
+        tolerance = TOLERANCES[chunk_seconds]
+        print(f"{chunk_seconds:>9} {max(first):>10.2e} {steady.mean():>12.5f} {steady.max():>11.5f} {tolerance:>10g}")
+        if steady.max() > tolerance:
+            failures.append(chunk_seconds)
+    assert not failures, f"drift above tolerance for chunks of {failures} s"
+
+
+if __name__ == "__main__":
+    main()
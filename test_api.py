@@ -223,6 +223,81 @@ class APITester:
             
             print_info(f"ID {id_idx}: 生成 {result['metadata']['frame_count']} 帧")
     
+    def test_seed_reproducibility(self):
+        """测试随机种子：相同种子结果一致，不同种子随机眨眼和眉毛动作不同"""
+        print_info("POST /api/infer (seed)")
+        
+        def infer(seed):
+            files = {'audio_file': open(self.test_audio, 'rb')}
+            data = {'id_idx': 0, 'brow_movement': True, 'seed': seed}
+            response = requests.post(f"{self.base_url}/api/infer", files=files, data=data)
+            assert response.status_code == 200, f"seed={seed} 状态码错误: {response.status_code}"
+            result = response.json()
+            assert result['metadata'].get('seed') == seed, "metadata中缺少seed"
+            return np.array([frame['weights'] for frame in result['frames']])
+        
+        first, second, other = infer(7), infer(7), infer(8)
+        assert np.array_equal(first, second), "相同种子结果不一致"
+        assert not np.array_equal(first, other), "不同种子结果相同"
+        print_info(f"相同种子一致, 不同种子最大差异 {np.abs(first - other).max():.3f}")
+    
+    def test_result_cache_unseeded(self):
+        """测试结果缓存：未指定种子的重复请求命中缓存，随机眨眼和眉毛动作仍然每次不同"""
+        print_info("POST /api/infer (重复的无种子请求)")
+        
+        stats = requests.get(f"{self.base_url}/api/health").json().get('result_cache')
+        if stats is None:
+            print_warning("未启用 serving.result_cache，跳过")
+            return
+        
+        num_requests = 4
+        results = []
+        for _ in range(num_requests):
+            files = {'audio_file': open(self.test_audio, 'rb')}
+            response = requests.post(f"{self.base_url}/api/infer", files=files,
+                                     data={'id_idx': 3, 'brow_movement': True})
+            assert response.status_code == 200, f"状态码错误: {response.status_code}"
+            results.append(response.json())
+        
+        cached = [result['metadata']['cached'] for result in results]
+        assert all(cached[1:]), f"重复请求未命中缓存: {cached}"
+        hits = requests.get(f"{self.base_url}/api/health").json()['result_cache']['hits'] - stats['hits']
+        assert hits >= num_requests - 1, f"缓存命中次数过少: {hits}"
+        weights = [np.array([frame['weights'] for frame in result['frames']]) for result in results]
+        assert any(not np.array_equal(weights[0], w) for w in weights[1:]), "命中缓存后随机动作不再变化"
+        print_info(f"命中率 {sum(cached[1:])}/{num_requests - 1} (首次请求 cached={cached[0]})")
+    
+    def test_multi_identity_inference(self):
+        """测试一次请求推理多个身份ID"""
+        print_info("POST /api/infer_multi")
+        
+        test_ids = [0, 5, 11]
+        files = {'audio_file': open(self.test_audio, 'rb')}
+        data = {'id_indices': ','.join(map(str, test_ids)), 'seed': 0}
+        response = requests.post(f"{self.base_url}/api/infer_multi", files=files, data=data)
+        
+        assert response.status_code == 200, f"状态码错误: {response.status_code}"
+        result = response.json()
+        assert [style['id_idx'] for style in result['styles']] == test_ids, "身份ID顺序不匹配"
+        frame_count = result['metadata']['frame_count']
+        assert all(len(style['frames']) == frame_count for style in result['styles']), "帧数不匹配"
+        
+        # 与单身份请求结果一致
+        files = {'audio_file': open(self.test_audio, 'rb')}
+        single = requests.post(f"{self.base_url}/api/infer", files=files, data={'id_idx': 5, 'seed': 0}).json()
+        single_weights = np.array([frame['weights'] for frame in single['frames']])
+        multi_weights = np.array([frame['weights'] for frame in result['styles'][1]['frames']])
+        assert np.allclose(single_weights, multi_weights, atol=1e-5), "与单身份推理结果不一致"
+        
+        print_info(f"{len(test_ids)} 个身份, 每个 {frame_count} 帧, 耗时 {result['metadata']['inference_time']:.3f}秒")
+        
+        # 无效的身份列表
+        for id_indices in ['[true, false]', '[0, true]', '[]', '[1.5]', '0,a']:
+            files = {'audio_file': open(self.test_audio, 'rb')}
+            response = requests.post(f"{self.base_url}/api/infer_multi", files=files, data={'id_indices': id_indices})
+            assert response.status_code == 400, f"id_indices={id_indices}: 应该返回400，实际: {response.status_code}"
+        print_info("无效id_indices: 400")
+    
     def test_streaming_init(self):
         """测试流式推理初始化"""
         print_info("POST /api/infer_stream_init")
@@ -337,6 +412,48 @@ class APITester:
         # 清理会话
         self.session_id = session_id
     
+    def load_pcm(self, seconds: float = 1.0, sr: int = 16000, pcm_format: str = 's16le') -> bytes:
+        """测试音频的前几秒，编码为裸PCM"""
+        import librosa
+        audio, _ = librosa.load(self.test_audio, sr=sr, duration=seconds)
+        if pcm_format == 's16le':
+            return (np.clip(audio, -1, 1) * 32767).astype('<i2').tobytes()
+        return audio.astype('<f4').tobytes()
+    
+    def test_streaming_raw_pcm(self):
+        """测试流式推理处理裸PCM chunk"""
+        print_info("POST /api/infer_stream_chunk/{session_id} (X-Audio-Format, X-Sample-Rate)")
+        
+        response = requests.post(f"{self.base_url}/api/infer_stream_init", json={'id_idx': 0})
+        session_id = response.json()['session_id']
+        
+        try:
+            # 请求体直接是PCM数据，格式和采样率通过请求头指定
+            for i, (pcm_format, sr) in enumerate([('s16le', 16000), ('f32le', 16000), ('s16le', 44100)]):
+                response = requests.post(
+                    f"{self.base_url}/api/infer_stream_chunk/{session_id}",
+                    data=self.load_pcm(1.0, sr, pcm_format),
+                    headers={'Content-Type': 'application/octet-stream',
+                             'X-Audio-Format': pcm_format, 'X-Sample-Rate': str(sr)}
+                )
+                assert response.status_code == 200, f"{pcm_format}@{sr} 状态码错误: {response.status_code}"
+                metadata = response.json()['metadata']
+                assert metadata['chunk_index'] == i + 1, f"Chunk索引错误: {metadata['chunk_index']}"
+                assert abs(metadata['audio_length'] - 1.0) < 0.01, f"音频时长错误: {metadata['audio_length']}"
+                assert metadata['frame_count'] > 0, "未生成帧"
+                print_info(f"{pcm_format}@{sr}Hz: {metadata['frame_count']}帧")
+            
+            # multipart接口通过表单字段指定裸PCM
+            response = requests.post(
+                f"{self.base_url}/api/infer_stream_chunk",
+                files={'audio_chunk': ('chunk.pcm', self.load_pcm(1.0, 8000), 'application/octet-stream')},
+                data={'session_id': session_id, 'audio_format': 's16le', 'sample_rate': 8000}
+            )
+            assert response.status_code == 200, f"multipart裸PCM状态码错误: {response.status_code}"
+            assert response.json()['metadata']['chunk_index'] == 4, "Chunk索引错误"
+        finally:
+            requests.delete(f"{self.base_url}/api/infer_stream_close/{session_id}")
+    
     def test_streaming_close(self):
         """测试关闭流式会话"""
         print_info("DELETE /api/infer_stream_close/{session_id}")
@@ -373,6 +490,59 @@ class APITester:
         
         self.session_id = None
     
+    def test_streaming_websocket(self):
+        """测试WebSocket流式推理"""
+        print_info("WS /ws/stream")
+        
+        try:
+            from websockets.sync.client import connect
+        except ImportError:
+            print_warning("未安装 websockets，跳过")
+            return
+        
+        import librosa
+        from utils.blendshape_codec import decode_blendshapes
+        audio, _ = librosa.load(self.test_audio, sr=16000)
+        pcm = (np.clip(audio, -1, 1) * 32767).astype('<i2').tobytes()
+        
+        ws_url = self.base_url.replace("http", "ws", 1) + "/ws/stream?id_idx=0&chunk_ms=1000"
+        with connect(ws_url) as ws:
+            session = json.loads(ws.recv())
+            assert session['type'] == 'session', "缺少会话消息"
+            assert len(session['names']) == 52, "Blendshape名称数量错误"
+            
+            # 以20ms的小帧发送，模拟实时麦克风输入
+            for i in range(0, len(pcm), 640):
+                ws.send(pcm[i:i + 640])
+            ws.send(json.dumps({'type': 'end'}))
+            
+            total_frames = 0
+            while True:
+                message = ws.recv()
+                if isinstance(message, bytes):
+                    header, frames = decode_blendshapes(message)
+                    assert frames.shape[1] == 52, "Blendshape数量错误"
+                    total_frames += len(frames)
+                    continue
+                message = json.loads(message)
+                assert message['type'] != 'error', f"推理失败: {message.get('detail')}"
+                if message['type'] == 'end':
+                    break
+        
+        print_info(f"共 {message['chunk_count']} 个chunk, {total_frames} 帧")
+        assert total_frames > 0, "未收到blendshape数据"
+        
+        # 无效采样率在接收音频前以1003关闭连接
+        from websockets.exceptions import ConnectionClosed
+        for sample_rate in ['0', '5', 'abc']:
+            with connect(ws_url + f"&sample_rate={sample_rate}") as ws:
+                try:
+                    ws.recv(timeout=10)
+                    raise AssertionError(f"采样率 {sample_rate}: 连接未关闭")
+                except ConnectionClosed as e:
+                    assert e.rcvd is not None and e.rcvd.code == 1003, f"采样率 {sample_rate}: 关闭码错误 {e.rcvd}"
+        print_info("无效采样率: 1003")
+    
     def test_error_handling_invalid_audio(self):
         """测试错误处理：无效音频"""
         print_info("测试错误处理：无效音频文件")
@@ -400,6 +570,50 @@ class APITester:
         finally:
             os.remove(temp_file)
     
+    def test_error_handling_invalid_pcm(self):
+        """测试错误处理：无效的裸PCM格式和采样率"""
+        print_info("POST /api/infer_stream_chunk/{session_id} (无效参数)")
+        
+        response = requests.post(f"{self.base_url}/api/infer_stream_init", json={'id_idx': 0})
+        session_id = response.json()['session_id']
+        pcm = self.load_pcm(1.0)
+        
+        cases = [
+            ('不支持的数据类型', pcm, {'X-Audio-Format': 's24le'}, [400]),
+            ('采样率为0', pcm, {'X-Sample-Rate': '0'}, [400]),
+            ('负采样率', pcm, {'X-Sample-Rate': '-16000'}, [400]),
+            ('非整数采样率', pcm, {'X-Sample-Rate': '16000.5'}, [400, 422]),
+            ('长度不是完整样本', pcm[:-1], {}, [400]),
+            ('空数据', b'', {}, [400]),
+        ]
+        try:
+            for name, body, headers, expected in cases:
+                response = requests.post(
+                    f"{self.base_url}/api/infer_stream_chunk/{session_id}",
+                    data=body,
+                    headers=dict({'Content-Type': 'application/octet-stream'}, **headers)
+                )
+                assert response.status_code in expected, f"{name}: 应该返回{expected}，实际: {response.status_code}"
+                print_info(f"{name}: {response.status_code}")
+            
+            response = requests.post(
+                f"{self.base_url}/api/infer_stream_chunk",
+                files={'audio_chunk': ('chunk.pcm', pcm, 'application/octet-stream')},
+                data={'session_id': session_id, 'audio_format': 's16le', 'sample_rate': 0}
+            )
+            assert response.status_code == 400, f"multipart采样率为0: 应该返回400，实际: {response.status_code}"
+            
+            # 出错的chunk不计入会话
+            response = requests.post(
+                f"{self.base_url}/api/infer_stream_chunk/{session_id}",
+                data=pcm,
+                headers={'Content-Type': 'application/octet-stream'}
+            )
+            assert response.status_code == 200, f"有效chunk状态码错误: {response.status_code}"
+            assert response.json()['metadata']['chunk_index'] == 1, "出错的chunk计入了会话"
+        finally:
+            requests.delete(f"{self.base_url}/api/infer_stream_close/{session_id}")
+    
     def test_error_handling_invalid_session(self):
         """测试错误处理：无效会话ID"""
         print_info("测试错误处理：无效会话ID")
@@ -458,6 +672,31 @@ class APITester:
         print_info(f"最快: {min(times):.3f}秒")
         print_info(f"最慢: {max(times):.3f}秒")
     
+    def test_binary_response_format(self):
+        """测试二进制blendshape响应格式"""
+        print_info("POST /api/infer (response_format=f16/u8)")
+        
+        from utils.blendshape_codec import decode_blendshapes
+        
+        sizes = {}
+        for response_format in ['json', 'f16', 'u8']:
+            files = {'audio_file': open(self.test_audio, 'rb')}
+            data = {'id_idx': 0, 'response_format': response_format}
+            response = requests.post(f"{self.base_url}/api/infer", files=files, data=data)
+            assert response.status_code == 200, f"{response_format} 状态码错误: {response.status_code}"
+            sizes[response_format] = len(response.content)
+            
+            if response_format == 'json':
+                frame_count = response.json()['metadata']['frame_count']
+                continue
+            
+            assert response.headers['content-type'].startswith('application/x-blendshape'), "Content-Type错误"
+            header, frames = decode_blendshapes(response.content)
+            assert header['dtype'] == response_format, "dtype不匹配"
+            assert frames.shape == (frame_count, 52), f"帧数不匹配: {frames.shape}"
+        
+        print_info("响应大小: " + ", ".join(f"{k}={v / 1024:.1f}KB" for k, v in sizes.items()))
+    
     def test_output_validation(self):
         """验证输出数据的正确性"""
         print_info("验证输出数据")
@@ -527,22 +766,29 @@ class APITester:
         self.run_test("标准推理（基础参数）", self.test_standard_inference_basic)
         self.run_test("标准推理（完整参数）", self.test_standard_inference_full_params)
         self.run_test("标准推理（不同ID）", self.test_standard_inference_different_ids)
+        self.run_test("标准推理（随机种子）", self.test_seed_reproducibility)
+        self.run_test("标准推理（结果缓存）", self.test_result_cache_unseeded)
+        self.run_test("标准推理（多身份）", self.test_multi_identity_inference)
         
         # 流式推理测试
         print_header("流式推理测试")
         self.run_test("流式推理初始化", self.test_streaming_init)
         self.run_test("流式推理处理chunk", self.test_streaming_chunk)
         self.run_test("流式推理多个chunk", self.test_streaming_multiple_chunks)
+        self.run_test("流式推理裸PCM", self.test_streaming_raw_pcm)
         self.run_test("流式推理关闭会话", self.test_streaming_close)
+        self.run_test("WebSocket流式推理", self.test_streaming_websocket)
         
         # 错误处理测试
         print_header("错误处理测试")
         self.run_test("错误处理：无效音频", self.test_error_handling_invalid_audio)
+        self.run_test("错误处理：无效裸PCM", self.test_error_handling_invalid_pcm)
         self.run_test("错误处理：无效会话", self.test_error_handling_invalid_session)
         
         # 高级测试
         print_header("高级测试")
         self.run_test("输出数据验证", self.test_output_validation)
+        self.run_test("二进制响应格式", self.test_binary_response_format)
         self.run_test("性能基准测试", self.test_performance_benchmark)
         
         # 打印测试结果
@@ -625,11 +871,13 @@ def main():
         tester.run_test("流式推理初始化", tester.test_streaming_init)
         tester.run_test("流式推理处理chunk", tester.test_streaming_chunk)
         tester.run_test("流式推理多个chunk", tester.test_streaming_multiple_chunks)
+        tester.run_test("流式推理裸PCM", tester.test_streaming_raw_pcm)
         tester.run_test("流式推理关闭会话", tester.test_streaming_close)
         tester.print_summary()
     elif args.test == "error":
         print_header("错误处理测试")
         tester.run_test("错误处理：无效音频", tester.test_error_handling_invalid_audio)
+        tester.run_test("错误处理：无效裸PCM", tester.test_error_handling_invalid_pcm)
         tester.run_test("错误处理：无效会话", tester.test_error_handling_invalid_session)
         tester.print_summary()
     elif args.test == "performance":
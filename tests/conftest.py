@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the repository root holds the top-level packages (models, utils, engines)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
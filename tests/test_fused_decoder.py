@@ -0,0 +1,66 @@
+import os
+import copy
+
+import pytest
+import torch
+
+from models.network import Audio2Expression, ConvNormRelu
+
+WAV2VEC2_CONFIG = os.path.join(os.path.dirname(__file__), "..", "configs", "wav2vec2_config.json")
+
+
+def randomize_norm(block):
+    """Non-trivial affine parameters and running statistics, as after training."""
+    generator = torch.Generator().manual_seed(1)
+    norm = block.norm
+    with torch.no_grad():
+        norm.weight.copy_(torch.rand(norm.weight.shape, generator=generator) + 0.5)
+        norm.bias.copy_(torch.randn(norm.bias.shape, generator=generator))
+        if isinstance(norm, torch.nn.BatchNorm1d):
+            norm.running_mean.copy_(torch.randn(norm.running_mean.shape, generator=generator))
+            norm.running_var.copy_(torch.rand(norm.running_var.shape, generator=generator) + 0.5)
+
+
+@pytest.mark.parametrize("norm", ["bn", "ln"])
+@pytest.mark.parametrize("residual, out_channels", [(False, 32), (True, 32), (True, 48)])
+@torch.inference_mode()
+def test_fused_conv_norm_relu_matches_unfused(norm, residual, out_channels):
+    torch.manual_seed(0)
+    block = ConvNormRelu(32, out_channels, norm=norm, residual=residual)
+    randomize_norm(block)
+    block.eval()
+    x = torch.randn(2, 32, 20)
+    expected = block(x)
+
+    assert block.fuse_for_inference()
+    actual = block.forward_channels_last(x.transpose(1, 2)).transpose(1, 2)
+    torch.testing.assert_close(actual, expected, rtol=0, atol=1e-4)
+
+
+def test_fuse_skips_unsupported_layouts():
+    assert not ConvNormRelu(16, 16, norm="gn").fuse_for_inference()
+    assert not ConvNormRelu(16, 16, downsample=True).fuse_for_inference()
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    model = Audio2Expression(wav2vec2_config_path=WAV2VEC2_CONFIG, num_identity_classes=4,
+                             hidden_dim=64, load_pretrained_encoder=False)
+    for block in model.modules():
+        if isinstance(block, ConvNormRelu):
+            randomize_norm(block)
+    return model.eval()
+
+
+@torch.inference_mode()
+def test_optimized_forward_matches_original(model):
+    input_dict = {'input_audio_array': 0.1 * torch.randn(2, 16000), 'id_idx': torch.tensor([0, 3])}
+    expected = model(input_dict)
+
+    fused = copy.deepcopy(model).optimize_for_inference()
+    assert fused.fused_inference
+    assert all(block.fused is not None for block in fused.modules() if isinstance(block, ConvNormRelu))
+    actual = fused(input_dict)
+    assert actual.shape == expected.shape
+    torch.testing.assert_close(actual, expected, rtol=0, atol=1e-4)
@@ -0,0 +1,63 @@
+import warnings
+
+import numpy as np
+import pytest
+import torch
+
+from models.postprocess import MAX_SAVGOL_LOOKAHEAD, PostProcessPipeline
+
+
+@pytest.fixture(scope="module")
+def pipeline():
+    return PostProcessPipeline(stages=("savgol",))
+
+
+@pytest.mark.parametrize("lookahead", range(MAX_SAVGOL_LOOKAHEAD + 1))
+def test_savgol_lookahead_accepted(pipeline, lookahead):
+    configured = pipeline.configure(savgol_window=MAX_SAVGOL_LOOKAHEAD * 2 + 1, savgol_lookahead=lookahead)
+    assert configured.options["savgol_lookahead"] == lookahead
+
+    expression = np.random.default_rng(0).random((12, 52), dtype=np.float32)
+    state = {}
+    for chunk in np.split(expression, 3):
+        assert configured(chunk.copy(), state=state).shape == chunk.shape
+
+
+@pytest.mark.parametrize("window", [5, 31])
+def test_savgol_lookahead_above_limit_rejected(pipeline, window):
+    with pytest.raises(ValueError, match="savgol_lookahead"):
+        pipeline.configure(savgol_window=window, savgol_lookahead=MAX_SAVGOL_LOOKAHEAD + 1)
+
+
+def test_savgol_lookahead_limited_by_window(pipeline):
+    assert pipeline.configure(savgol_window=3, savgol_lookahead=1).options["savgol_lookahead"] == 1
+    with pytest.raises(ValueError, match="savgol_lookahead"):
+        pipeline.configure(savgol_window=3, savgol_lookahead=2)
+    with pytest.raises(ValueError, match="savgol_lookahead"):
+        pipeline.configure(savgol_lookahead=-1)
+
+
+@pytest.mark.parametrize("stages", ["savgol", None, {"savgol": True}])
+def test_stages_must_be_a_list(pipeline, stages):
+    with pytest.raises(ValueError, match="stages must be a list"):
+        pipeline.configure(stages=stages)
+
+
+def test_stages_list_accepted(pipeline):
+    assert pipeline.configure(stages=["savgol", "blink"]).stages == ("savgol", "blink")
+
+
+def test_torch_savgol_coeffs_built_once(pipeline):
+    configured = pipeline.configure(savgol_window=7)
+    expressions = [torch.rand(10, 52), torch.rand(6, 52)]
+    states = [{}, {}]
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        for _ in range(2):
+            outputs = configured.run_batch(expressions, [0, 0], [None, None], states)
+    coeffs = configured._torch_coeffs(torch.device("cpu"), torch.float32)
+    assert coeffs is configured._torch_coeffs(torch.device("cpu"), torch.float32)
+    np.testing.assert_array_equal(coeffs.numpy(), configured._causal_coeffs.astype(np.float32))
+    assert [output.shape for output in outputs] == [(10, 52), (6, 52)]
+    # a derived pipeline gets its own coefficients
+    assert pipeline.configure(savgol_window=9)._torch_coeffs(torch.device("cpu"), torch.float32).shape[1] == 9
@@ -0,0 +1,78 @@
+import os
+import copy
+
+import numpy as np
+import pytest
+import torch
+
+from engines.infer import INFER, PRECISION_TOLERANCES
+from models import build_model
+from utils.config import Config
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+def make_cfg(save_path, **options):
+    cfg = Config.fromfile(os.path.join(ROOT, "configs", "lam_audio2exp_config_streaming.py"))
+    cfg.model.backbone.wav2vec2_config_path = os.path.join(ROOT, "configs", "wav2vec2_config.json")
+    cfg.model.backbone.load_pretrained_encoder = False
+    cfg.save_path = str(save_path)
+    cfg.device = "cpu"
+    cfg.update(options)
+    return cfg
+
+
+def voiced_clip(seconds=2.0, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * 16000)) / 16000
+    phase = 2 * np.pi * np.cumsum(110 + 40 * np.sin(2 * np.pi * 0.5 * t)) / 16000
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6)) * (np.sin(2 * np.pi * 2 * t) > -0.2)
+    return (0.1 * voiced + 0.01 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def engines(tmp_path_factory):
+    cfg = make_cfg(tmp_path_factory.mktemp("fp32"))
+    torch.manual_seed(0)
+    model = build_model(cfg.model).eval()
+    engines = {}
+    for precision in ("fp32", "bf16"):
+        cfg = make_cfg(tmp_path_factory.mktemp(precision), precision=precision)
+        engine = INFER.build(dict(type=cfg.infer.type, cfg=cfg, model=model))
+        # the cast build_model applies to a loaded checkpoint
+        engine.model = engine.prepare_model(copy.deepcopy(model))
+        engines[precision] = engine
+    return engines
+
+
+def test_bf16_weights_cast(engines):
+    assert engines["bf16"].dtype == torch.bfloat16
+    assert all(p.dtype == torch.bfloat16 for p in engines["bf16"].model.parameters())
+
+
+def test_bf16_drift_within_tolerance(engines):
+    audio = voiced_clip()
+    expected = engines["fp32"].predict_expressions(audio, [0, 5, 11])
+    actual = engines["bf16"].predict_expressions(audio, [0, 5, 11])
+    assert actual.dtype == np.float32
+    errors = np.abs(expected - actual)
+    mean_tol, max_tol = PRECISION_TOLERANCES["bf16"]
+    assert errors.mean() <= mean_tol and errors.max() <= max_tol, (errors.mean(), errors.max())
+
+
+def test_bf16_postprocessed_output_float32(engines):
+    engine = engines["bf16"]
+    audio = voiced_clip(seconds=1.0)
+    expression = engine.blendshape_postprocess(engine.predict_expression(audio, 0), volume=np.full(30, 0.05),
+                                               movement_smooth=True, brow_movement=True,
+                                               rng=np.random.default_rng(0))
+    assert expression.dtype == np.float32
+
+    for backend in ("numpy", "torch"):
+        engine.postprocess_backend = backend
+        context = None
+        for chunk in np.split(audio, 2):
+            output, context = engine.infer_streaming_audio(chunk, 16000, context, 0)
+            assert output["code"] == 0
+            assert output["expression"].dtype == np.float32
+    engine.postprocess_backend = "numpy"
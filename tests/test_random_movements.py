@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from models.postprocess import PostProcessPipeline
+from models.utils import apply_random_brow_movement, apply_random_eye_blinks, apply_random_eye_blinks_context
+
+
+def loud_volume(num_frames=900, seed=0):
+    """Volume track with loud stretches of varying length in every 5 s brow segment."""
+    rng = np.random.default_rng(seed)
+    volume = np.full(num_frames, 0.01)
+    for start in range(0, num_frames, 30):
+        volume[start:start + int(rng.integers(6, 25))] = 0.2
+    return volume
+
+
+def blinks(seed):
+    return apply_random_eye_blinks(np.zeros((600, 52), dtype=np.float32), rng=np.random.default_rng(seed))
+
+
+def context_blinks(seed):
+    return apply_random_eye_blinks_context(np.zeros((300, 52), dtype=np.float32), rng=np.random.default_rng(seed))
+
+
+def brows(seed):
+    return apply_random_brow_movement(np.zeros((900, 52), dtype=np.float32), loud_volume(),
+                                      rng=np.random.default_rng(seed))
+
+
+@pytest.mark.parametrize("movement", [blinks, context_blinks, brows])
+def test_same_seed_same_movement(movement):
+    expected = movement(7)
+    assert np.any(expected > 0)
+    np.testing.assert_array_equal(movement(7), expected)
+
+
+@pytest.mark.parametrize("movement", [blinks, context_blinks, brows])
+def test_different_seeds_different_movement(movement):
+    assert not np.array_equal(movement(7), movement(8))
+
+
+def test_offline_pipeline_reproducible_with_seed():
+    pipeline = PostProcessPipeline(stages=("brow", "savgol", "symmetrize", "blink"), blink="interval")
+    expression = np.random.default_rng(0).random((900, 52), dtype=np.float32) * 0.5
+    volume = loud_volume()
+
+    def run(seed):
+        return pipeline(expression.copy(), volume=volume, rng=np.random.default_rng(seed))
+
+    np.testing.assert_array_equal(run(3), run(3))
+    assert not np.array_equal(run(3), run(4))
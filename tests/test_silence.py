@@ -0,0 +1,154 @@
+import numpy as np
+import pytest
+
+from models.utils import (MOUTH_BLENDSHAPE_INDICES, _blend_region_edges, _low_value_runs, _run_indices,
+                          find_low_value_regions, smooth_mouth_movements)
+
+THRESHOLD = 0.001
+
+
+# ---------------- per-frame loop references ----------------
+def loop_low_value_runs(signal, threshold, min_region_length):
+    starts, ends, start = [], [], None
+    for i, value in enumerate(list(signal) + [threshold]):
+        if value < threshold and start is None:
+            start = i
+        elif value >= threshold and start is not None:
+            if i - start >= min_region_length:
+                starts.append(start)
+                ends.append(i - 1)
+            start = None
+    return starts, ends
+
+
+def loop_run_indices(starts, lengths, step):
+    rows, offsets = [], []
+    for start, length in zip(starts, lengths):
+        for i in range(length):
+            rows.append(start + step * i)
+            offsets.append(i)
+    return rows, offsets
+
+
+def loop_blend_region_edges(array, anchor_rows, edge_rows, blend_lengths, step):
+    for anchor, edge, length in zip(anchor_rows, edge_rows, blend_lengths):
+        for i in range(length):
+            weight = (i + 1) / (length + 1)
+            array[edge + step * i] = array[anchor] * (1 - weight) + array[edge + step * i] * weight
+
+
+def loop_smooth_mouth_movements(blend_shapes, processed_frames, volume, silence_threshold=THRESHOLD,
+                                min_silence_duration=7, blend_window=3):
+    num_frames = len(blend_shapes)
+    for start, end in zip(*loop_low_value_runs(volume, silence_threshold, min_silence_duration)):
+        for row in range(start, end + 1):
+            blend_shapes[row, MOUTH_BLENDSHAPE_INDICES] *= 0.1
+        length = min(blend_window, start - processed_frames, num_frames - start)
+        loop_blend_region_edges(blend_shapes, [start - 1], [start], [max(length, 0)], 1)
+        length = min(blend_window, num_frames - end - 1, end + 1)
+        loop_blend_region_edges(blend_shapes, [end + 1], [end], [max(length, 0)], -1)
+    return blend_shapes
+
+
+# ---------------- volume tracks ----------------
+def random_volume(rng, num_frames):
+    """Voiced volume with silent stretches of random length."""
+    volume = rng.uniform(0.002, 0.1, num_frames)
+    frame = 0
+    while frame < num_frames:
+        frame += int(rng.integers(0, 30))
+        length = int(rng.integers(1, 20))
+        volume[frame:frame + length] = rng.uniform(0, THRESHOLD, len(volume[frame:frame + length]))
+        frame += length
+    return volume
+
+
+def edge_volume(name, num_frames=40):
+    silent = np.zeros(num_frames, dtype=bool)
+    if name == "all_silent":
+        silent[:] = True
+    elif name == "run_at_start":
+        silent[:9] = True
+    elif name == "run_at_end":
+        silent[-9:] = True
+    elif name == "runs_at_both_ends":
+        silent[:2] = silent[-1:] = silent[15:17] = True
+    return np.where(silent, 0.0, 0.05)
+
+
+EDGE_CASES = ["all_silent", "none_silent", "run_at_start", "run_at_end", "runs_at_both_ends"]
+
+
+def volumes():
+    rng = np.random.default_rng(0)
+    cases = [(name, edge_volume(name)) for name in EDGE_CASES]
+    cases += [(f"random_{i}", random_volume(rng, int(rng.integers(1, 200)))) for i in range(20)]
+    return cases
+
+
+VOLUMES = volumes()
+
+
+@pytest.mark.parametrize("volume", [v for _, v in VOLUMES], ids=[name for name, _ in VOLUMES])
+@pytest.mark.parametrize("min_region_length", [0, 1, 2, 7])
+def test_low_value_runs_match_loop(volume, min_region_length):
+    starts, ends = _low_value_runs(volume, THRESHOLD, min_region_length)
+    expected_starts, expected_ends = loop_low_value_runs(volume, THRESHOLD, min_region_length)
+    assert starts.tolist() == expected_starts and ends.tolist() == expected_ends
+
+    regions = find_low_value_regions(volume, THRESHOLD, min_region_length)
+    assert [region.tolist() for region in regions] == \
+        [list(range(s, e + 1)) for s, e in zip(expected_starts, expected_ends)]
+
+
+def test_low_value_runs_edges():
+    assert [r.tolist() for r in _low_value_runs(edge_volume("all_silent"), THRESHOLD, 5)] == [[0], [39]]
+    assert [r.tolist() for r in _low_value_runs(edge_volume("none_silent"), THRESHOLD, 0)] == [[], []]
+    assert [r.tolist() for r in _low_value_runs(edge_volume("runs_at_both_ends"), THRESHOLD, 1)] == \
+        [[0, 15, 39], [1, 16, 39]]
+
+
+@pytest.mark.parametrize("step", [1, -1])
+def test_run_indices_match_loop(step):
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        starts = rng.integers(0, 100, int(rng.integers(0, 6)))
+        lengths = rng.integers(0, 5, len(starts))
+        rows, offsets = _run_indices(starts, lengths, step)
+        assert (rows.tolist(), offsets.tolist()) == loop_run_indices(starts.tolist(), lengths.tolist(), step)
+
+
+@pytest.mark.parametrize("step", [1, -1])
+def test_blend_region_edges_match_loop(step):
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        # one region per 10 rows, so no blend reads a row another one writes
+        num_regions = int(rng.integers(0, 5))
+        edge_rows = 10 * np.arange(num_regions) + 5
+        anchor_rows = edge_rows - step
+        blend_lengths = rng.integers(0, 5, num_regions)
+        array = rng.random((10 * num_regions + 1, 52))
+
+        expected = array.copy()
+        loop_blend_region_edges(expected, anchor_rows, edge_rows, blend_lengths, step)
+        _blend_region_edges(array, anchor_rows, edge_rows, blend_lengths, step)
+        np.testing.assert_allclose(array, expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize("volume", [v for _, v in VOLUMES], ids=[name for name, _ in VOLUMES])
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_smooth_mouth_movements_match_loop(volume, dtype):
+    rng = np.random.default_rng(len(volume))
+    blend_shapes = rng.random((len(volume), 52)).astype(dtype)
+    for min_silence_duration, blend_window in [(7, 3), (1, 5), (0, 0), (2, 1)]:
+        processed_frames = int(rng.integers(0, max(len(volume) // 2, 1)))
+        options = dict(min_silence_duration=min_silence_duration, blend_window=blend_window)
+        expected = loop_smooth_mouth_movements(blend_shapes.copy(), processed_frames, volume, **options)
+        actual = smooth_mouth_movements(blend_shapes.copy(), processed_frames, volume, **options)
+        assert actual.dtype == dtype
+        np.testing.assert_allclose(actual, expected, rtol=1e-6)
+
+
+def test_smooth_mouth_movements_without_volume():
+    blend_shapes = np.ones((10, 52), dtype=np.float32)
+    assert smooth_mouth_movements(blend_shapes, 0, None) is blend_shapes
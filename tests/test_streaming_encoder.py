@@ -0,0 +1,30 @@
+import pytest
+import torch
+from transformers import Wav2Vec2Config
+from transformers.models.wav2vec2.modeling_wav2vec2 import Wav2Vec2FeatureEncoder
+
+from models.encoder.wav2vec import StreamingFeatureEncoder
+
+
+@pytest.fixture(scope="module")
+def encoder():
+    torch.manual_seed(0)
+    feature_extractor = Wav2Vec2FeatureEncoder(Wav2Vec2Config(feat_extract_norm="group")).eval()
+    return StreamingFeatureEncoder(feature_extractor, window_samples=16000)
+
+
+@torch.inference_mode()
+def test_copied_state_leaves_session_state_unchanged(encoder):
+    audio = 0.1 * torch.randn(1, 3 * 8000)
+    state = encoder.init_state()
+    encoder(audio[:, :8000], state)
+    tails, norm_stats, features = list(state['tails']), list(state['norm_stats']), state['features']
+
+    advanced = encoder.copy_state(state)
+    expected = encoder(audio[:, 8000:16000], advanced).clone()
+    assert all(a is b for a, b in zip(state['tails'], tails))
+    assert state['norm_stats'] == norm_stats
+    assert state['features'] is features
+
+    # a retried chunk continues from the unchanged state exactly like the copy did
+    assert torch.equal(encoder(audio[:, 8000:16000], state), expected)
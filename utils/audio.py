@@ -0,0 +1,79 @@
+"""
+In-memory audio ingestion: raw PCM and container formats decoded straight from bytes.
+"""
+
+import io
+import os
+import tempfile
+
+import numpy as np
+import soundfile as sf
+import librosa
+
+
+PCM_FORMATS = {
+    "s16le": np.dtype("<i2"),
+    "f32le": np.dtype("<f4"),
+}
+
+
+def decode_pcm(data: bytes, sample_rate: int, pcm_format: str = "s16le", channels: int = 1) -> np.ndarray:
+    """Decodes headerless little-endian PCM into a float32 mono array in [-1, 1]."""
+    if pcm_format not in PCM_FORMATS:
+        raise ValueError(f"Unsupported PCM format '{pcm_format}', expected one of {sorted(PCM_FORMATS)}")
+    if not sample_rate or int(sample_rate) <= 0:
+        raise ValueError("Sample rate is required for raw PCM audio")
+    dtype = PCM_FORMATS[pcm_format]
+    frame_bytes = dtype.itemsize * channels
+    if len(data) % frame_bytes:
+        raise ValueError(f"PCM payload of {len(data)} bytes is not a multiple of {frame_bytes}-byte frames")
+
+    audio = np.frombuffer(data, dtype=dtype)
+    if dtype.kind == "i":
+        audio = audio.astype(np.float32) / 32768.0
+    else:
+        audio = audio.astype(np.float32)
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    return audio
+
+
+def decode_audio_bytes(data: bytes, filename: str = None) -> tuple:
+    """Decodes an encoded audio file held in memory, returns (float32 mono audio, sample rate).
+
+    WAV, FLAC, OGG and the other libsndfile formats are decoded from the buffer directly;
+    anything libsndfile cannot read (e.g. MP3/M4A on older builds) falls back to a temporary
+    file read by librosa.
+    """
+    try:
+        audio, sr = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+        return audio.mean(axis=1) if audio.shape[1] > 1 else audio[:, 0], sr
+    except RuntimeError:
+        pass
+
+    suffix = os.path.splitext(filename or "")[1]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(data)
+    try:
+        audio, sr = librosa.load(tmp.name, sr=None)
+    finally:
+        os.remove(tmp.name)
+    return audio, sr
+
+
+def load_audio(data: bytes, target_sr: int = 16000, pcm_format: str = None, sample_rate: int = None,
+               filename: str = None) -> tuple:
+    """Decodes uploaded audio bytes into float32 mono audio at ``target_sr``.
+
+    With ``pcm_format`` ("s16le" / "f32le") the payload is treated as raw PCM recorded at
+    ``sample_rate``; otherwise it is decoded as an audio file. Returns (audio, target_sr).
+    """
+    if pcm_format:
+        audio, sr = decode_pcm(data, sample_rate, pcm_format), int(sample_rate)
+    else:
+        audio, sr = decode_audio_bytes(data, filename)
+    if audio.size == 0:
+        raise ValueError("Audio is empty")
+    if sr != target_sr:
+        audio = librosa.resample(audio, orig_sr=sr, target_sr=target_sr)
+    return audio, target_sr
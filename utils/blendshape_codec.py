@@ -0,0 +1,65 @@
+"""
+Compact binary encoding of blendshape animations.
+
+A payload is a fixed little-endian header followed by the (N, C) weight matrix in
+row-major order:
+
+    magic        4s   b"A2EB"
+    version      u8   1
+    dtype        u8   0 = float32, 1 = float16, 2 = uint8 (weight * 255, rounded)
+    channels     u16  blendshapes per frame (52)
+    frame_count  u32
+    fps          f32
+    start_time   f32  time of the first frame in seconds
+    chunk_index  u32  streaming chunk index, 0 for complete clips
+"""
+
+import struct
+
+import numpy as np
+
+
+MEDIA_TYPE = "application/x-blendshape"
+MAGIC = b"A2EB"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHIffI")
+
+DTYPES = {
+    "f32": (0, np.dtype("<f4")),
+    "f16": (1, np.dtype("<f2")),
+    "u8": (2, np.dtype("u1")),
+}
+_DTYPE_NAMES = {code: name for name, (code, _) in DTYPES.items()}
+
+
+def encode_blendshapes(blendshapes, dtype="f32", fps=30.0, start_time=0.0, chunk_index=0) -> bytes:
+    """Packs a (N, C) blendshape array into a header + raw weights payload."""
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported blendshape dtype '{dtype}', expected one of {sorted(DTYPES)}")
+    code, np_dtype = DTYPES[dtype]
+    blendshapes = np.asarray(blendshapes)
+    if blendshapes.ndim != 2:
+        raise ValueError(f"Expected a (frames, channels) array, got shape {blendshapes.shape}")
+
+    if np_dtype.kind == "u":
+        weights = np.rint(np.clip(blendshapes, 0.0, 1.0) * 255).astype(np_dtype)
+    else:
+        weights = np.ascontiguousarray(blendshapes, dtype=np_dtype)
+    header = HEADER.pack(MAGIC, VERSION, code, blendshapes.shape[1], blendshapes.shape[0],
+                         fps, start_time, chunk_index)
+    return header + weights.tobytes()
+
+
+def decode_blendshapes(data: bytes) -> tuple:
+    """Inverse of :func:`encode_blendshapes`, returns (header dict, float32 (N, C) array)."""
+    magic, version, code, channels, frame_count, fps, start_time, chunk_index = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a blendshape payload")
+    dtype = _DTYPE_NAMES[code]
+    weights = np.frombuffer(data, dtype=DTYPES[dtype][1], count=frame_count * channels, offset=HEADER.size)
+    weights = weights.reshape(frame_count, channels).astype(np.float32)
+    if dtype == "u8":
+        weights /= 255
+    header = dict(dtype=dtype, fps=fps, start_time=start_time, chunk_index=chunk_index,
+                  frame_count=frame_count, channels=channels)
+    return header, weights
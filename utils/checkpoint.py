@@ -0,0 +1,75 @@
+"""
+Model weights of the training checkpoints (pickled ``.tar`` / ``.pth`` holding a "state_dict")
+and of their safetensors conversion.
+
+A ``.safetensors`` file is memory-mapped on load: its tensors are copy-on-write views of
+the page cache instead of unpickled copies, so worker processes serving the same file share
+one physical copy of the weights, and InferBase.build_model (with ``fast_init``) assigns them
+to the model without copying. Convert a checkpoint with
+
+    python -m utils.checkpoint pretrained_models/lam_audio2exp_streaming.tar
+"""
+
+import os
+import argparse
+from collections import OrderedDict
+
+import torch
+
+SAFETENSORS_SUFFIX = ".safetensors"
+
+
+def normalize_state_dict(state_dict: dict) -> OrderedDict:
+    """Strips the "module." prefix of DDP-wrapped models, tensors are not copied."""
+    return OrderedDict((key[7:] if key.startswith("module.") else key, value)  # module.xxx.xxx -> xxx.xxx
+                       for key, value in state_dict.items())
+
+
+def load_weights(path: str) -> OrderedDict:
+    """Prefix-normalized state dict of a checkpoint on the CPU, memory-mapped for .safetensors files."""
+    if path.endswith(SAFETENSORS_SUFFIX):
+        from safetensors.torch import load_file
+
+        return normalize_state_dict(load_file(path, device="cpu"))
+    checkpoint = torch.load(path, map_location="cpu")
+    return normalize_state_dict(checkpoint["state_dict"])
+
+
+def convert_checkpoint(src: str, dst: str = None) -> str:
+    """Writes the weights of checkpoint ``src`` to a safetensors file, next to it by default.
+
+    Keys are prefix-normalized and tensors stored contiguous; optimizer and scheduler
+    states of training checkpoints are dropped. Returns the path written.
+    """
+    from safetensors.torch import save_file
+
+    dst = dst or os.path.splitext(src)[0] + SAFETENSORS_SUFFIX
+    # safetensors stores every tensor on its own, views and shared storages get their own copy
+    weights = {key: value.detach().cpu().contiguous().clone() for key, value in load_weights(src).items()}
+    save_file(weights, dst, metadata=dict(format="pt", source=os.path.basename(src)))
+    return dst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="convert a checkpoint to memory-mapped safetensors")
+    parser.add_argument("src", help="checkpoint with a 'state_dict' (.tar / .pth)")
+    parser.add_argument("dst", nargs="?", default=None, help="output, <src>.safetensors by default")
+    args = parser.parse_args()
+    if not os.path.isfile(args.src):
+        parser.error(f"no checkpoint at {args.src}")
+    if args.src.endswith(SAFETENSORS_SUFFIX):
+        parser.error(f"{args.src} is already a safetensors file")
+    if args.dst and not args.dst.endswith(SAFETENSORS_SUFFIX):
+        parser.error(f"dst must end with {SAFETENSORS_SUFFIX}, load_weights picks the format by suffix")
+
+    dst = convert_checkpoint(args.src, args.dst)
+    reference, converted = load_weights(args.src), load_weights(dst)
+    if reference.keys() != converted.keys():
+        parser.error(f"keys of {dst} differ from {args.src}")
+    if not all(torch.equal(reference[key], converted[key]) for key in reference):
+        parser.error(f"weights of {dst} differ from {args.src}")
+    print(f"{args.src} -> {dst} ({len(converted)} tensors, {os.path.getsize(dst) / 2 ** 20:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
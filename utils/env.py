@@ -31,3 +31,13 @@ def set_seed(seed=None):
     cudnn.benchmark = False
     cudnn.deterministic = True
     os.environ["PYTHONHASHSEED"] = str(seed)
+
+
+def get_device(device="auto"):
+    """Resolve an inference device spec ("auto", "cpu", "cuda", "cuda:N")."""
+    if device is None or device == "auto":
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    device = torch.device(device)
+    if device.type == "cuda" and not torch.cuda.is_available():
+        raise RuntimeError(f"Device '{device}' requested but CUDA is not available")
+    return device
@@ -0,0 +1,146 @@
+"""
+Content-addressed cache of inference results: an in-memory LRU tier bounded by bytes
+and an optional on-disk tier with one memory-mapped .npy file per entry.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+
+def content_key(audio: np.ndarray, **params) -> str:
+    """Hashes decoded PCM together with every parameter that changes the result.
+
+    ``params`` must be JSON serializable (sequences, dicts and scalars); keys are sorted,
+    so the argument order does not matter.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    audio = np.ascontiguousarray(audio)
+    digest.update(f"{audio.dtype.str}:{audio.shape}".encode())
+    digest.update(memoryview(audio).cast("B"))
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def module_digest(module) -> str:
+    """Hash of a torch module's parameters and buffers, identifying the loaded weights."""
+    import torch
+
+    def update(digest, name, value):
+        # quantized layers keep packed weights as (weight, bias) tuples and dtypes in their state_dict
+        if isinstance(value, (tuple, list)):
+            for i, item in enumerate(value):
+                update(digest, f"{name}.{i}", item)
+        elif isinstance(value, torch.Tensor):
+            tensor = (value.dequantize() if value.is_quantized else value).detach().cpu().contiguous()
+            digest.update(f"{name}:{value.dtype}:{tuple(tensor.shape)}".encode())
+            digest.update(tensor.reshape(-1).view(torch.uint8).numpy())
+        else:
+            digest.update(f"{name}:{value}".encode())
+
+    digest = hashlib.blake2b(digest_size=20)
+    for name, value in module.state_dict().items():
+        update(digest, name, value)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Thread-safe two-tier cache of NumPy arrays keyed by :func:`content_key`.
+
+    The memory tier keeps the most recently used entries up to ``max_bytes``. With
+    ``disk_dir`` every entry is also written to ``<disk_dir>/<key>.npy`` and survives
+    eviction and restarts; a disk hit is memory-mapped read-only and promoted to the
+    memory tier. Cached arrays are read-only, callers copy before modifying them.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 2 ** 20, disk_dir: Optional[str] = None):
+        self.max_bytes = max(int(max_bytes), 0)
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = dict(hits=0, misses=0, memory_hits=0, disk_hits=0, evictions=0)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                self._stats["memory_hits"] += 1
+                return value
+        value = self._load(key)
+        with self._lock:
+            if value is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._stats["disk_hits"] += 1
+            self._insert(key, value)
+        return value
+
+    def put(self, key: str, value: np.ndarray) -> np.ndarray:
+        """Stores a copy of ``value`` and returns it (read-only)."""
+        value = np.array(value, copy=True)
+        value.flags.writeable = False
+        if self.disk_dir:
+            self._store(key, value)
+        with self._lock:
+            self._insert(key, value)
+        return value
+
+    def clear(self) -> None:
+        """Drops the memory tier; files of the disk tier are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes,
+                         disk=bool(self.disk_dir))
+        return stats
+
+    def _insert(self, key, value):
+        if value.nbytes > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.nbytes
+        self._entries[key] = value
+        self._bytes += value.nbytes
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self._stats["evictions"] += 1
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.npy")
+
+    def _load(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            return np.load(self._path(key), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key, value):
+        # write to a temporary file first so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, value)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)